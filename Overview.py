@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 import sqlite3
+import time
 import plotly.express as px
 from datetime import datetime
 
@@ -65,24 +66,40 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 # --- Database Connection ---
-def load_data():
+# Window -> (seconds, vehicle_rollups bucket size in seconds)
+WINDOWS = {"Last hour": (3600, 5), "Last 24 hours": (86400, 60), "Last 7 days": (7 * 86400, 3600),
+           "All time": (None, 3600)}
+window = st.sidebar.selectbox("Time window", list(WINDOWS), index=1)
+
+def load_data(seconds, resolution_s):
     # Ensure this path matches your SecuritySystem db_path
     conn = sqlite3.connect('logs_/traffic_security.db')
-    df = pd.read_sql_query("SELECT * FROM vehicle_logs", conn)
+    # Counters kept up to date by the logger (vehicle_rollups): the cost follows the window, not the history
+    since = 0 if seconds is None else int((time.time() - seconds) * 1000)
+    params = (resolution_s, since - since % (resolution_s * 1000))
+    time_data = pd.read_sql_query("SELECT datetime(bucket_ms / 1000, 'unixepoch', 'localtime') AS timestamp, "
+                                  "SUM(count) AS count FROM vehicle_rollups "
+                                  "WHERE resolution_s = ? AND bucket_ms >= ? GROUP BY bucket_ms", conn, params=params)
+    totals = pd.read_sql_query("SELECT COALESCE(SUM(count), 0) AS total, "
+                               "COALESCE(SUM(count * is_suspicious), 0) AS suspicious FROM vehicle_rollups "
+                               "WHERE resolution_s = ? AND bucket_ms >= ?", conn, params=params)
+    color_counts = pd.read_sql_query("SELECT color, SUM(count) AS count FROM vehicle_rollups "
+                                     "WHERE resolution_s = ? AND bucket_ms >= ? GROUP BY color ORDER BY count DESC",
+                                     conn, params=params)
     # Convert timestamp to datetime objects for plotting
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    time_data['timestamp'] = pd.to_datetime(time_data['timestamp'])
     conn.close()
-    return df
+    return time_data, totals.iloc[0], color_counts
 
 try:
-    df = load_data()
+    time_data, totals, color_counts = load_data(*WINDOWS[window])
 except Exception as e:
     st.error(f"Could not connect to database: {e}")
     st.stop()
 
 # --- Top Level Metrics ---
-total_v = len(df)
-suspicious_v = len(df[df['is_suspicious'] == 1])
+total_v = int(totals['total'])
+suspicious_v = int(totals['suspicious'])
 hazard_rate = (suspicious_v / total_v * 100) if total_v > 0 else 0
 
 m1, m2, m3 = st.columns(3)
@@ -97,12 +114,11 @@ col_left, col_right = st.columns(2)
 
 with col_left:
     st.subheader("Traffic Volume Over Time")
-    # Resample to count vehicles per minute/hour
-    time_data = df.resample('5s', on='timestamp').count().reset_index()
+    # Vehicles per 5 s / minute / hour bucket, depending on the window
     fig = px.bar(time_data,
                  x='timestamp',
-                 y='id',
-                 color='id',
+                 y='count',
+                 color='count',
                  color_continuous_scale=px.colors.sequential.Sunsetdark,  # Vibrant Saffron/Purple/Blue
                  title="Traffic Density Analysis",
                  template="presentation")
@@ -112,7 +128,6 @@ with col_left:
 
 with col_right:
     st.subheader("Detected Vehicle Colors")
-    color_counts = df['color'].value_counts().reset_index()
     # Use actual colors for the pie chart slices!
     fig_pie = px.pie(color_counts, names='color', values='count',
                      template="plotly_dark",
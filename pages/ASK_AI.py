@@ -1,9 +1,8 @@
 import streamlit as st
-import pandas as pd
-import sqlite3
-from langchain_experimental.agents import create_pandas_dataframe_agent
 from langchain_groq import ChatGroq
 import os
+import re
+import sys
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -67,69 +66,83 @@ st.title('ASK AI')
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 db_path = os.path.join(project_root, "logs_", "traffic_security.db")
-
-def load_data():
-    # Ensure this path matches your SecuritySystem db_path
-    conn = sqlite3.connect(db_path)
-    df = pd.read_sql_query("SELECT * FROM vehicle_logs", conn)
-    # Convert timestamp to datetime objects for plotting
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    conn.close()
-    return df
-
-try:
-    df = load_data()
-except Exception as e:
-    st.error(f"Could not connect to database: {e}")
-    st.stop()
-
-agent = None
-
-if df is not None:
-    st.write("Provide a concise and helpful prompt for suitable insights...")
-    question = st.text_input("Enter your question")
-
-    @st.cache_resource
-    def create_agent(df):
-            prefix = """
-            You are a traffic data expert. You are working with a pandas dataframe named `df`.
-            The columns are: timestamp, vehicle_id, type, color, is_suspicious, and s3_key.
-            If the user asks for a count, use the vehicle_id column. 
-            Always provide a concise and helpful answer.
-            """
-
-            llm = ChatGroq(
-                temperature=0,
-                model_name="llama-3.3-70b-versatile",
-                groq_api_key=st.secrets["GROQ_API_KEY"]
-            )
-            return create_pandas_dataframe_agent(
-                llm,
-                df,
-                verbose=True,
-                allow_dangerous_code=True,
-                prefix=prefix,  # Helping the AI understand the context
-                handle_parsing_errors=True
-            )
-
-
-    if question:
-        agent = create_agent(df)
-
-        with st.spinner('🔍 Analyzing traffic logs...'):
-            try:
-
-                response = agent.invoke(question)
-
-                st.write("### Answer:")
-
-                # Extract the output
-                if isinstance(response, dict):
-                    output_text = response.get("output", "I couldn't find an answer.")
-                    st.success(output_text)
-                else:
-                    st.success(str(response))
-            except Exception as e:
-                # Better debugging for you
-                st.error("Check the API key")
-                st.write(e)
\ No newline at end of file
+archive_dir = os.path.join(project_root, "logs_", "archive")
+
+# The hot SQLite rows and the Parquet archive, queried together (security-system/log_archive.py)
+sys.path.insert(0, os.path.join(project_root, "security-system"))
+from log_archive import duckdb_available, query_logs
+
+# Without duckdb the queries run on SQLite, over the days not archived yet
+DIALECT = "DuckDB" if duckdb_available() else "SQLite"
+if DIALECT == "SQLite":
+    st.caption("Only the last days kept in SQLite are searched: install duckdb to include the archive.")
+# In DuckDB a filter on `day` skips the archived days outside it instead of reading them all
+DAY_HINT = ("vehicle_logs, vehicle_tracks and zone_counts also have day VARCHAR 'YYYY-MM-DD' (local): "
+            "filter on it for any date range." if DIALECT == "DuckDB" else "")
+
+SCHEMA = """
+vehicle_logs(timestamp VARCHAR 'YYYY-MM-DD HH:MM:SS' local time, ts_ms BIGINT epoch milliseconds, vehicle_id,
+             camera_id, type, color, confidence DOUBLE, is_suspicious 0/1, hazard_type, s3_key)
+vehicle_tracks(stream, vehicle_id, type, color, first_seen VARCHAR, last_seen VARCHAR, frames, is_suspicious,
+               hazard_type)
+zone_counts(stream, zone, event 'forward'/'backward'/'enter'/'exit', type, count, period_start VARCHAR,
+            period_end VARCHAR)
+vehicle_rollups(resolution_s 5/60/3600, bucket_ms BIGINT epoch milliseconds, camera_id, type, color,
+                is_suspicious, count) -- vehicles logged per bucket, use it for counts over long periods
+"""
+MAX_ROWS = 200
+
+@st.cache_resource
+def create_llm():
+    return ChatGroq(
+        temperature=0,
+        model_name="llama-3.3-70b-versatile",
+        groq_api_key=st.secrets["GROQ_API_KEY"]
+    )
+
+def write_query(llm, question):
+    """The question as one SELECT over the log tables, in the SQL dialect of query_logs."""
+    prompt = f"""
+    You are a traffic data expert. Write one {DIALECT} SQL SELECT query that answers the question below.
+    The tables, spanning months of traffic logs, are:
+    {SCHEMA}
+    {DAY_HINT}
+    If the user asks for a count of vehicles, count vehicle_logs rows or sum vehicle_rollups.count.
+    Reply with the SQL only, no explanation.
+
+    Question: {question}
+    """
+    sql = llm.invoke(prompt).content.strip()
+    sql = re.sub(r"^```(sql)?|```$", "", sql, flags=re.IGNORECASE).strip().rstrip(";")
+    if not re.match(r"(?is)^\s*(select|with)\b", sql) or ";" in sql:
+        raise ValueError(f"Not a single SELECT query: {sql}")
+    return sql
+
+st.write("Provide a concise and helpful prompt for suitable insights...")
+question = st.text_input("Enter your question")
+
+if question:
+    llm = create_llm()
+
+    with st.spinner('🔍 Analyzing traffic logs...'):
+        try:
+            # The database filters and aggregates the logs; only the answer's rows reach pandas
+            sql = write_query(llm, question)
+            result = query_logs(db_path, archive_dir, f"SELECT * FROM ({sql}) LIMIT {MAX_ROWS}")
+            response = llm.invoke(f"""
+            You are a traffic data expert. Answer the question concisely from the result of the query.
+            Question: {question}
+            Query: {sql}
+            Result (CSV, at most {MAX_ROWS} rows):
+            {result.to_csv(index=False)}
+            """)
+
+            st.write("### Answer:")
+            st.success(response.content)
+            with st.expander("Query and result"):
+                st.code(sql, language="sql")
+                st.dataframe(result, width='stretch', hide_index=True)
+        except Exception as e:
+            # Better debugging for you
+            st.error("Could not answer, check the API key and the question")
+            st.write(e)
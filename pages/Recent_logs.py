@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
 import os
+import sys
 
 st.markdown("""
     <style>
@@ -60,39 +60,37 @@ st.markdown("""
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 db_path = os.path.join(project_root, "logs_", "traffic_security.db")
+archive_dir = os.path.join(project_root, "logs_", "archive")
+
+# The hot SQLite rows and the Parquet archive, queried together (security-system/log_archive.py)
+sys.path.insert(0, os.path.join(project_root, "security-system"))
+from log_archive import duckdb_available, newest_logs
+
+st.set_page_config(page_title="NetraFlow", page_icon="👁",layout="wide")
+# --- Filtered Data Table ---
+st.subheader("Recent Security Logs")
+search_query = st.text_input("Search by Type or Color (e.g., 'red truck')")
+if not duckdb_available():
+    st.caption("Only the last days kept in SQLite are shown: install duckdb to include the archive.")
 
 # --- Database Connection ---
-def load_data():
-    # Ensure this path matches your SecuritySystem db_path
-    conn = sqlite3.connect(db_path)
-    df = pd.read_sql_query("SELECT * FROM vehicle_logs", conn)
+def load_data(keywords, limit=1000):
+    # Every keyword must match the type or the color; the newest matches, archived days only read if needed
+    where = " AND ".join("(lower(type) LIKE ? OR lower(color) LIKE ?)" for _ in keywords) or "TRUE"
+    params = [f"%{word}%" for word in keywords for _ in range(2)]
+    df = newest_logs(db_path, archive_dir,
+                     "timestamp, vehicle_id, camera_id, type, color, is_suspicious, hazard_type", where, params, limit)
     # Convert timestamp to datetime objects for plotting
     df['timestamp'] = pd.to_datetime(df['timestamp'])
-    conn.close()
     return df
 
 try:
-    df = load_data()
+    display_df = load_data(search_query.lower().split())
 except Exception as e:
     st.error(f"Could not connect to database: {e}")
     st.stop()
 
-st.set_page_config(page_title="NetraFlow", page_icon="👁",layout="wide")
-# --- Filtered Data Table ---
-st.subheader("Recent Security Logs")
-search_query = st.text_input("Search by Type or Color (e.g., 'red truck')")
-
-display_df = df.sort_values(by='timestamp', ascending=False)
-if search_query:
-    keywords = search_query.lower().split()
-    mask = display_df.apply(lambda row: all(
-        word in str(row['type']).lower() or word in str(row['color']).lower()
-        for word in keywords
-    ), axis=1)
-
-    display_df = display_df[mask]
-
-st.dataframe(display_df[['timestamp', 'vehicle_id', 'type', 'color', 'is_suspicious']],
+st.dataframe(display_df[['timestamp', 'camera_id', 'vehicle_id', 'type', 'color', 'is_suspicious', 'hazard_type']],
              width='stretch',
              hide_index=True,
-             )
\ No newline at end of file
+             )
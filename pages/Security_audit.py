@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
 import os
+import sys
 
 st.subheader("🖼️ Object Vault")
 st.markdown("""
@@ -63,11 +63,28 @@ st.set_page_config(page_title="NetraFlow", page_icon="👁",layout="wide")
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 db_path = os.path.join(project_root, "logs_", "traffic_security.db")
+archive_dir = os.path.join(project_root, "logs_", "archive")
 
-# 1. Fetch data
-conn = sqlite3.connect(db_path)
-df = pd.read_sql_query("SELECT * FROM vehicle_logs WHERE is_suspicious = 1", conn)
-conn.close()
+# The hot SQLite rows and the Parquet archive, queried together (security-system/log_archive.py)
+sys.path.insert(0, os.path.join(project_root, "security-system"))
+from log_archive import alert_count, duckdb_available, newest_logs
+
+if not duckdb_available():
+    st.caption("Only the last days kept in SQLite are shown: install duckdb to include the archive.")
+
+# 1. Fetch data, one page of alerts at a time, archived days included
+PAGE_SIZE = 60
+try:
+    # Counted from the hourly rollups and paged through idx_vehicle_logs_alerts, then the newest archived days
+    total = alert_count(db_path, archive_dir)
+    pages = max(1, -(-total // PAGE_SIZE))
+    page = st.number_input(f"Page (of {pages}, {total} alerts, newest first)", min_value=1, max_value=pages,
+                           value=1)
+    df = newest_logs(db_path, archive_dir, "timestamp, vehicle_id, type, color, s3_key", "is_suspicious = 1",
+                     limit=PAGE_SIZE, offset=(page - 1) * PAGE_SIZE)
+except Exception as e:
+    st.error(f"Could not connect to database: {e}")
+    st.stop()
 
 # 2. Check if data exists BEFORE defining columns
 if df.empty:
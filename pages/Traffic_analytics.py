@@ -2,6 +2,7 @@ import plotly.express as px
 import streamlit as st
 import pandas as pd
 import sqlite3
+import time
 import os
 
 st.markdown("""
@@ -64,29 +65,39 @@ project_root = os.path.dirname(current_dir)
 db_path = os.path.join(project_root, "logs_", "traffic_security.db")
 
 # ... (data loading logic) ...
-def load_data():
+# Window -> (seconds, vehicle_rollups bucket size in seconds)
+WINDOWS = {"Last hour": (3600, 5), "Last 24 hours": (86400, 60), "Last 7 days": (7 * 86400, 3600),
+           "All time": (None, 3600)}
+BUCKET_LABELS = {5: "5s", 60: "minute", 3600: "hour"}
+window = st.sidebar.selectbox("Time window", list(WINDOWS), index=0)
+
+def load_data(seconds, resolution_s):
     # Ensure this path matches your SecuritySystem db_path
     conn = sqlite3.connect(db_path)
-    df = pd.read_sql_query("SELECT * FROM vehicle_logs", conn)
+    # Counters kept up to date by the logger (vehicle_rollups): the cost follows the window, not the history
+    since = 0 if seconds is None else int((time.time() - seconds) * 1000)
+    df = pd.read_sql_query("SELECT datetime(bucket_ms / 1000, 'unixepoch', 'localtime') AS timestamp, "
+                           "SUM(count) AS count FROM vehicle_rollups "
+                           "WHERE resolution_s = ? AND bucket_ms >= ? GROUP BY bucket_ms", conn,
+                           params=(resolution_s, since - since % (resolution_s * 1000)))
     # Convert timestamp to datetime objects for plotting
     df['timestamp'] = pd.to_datetime(df['timestamp'])
     conn.close()
     return df
 
+seconds, resolution_s = WINDOWS[window]
 try:
-    df = load_data()
+    type_counts = load_data(seconds, resolution_s)
 except Exception as e:
     st.error(f"Could not connect to database: {e}")
     st.stop()
 
-
-st.subheader("📊 Traffic Distribution by 5s")
+st.subheader(f"📊 Traffic Distribution by {BUCKET_LABELS[resolution_s]}")
 # Creating a dummy column for colors to make it vibrant
-type_counts = df.resample('5s', on='timestamp').count().reset_index()
 fig_bar = px.bar(type_counts,
                  x='timestamp',
-                 y='id',
-                 color='id', # Color gradient based on value
+                 y='count',
+                 color='count', # Color gradient based on value
                  color_continuous_scale=px.colors.sequential.Tealgrn,
                  template="plotly_white", # Force light theme
                  text_auto=True)
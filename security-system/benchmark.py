@@ -0,0 +1,469 @@
+"""
+Stage-level benchmark for the detection pipeline.
+
+Runs the shipped CameraPipeline (its decode/detect/track threads, the color batcher and the DB writer) over a
+synthetic traffic video and reports throughput and p50/p95/p99 latency of decode, mask, detect, track,
+tripwires/zones, re-ID, color classification, DB log, upload enqueue, behavior analysis, draw and HUD. The
+latencies are those the pipeline itself records in its metrics histograms, so a change to the pipeline is measured
+without touching this file. S3 is replaced by an in-memory queue.
+Stub models are used by default so the numbers only move when our code does; --real-models loads the YOLO weights.
+
+    python benchmark.py --out bench.json
+    python benchmark.py --baseline bench_baseline.json            # exits 1 on a regression
+    python benchmark.py --baseline bench_baseline.json --update-baseline
+    python benchmark.py --association 50,200,500                 # dense vs gated SORT association, per solver
+    python benchmark.py --behavior 50,200,1000                   # per-vehicle vs per-frame behavior analysis
+"""
+import argparse
+import json
+import os
+import platform
+import queue
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from camera import CameraPipeline, SharedModels, classNames, colorNames
+from color_batcher import ColorBatcher
+from metrics import REGISTRY
+from pipeline import BLOCK, END_OF_STREAM
+from security import SecuritySystem
+from hazard_rules import load_rules
+from vehicle_store import TRAJECTORY_LEN, VehicleStore
+import sort
+from sort import TRACKERS
+
+STAGES = ("decode", "mask", "detect", "track", "zones", "reid", "color", "db_log", "upload_enqueue", "behavior", "draw",
+          "hud")
+
+# BGR colors of the synthetic vehicles and the colorNames entry the stub classifier maps them to
+SYNTHETIC_COLORS = [((0, 0, 220), 'red'), ((220, 60, 0), 'blue'), ((0, 200, 0), 'green'),
+                    ((0, 140, 255), 'orange'), ((0, 230, 230), 'yellow')]
+
+
+def make_synthetic_video(path, frames=300, width=1280, height=720, vehicles=12, fps=30, seed=0):
+    """Writes a video of colored boxes driving down a gray road and returns the counting line used for it."""
+    rng = np.random.default_rng(seed)
+    background = np.full((height, width, 3), 70, np.uint8)
+    for x in range(width // 6, width, width // 6):
+        cv2.line(background, (x, 0), (x, height), (200, 200, 200), 2)
+
+    lane_w = width // 6
+    cars = []
+    for i in range(vehicles):
+        w, h = int(rng.integers(60, 110)), int(rng.integers(90, 160))
+        cars.append({
+            "x": int((i % 6) * lane_w + (lane_w - w) // 2),
+            "y0": float(rng.uniform(-height, height)),
+            "speed": float(rng.uniform(3, 12)),
+            "w": w, "h": h,
+            "color": SYNTHETIC_COLORS[i % len(SYNTHETIC_COLORS)][0],
+        })
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    for f in range(frames):
+        image = background.copy()
+        for car in cars:
+            y = int((car["y0"] + car["speed"] * f) % (height + 200)) - 200
+            cv2.rectangle(image, (car["x"], y), (car["x"] + car["w"], y + car["h"]), car["color"], -1)
+        writer.write(image)
+    writer.release()
+    return [0, int(height * 0.55), width, int(height * 0.55)]
+
+
+def make_synthetic_mask(path, width=1280, height=720):
+    mask = np.zeros((height, width, 3), np.uint8)
+    mask[int(height * 0.2):int(height * 0.9)] = 255
+    cv2.imwrite(path, mask)
+
+
+class _Tensor:
+    """Mimics the torch tensors of ultralytics results: .cpu().numpy() and indexing."""
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=float)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+
+class _Boxes:
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = _Tensor(np.reshape(xyxy, (-1, 4)))
+        self.conf = _Tensor(conf)
+        self.cls = _Tensor(cls)
+
+    def __len__(self):
+        return len(self.conf.values)
+
+
+class _Result:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+class StubModels:
+    """
+    Stand-in for SharedModels without torch: a saturation-blob detector and a hue-based color classifier.
+    Cheap but real image work, so it stays proportional to frame size and vehicle count. Crops are batched and
+    routed back to their pipeline by a ColorBatcher, as in SharedModels.
+    """
+    def __init__(self, color_batch_size=8, color_batch_ms=50):
+        self.color_batcher = ColorBatcher(self.classify_colors, SharedModels._route_color_result,
+                                          batch_size=color_batch_size, max_wait_ms=color_batch_ms,
+                                          on_error=SharedModels._route_color_error)
+        self.color_batcher.start()
+
+    def wait_ready(self, timeout=None):
+        return True
+
+    def detect(self, images, **kwargs):
+        if not isinstance(images, list):
+            images = [images]
+        results = []
+        for image in images:
+            saturation = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)[:, :, 1]
+            contours, _ = cv2.findContours((saturation > 80).astype(np.uint8), cv2.RETR_EXTERNAL,
+                                           cv2.CHAIN_APPROX_SIMPLE)
+            boxes = [cv2.boundingRect(c) for c in contours]
+            boxes = [(x, y, x + w, y + h) for x, y, w, h in boxes if w * h >= 400]
+            results.append(_Result(_Boxes(boxes, [0.9] * len(boxes), [classNames.index("car")] * len(boxes))))
+        return results
+
+    def classify_colors(self, crops, **kwargs):
+        results = []
+        for crop in crops:
+            hsv = cv2.cvtColor(crop, cv2.COLOR_BGR2HSV).reshape(-1, 3)
+            saturated = hsv[hsv[:, 1] > 80]
+            if len(saturated) == 0:
+                results.append(_Result(_Boxes([], [], [])))
+                continue
+            hue = np.median(saturated[:, 0])
+            name = 'red' if hue < 8 or hue > 170 else 'orange' if hue < 20 else 'yellow' if hue < 35 \
+                else 'green' if hue < 85 else 'blue'
+            results.append(_Result(_Boxes([[0, 0, crop.shape[1], crop.shape[0]]], [0.9], [colorNames.index(name)])))
+        return results
+
+    def close(self):
+        self.color_batcher.close()
+
+
+def percentile_summary(samples_ms):
+    if not samples_ms:
+        return {"count": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "total_s": 0.0}
+    a = np.asarray(samples_ms)
+    p50, p95, p99 = np.percentile(a, [50, 95, 99])
+    return {"count": len(a), "mean_ms": float(a.mean()), "p50_ms": float(p50), "p95_ms": float(p95),
+            "p99_ms": float(p99), "total_s": float(a.sum() / 1000)}
+
+
+def tap(histogram, samples):
+    """Keeps every value `histogram` observes in `samples` too: its buckets are too coarse for percentiles."""
+    observe = histogram.observe
+
+    def record(value):
+        samples.append(value)
+        observe(value)
+    histogram.observe = record
+
+
+def run_benchmark(args):
+    workdir = tempfile.mkdtemp(prefix="netraflow-bench-")
+    try:
+        video = os.path.join(workdir, "synthetic.mp4")
+        mask = os.path.join(workdir, "mask.png")
+        limit = make_synthetic_video(video, args.frames, args.width, args.height, args.vehicles, seed=args.seed)
+        make_synthetic_mask(mask, args.width, args.height)
+
+        models = SharedModels() if args.real_models else StubModels()
+        models.wait_ready()  # model loading and warm-up are not part of the measurement
+        security = SecuritySystem(blacklist_path='../logs_/blacklist.csv', db_path=os.path.join(workdir, "bench.db"))
+        uploads = queue.Queue()
+
+        def upload(crop_img, file_name):
+            uploads.put((crop_img, file_name))
+            security.s3_backlog.dec()
+        security.upload_evidence_direct = upload
+        # Every frame is processed, as for recorded footage
+        cam = CameraPipeline("bench", video, mask, models, security, limit=limit, roi_crop=not args.full_frame,
+                             policy=BLOCK, tracker=args.tracker)
+
+        samples = {stage: [] for stage in STAGES}
+        histograms = {
+            "decode": REGISTRY.histogram('stage_latency_ms', labels={"stream": cam.name, "stage": "decode"}),
+            "mask": cam.step_ms["mask"],
+            "detect": cam.step_ms["detector"],
+            "track": cam.step_ms["tracker"],
+            "zones": cam.step_ms["zones"],
+            "reid": cam.reid.query_ms,
+            "color": models.color_batcher.batch_ms,
+            "db_log": security.db_write_ms,
+            "upload_enqueue": security.s3_enqueue_ms,
+            "behavior": cam.behavior_ms,
+            "draw": cam.step_ms["draw"],
+        }
+        for stage, histogram in histograms.items():
+            tap(histogram, samples[stage])
+
+        started = time.perf_counter()
+        cam.start()
+        # The render loop of road-security.py: the HUD is drawn on every frame coming out of the pipeline
+        while True:
+            try:
+                packet = cam.output.get(timeout=0.1)
+            except queue.Empty:
+                if cam.stopped():
+                    break
+                continue
+            if packet is END_OF_STREAM:
+                break
+            start = time.perf_counter()
+            cam.draw_hud(packet["image"])
+            samples["hud"].append(1000 * (time.perf_counter() - start))
+        elapsed = time.perf_counter() - started
+        cam.join()
+        if cam.error is not None:
+            raise RuntimeError(f"Pipeline stage crashed: {cam.error}")
+        models.close()  # the last color batches still log vehicles
+        security.close()
+        frames = cam.frames
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "config": {"frames": args.frames, "width": args.width, "height": args.height, "vehicles": args.vehicles,
+                   "seed": args.seed, "models": "real" if args.real_models else "stub",
+                   "roi_crop": not args.full_frame, "tracker": args.tracker},
+        "environment": {"python": platform.python_version(), "machine": platform.machine(),
+                        "numpy": np.__version__, "opencv": cv2.__version__},
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "frames": frames,
+        "elapsed_s": elapsed,
+        "fps": frames / elapsed if elapsed > 0 else 0.0,
+        "logged": cam.logged,
+        "uploads": uploads.qsize(),
+        "reid_merges": cam.reid.merges.value if cam.reid is not None else 0,
+        "stages": {stage: percentile_summary(samples[stage]) for stage in STAGES},
+    }
+
+
+def make_highway_scene(n, rng, width=3840, lanes=8, lane_height=120):
+    """n detections spread over the lanes of a wide-angle highway frame, and the predicted boxes of last frame's
+    tracks: the same vehicles moved a few pixels, with 10% of them missed and 10% new."""
+    lane = rng.integers(0, lanes, n)
+    w = rng.uniform(60, 220, n)
+    h = rng.uniform(50, 110, n)
+    x1 = rng.uniform(0, width - 220, n)
+    y1 = 40 + lane * lane_height + rng.uniform(0, lane_height - h)
+    dets = np.stack((x1, y1, x1 + w, y1 + h, rng.uniform(0.3, 1.0, n)), axis=1)
+    trks = dets.copy()
+    trks[:, :4] += rng.normal(0, 6, (n, 4)) + np.repeat(rng.normal(0, 8, (n, 1)), 4, axis=1)
+    trks[:, 4] = 0
+    return dets[rng.random(n) > 0.1], trks[rng.random(n) > 0.1]
+
+
+def association_benchmark(counts, repeats=30, seed=0):
+    """Mean/p95 latency of the dense and gated SORT association for each assignment solver installed."""
+    solvers = [s for s in sort.SOLVERS if s != 'lap' or sort.lap is not None]
+    methods = {"dense": sort.associate_detections_to_trackers, "gated": sort.associate_gated}
+    rows = []
+    for n in counts:
+        rng = np.random.default_rng(seed)
+        scenes = [make_highway_scene(n, rng) for _ in range(repeats)]
+        for method, fn in methods.items():
+            for solver in solvers:
+                samples = []
+                for dets, trks in scenes:
+                    start = time.perf_counter()
+                    fn(dets, trks, 0.3, solver)
+                    samples.append(1000 * (time.perf_counter() - start))
+                stats = percentile_summary(samples)
+                rows.append({"boxes": n, "method": method, "solver": solver,
+                             "mean_ms": stats["mean_ms"], "p95_ms": stats["p95_ms"]})
+    return {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "lap_installed": sort.lap is not None,
+            "association": rows}
+
+
+def make_behavior_scene(n, rng, now, width=3840, height=2160, lane_width=120, fps=30):
+    """
+    A VehicleStore of n vehicles driving down the lanes of a wide-angle frame with a full trajectory each:
+    a tenth standing still since a few seconds ago, the rest moving at 5-30 px/frame, some of them bumper to
+    bumper, some weaving between lanes and some braking hard in the last frames.
+    """
+    steps = np.arange(TRAJECTORY_LEN)[::-1]  # frames before now, oldest first
+    x = 60 + rng.integers(0, width // lane_width, n) * lane_width
+    y = rng.uniform(0, height, n)
+    speed = np.where(rng.random(n) < 0.1, 0, rng.uniform(5, 30, n))
+    weave = np.where(rng.random(n) < 0.05, 12, 0)
+    brake = np.where((rng.random(n) < 0.05) & (speed > 0), 15, 0)
+    # Position k frames back: braking vehicles were `brake` px/frame faster until 3 frames ago
+    travelled = speed[:, None] * steps + brake[:, None] * np.maximum(steps - 3, 0)
+    xs = x[:, None] + weave[:, None] * np.where(steps // 3 % 2 == 0, 1, -1)
+    ys = y[:, None] - travelled
+    store = VehicleStore("bench-behavior")
+    rows = []
+    for i in range(n):
+        record = store.create(i, "car", now)
+        record.stall_start = now - rng.uniform(0, 6) if speed[i] == 0 else None
+        rows.append(record.row)
+    for k, step in enumerate(steps):
+        store.trajectories.append(rows, np.stack((xs[:, k], ys[:, k]), axis=1).astype(int), now - step / fps)
+    return store
+
+
+def behavior_benchmark(counts, repeats=30, seed=0, rules_path='hazard_rules.json'):
+    """
+    Mean/p95 latency of one frame of behavior analysis: analyze_behavior() per vehicle against
+    analyze_frame() with the default hazard rules (both run on copies of the same scenes and must flag the same
+    hazards) and with every rule of `rules_path` enabled, whose per-feature and per-rule cost is reported.
+    """
+    security = SecuritySystem(blacklist_path='../logs_/blacklist.csv', db_path=':memory:')
+    all_rules = [{**rule, "enabled": True, "streams": None} for rule in load_rules(rules_path)]
+    everything = SecuritySystem(blacklist_path='../logs_/blacklist.csv', db_path=':memory:', rules=all_rules)
+    methods = {
+        "per_vehicle": lambda records, now: [security.analyze_behavior(Id, r, now, records)
+                                             for Id, r in records.items()],
+        "per_frame": lambda records, now: security.analyze_frame(list(records.values()), now, records),
+        "all_rules": lambda records, now: everything.analyze_frame(list(records.values()), now, records),
+    }
+    rows, costs = [], {}
+    for n in counts:
+        now = time.time()
+        hazards = {}
+        for method, fn in methods.items():
+            rng = np.random.default_rng(seed)
+            scenes = [make_behavior_scene(n, rng, now) for _ in range(repeats)]
+            before = {name: (h.sum, h.count) for name, h in rule_histograms(everything.rules).items()}
+            samples = []
+            for records in scenes:
+                start = time.perf_counter()
+                fn(records, now)
+                samples.append(1000 * (time.perf_counter() - start))
+            hazards[method] = [[r.hazard_type for r in records.values()] for records in scenes]
+            stats = percentile_summary(samples)
+            rows.append({"vehicles": n, "method": method, "mean_ms": stats["mean_ms"], "p95_ms": stats["p95_ms"],
+                         "flagged": sum(h is not None for scene in hazards[method] for h in scene) / repeats})
+            if method == "all_rules":
+                costs[n] = {name: (h.sum - before.get(name, (0, 0))[0]) / max(h.count - before.get(name, (0, 0))[1], 1)
+                            for name, h in rule_histograms(everything.rules).items()}
+        if hazards["per_vehicle"] != hazards["per_frame"]:
+            raise AssertionError(f"per-frame behavior analysis disagrees with analyze_behavior at {n} vehicles")
+    return {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "behavior": rows, "rule_costs_ms": costs}
+
+
+def rule_histograms(engine):
+    """Latency histogram of every feature and rule of a RuleEngine, by display name."""
+    histograms = {f"feature {key}": h for key, h in engine.feature_ms.items()}
+    histograms.update({f"rule {rule.name}": rule.eval_ms for rule in engine.rules})
+    return histograms
+
+
+def compare(result, baseline, tolerance, min_ms=0.05, min_count=20):
+    """
+    Regressions of `result` against `baseline`: lower throughput or a slower p95 beyond the tolerance.
+    Stages with fewer than `min_count` samples are too noisy to gate on and are only reported.
+    """
+    regressions = []
+    if result["fps"] < baseline["fps"] * (1 - tolerance):
+        regressions.append(f"throughput {result['fps']:.1f} fps < baseline {baseline['fps']:.1f} fps")
+    for stage, stats in result["stages"].items():
+        base = baseline["stages"].get(stage)
+        if not base or min(base["count"], stats["count"]) < min_count:
+            continue
+        if stats["p95_ms"] > max(base["p95_ms"] * (1 + tolerance), base["p95_ms"] + min_ms):
+            regressions.append(f"{stage} p95 {stats['p95_ms']:.2f} ms > baseline {base['p95_ms']:.2f} ms")
+    return regressions
+
+
+def print_table(result, baseline=None):
+    print(f"{result['frames']} frames in {result['elapsed_s']:.2f}s = {result['fps']:.1f} fps "
+          f"({result['config']['models']} models), {result['logged']} vehicles logged, "
+          f"{result.get('reid_merges', 0)} re-ID merges")
+    print(f"{'stage':<15}{'count':>7}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'base p95':>10}")
+    for stage, s in result["stages"].items():
+        base = baseline["stages"].get(stage, {}).get("p95_ms") if baseline else None
+        base_txt = f"{base:10.2f}" if base is not None else f"{'-':>10}"
+        print(f"{stage:<15}{s['count']:>7}{s['mean_ms']:9.2f}{s['p50_ms']:9.2f}{s['p95_ms']:9.2f}{s['p99_ms']:9.2f}"
+              f"{base_txt}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='NetraFlow stage-level benchmark')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--vehicles', type=int, default=12)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--real-models', action='store_true', help='Use the YOLO weights instead of stub models')
+    parser.add_argument('--full-frame', action='store_true', help='Disable ROI cropping')
+    parser.add_argument('--tracker', choices=sorted(TRACKERS), default='vectorized', help='Tracker backend [vectorized]')
+    parser.add_argument('--out', help='Write the results as JSON')
+    parser.add_argument('--baseline', help='Baseline JSON to compare against')
+    parser.add_argument('--update-baseline', action='store_true', help='Overwrite the baseline with these results')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative slowdown [0.2]')
+    parser.add_argument('--association', help='Only benchmark SORT association at these box counts, e.g. 50,200,500')
+    parser.add_argument('--behavior', help='Only benchmark behavior analysis at these vehicle counts, e.g. 50,200')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.association:
+        result = association_benchmark([int(n) for n in args.association.split(',')])
+        if not result["lap_installed"]:
+            print("lap is not installed, only the scipy solver is timed")
+        print(f"{'boxes':>6} {'method':<7}{'solver':<7}{'mean':>9}{'p95':>9}")
+        for row in result["association"]:
+            print(f"{row['boxes']:>6} {row['method']:<7}{row['solver']:<7}{row['mean_ms']:9.2f}{row['p95_ms']:9.2f}")
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(result, f, indent=2)
+        sys.exit(0)
+    if args.behavior:
+        result = behavior_benchmark([int(n) for n in args.behavior.split(',')])
+        print(f"{'vehicles':>8} {'method':<12}{'mean':>9}{'p95':>9}{'flagged':>9}")
+        for row in result["behavior"]:
+            print(f"{row['vehicles']:>8} {row['method']:<12}{row['mean_ms']:9.2f}{row['p95_ms']:9.2f}"
+                  f"{row['flagged']:9.1f}")
+        for n, costs in result["rule_costs_ms"].items():
+            print(f"Hazard rule cost per frame at {n} vehicles (all rules enabled):")
+            for name, mean_ms in sorted(costs.items(), key=lambda item: -item[1]):
+                print(f"  {name:<48}{mean_ms:8.3f} ms")
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(result, f, indent=2)
+        sys.exit(0)
+
+    result = run_benchmark(args)
+
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_table(result, baseline)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.baseline and (args.update_baseline or baseline is None):
+        with open(args.baseline, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif baseline is not None:
+        if baseline.get("config") != result["config"]:
+            print("Warning: baseline was recorded with a different configuration")
+        regressions = compare(result, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION: {line}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
@@ -0,0 +1,643 @@
+"""
+Per-camera detection pipeline.
+
+A CameraPipeline owns everything that used to be module-level state in road-security.py (capture, mask,
+tracker, vehicle state, tripwire, alerts) so one process can serve several junction feeds. The YOLO models
+are loaded once in SharedModels and shared by every stream.
+"""
+import threading
+import time
+from datetime import datetime
+
+import cv2
+import cvzone
+import numpy as np
+
+from clock import make_clock
+from color_batcher import ColorBatcher
+from metrics import REGISTRY, STARTUP
+from pipeline import FrameQueue, Stage, status_lines, BLOCK
+from reid import ReIdGallery, color_embedding, merge_into, share_result
+from sort import TRACKERS
+from vehicle_store import VehicleStore
+from zones import ZoneSet
+
+#section classes
+classNames = [
+    "person", "bicycle", "car", "motorbike", "airplane", "bus", "train", "truck", "boat",
+    "traffic light", "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat",
+    "dog", "horse", "sheep", "cow", "elephant", "bear", "zebra", "giraffe", "backpack",
+    "umbrella", "handbag", "tie", "suitcase", "frisbee", "skis", "snowboard", "sports ball",
+    "kite", "baseball bat", "baseball glove", "skateboard", "surfboard", "tennis racket",
+    "bottle", "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple",
+    "sandwich", "orange", "broccoli", "carrot", "hot dog", "pizza", "donut", "cake",
+    "chair", "couch", "potted plant", "bed", "dining table", "toilet", "tvmonitor",
+    "laptop", "mouse", "remote", "keyboard", "cell phone", "microwave", "oven",
+    "toaster", "sink", "refrigerator", "book", "clock", "vase", "scissors",
+    "teddy bear", "hair drier", "toothbrush"
+]
+colorNames = ['red', 'black', 'blue', 'car', 'green', 'grey', 'orange', 'silver', 'white', 'yellow']
+VEHICLE_CLASSES = ["car", "truck", "bus", "motorbike"]
+VEHICLE_CLASS_IDS = [classNames.index(name) for name in VEHICLE_CLASSES]
+#endsection
+
+DEFAULT_LIMIT = [100, 340, 1200, 340]
+
+
+def mask_regions(mask, min_area=400):
+    """Bounding rectangles (x, y, w, h) of the white areas of the mask, overlapping rectangles merged."""
+    gray = cv2.cvtColor(mask, cv2.COLOR_BGR2GRAY)
+    contours, _ = cv2.findContours((gray > 0).astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    rects = [cv2.boundingRect(c) for c in contours if cv2.contourArea(c) >= min_area]
+
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                ax, ay, aw, ah = rects[i]
+                bx, by, bw, bh = rects[j]
+                if ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah:
+                    x, y = min(ax, bx), min(ay, by)
+                    rects[i] = (x, y, max(ax + aw, bx + bw) - x, max(ay + ah, by + bh) - y)
+                    rects.pop(j)
+                    merged = True
+                    break
+            if merged: break
+    return rects
+
+
+def extract_detections(results, offsets):
+    """
+    Confident vehicle boxes from YOLO results as [x1, y1, x2, y2, conf, class_id] rows in frame coordinates.
+    Whole-array filtering per result: one mask for class and confidence, no per-box tensor conversion.
+    """
+    detections = []
+    for (ox, oy), r in zip(offsets, results):
+        boxes = r.boxes
+        xyxy = boxes.xyxy.cpu().numpy().astype(int)
+        conf = np.ceil(boxes.conf.cpu().numpy() * 100) / 100
+        cls = boxes.cls.cpu().numpy()
+        keep = np.isin(cls, VEHICLE_CLASS_IDS) & (conf > 0.6)
+        # bounding boxes shifted back from crop to frame coordinates
+        detections.append(np.column_stack((xyxy[keep] + [ox, oy, ox, oy], conf[keep], cls[keep])))
+    return np.concatenate(detections) if detections else np.empty((0, 6))
+
+
+class DetectionStride:
+    """
+    Decides on which frames YOLO runs; SORT extrapolates the tracks on the frames in between.
+    The stride grows (up to max_stride) while detection blows the frame budget or the scene is sparse,
+    and drops back to 1 while a track is near a logging tripwire. The detect stage runs several frames ahead of
+    tracking, so it only takes near_line as a hint: the tracking stage itself runs the detector on a skipped frame
+    whenever a track is near a logging tripwire (must_detect), so crossings always get a full detection.
+    fixed=True (replays on a media clock) keeps the stride at max_stride, so which frames are detected does not
+    depend on the hardware. max_stride=1 runs the detector on every frame.
+    """
+    def __init__(self, max_stride=1, frame_budget_ms=40, sparse_tracks=3, near_line_px=80, fixed=False):
+        self.max_stride = max_stride
+        self.frame_budget_ms = frame_budget_ms
+        self.sparse_tracks = sparse_tracks
+        self.near_line_px = near_line_px
+        self.fixed = fixed
+        self.stride = max(max_stride, 1) if fixed else 1
+        self.skipped = 0
+        self.near_line = False
+        self.track_count = 0
+        self.detected_frames = 0
+        self.extrapolated_frames = 0
+        self.late_detections = 0
+
+    def should_detect(self):
+        """Called by the detect stage for every frame."""
+        if (self.near_line and not self.fixed) or self.skipped + 1 >= self.stride:
+            self.skipped = 0
+            self.detected_frames += 1
+            return True
+        self.skipped += 1
+        self.extrapolated_frames += 1
+        return False
+
+    def must_detect(self):
+        """
+        Called by the tracking stage for a frame the detect stage skipped: True if a track was near a logging
+        tripwire on the previous frame, which the detect stage, running frames ahead, could not know yet.
+        """
+        if not self.near_line:
+            return False
+        self.extrapolated_frames -= 1
+        self.detected_frames += 1
+        self.late_detections += 1
+        return True
+
+    def observe_tracks(self, tracker_results, zones):
+        """Called by the tracking stage with the tracks of every frame and the stream's ZoneSet."""
+        if len(tracker_results) == 0:
+            self.near_line = False
+            self.track_count = 0
+            return
+        centres = np.stack(((tracker_results[:, 0] + tracker_results[:, 2]) / 2,
+                            (tracker_results[:, 1] + tracker_results[:, 3]) / 2), axis=1)
+        self.near_line = zones.near_logging_wire(centres, self.near_line_px)
+        self.track_count = len(tracker_results)
+
+    def observe_detection(self, detect_ms):
+        """Called after every detector run with its duration; adapts the stride for the next frames."""
+        if self.max_stride <= 1 or self.fixed:
+            return
+        if self.near_line:
+            self.stride = 1
+        elif detect_ms / self.stride > self.frame_budget_ms or self.track_count <= self.sparse_tracks:
+            self.stride = min(self.stride + 1, self.max_stride)
+        else:
+            self.stride = max(self.stride - 1, 1)
+
+
+class SharedModels:
+    """
+    YOLO models loaded once per process and shared by all streams. An ultralytics predictor is not
+    thread-safe, so each model is guarded by its own lock; torch still parallelises inside a call.
+    The models are loaded and warmed up with a dummy inference on a background thread, so capture and the
+    rest of startup do not wait for them; detect() and classify_colors() block until they are ready.
+    """
+    def __init__(self, coco_weights='../YOLO-weights/yolov8s.pt', color_weights='../YOLO-weights/predict-color.pt',
+                 color_batch_size=8, color_batch_ms=50, warmup_size=640):
+        self.coco_model = None
+        self.color_model = None
+        self.load_error = None
+        self.ready = threading.Event()
+        self._coco_lock = threading.Lock()
+        self._color_lock = threading.Lock()
+        threading.Thread(target=self._load, args=(coco_weights, color_weights, warmup_size), name='model-warmup',
+                         daemon=True).start()
+        # One batcher for every stream, so crossings on different cameras share a color_model call.
+        # Keys are (pipeline, vehicle id) and results are routed back to the owning pipeline.
+        self.color_batcher = ColorBatcher(self.classify_colors, self._route_color_result,
+                                          batch_size=color_batch_size, max_wait_ms=color_batch_ms,
+                                          on_error=self._route_color_error)
+        self.color_batcher.start()
+
+        self.inference_ms = {
+            name: REGISTRY.histogram('model_inference_ms', 'Latency of one model call', {"model": name})
+            for name in ("coco", "color")
+        }
+        REGISTRY.gauge('color_backlog', 'Crops waiting for the color model', fn=self.color_batcher.backlog)
+
+    def _load(self, coco_weights, color_weights, warmup_size):
+        try:
+            from ultralytics import YOLO
+            STARTUP.mark("ultralytics import")
+            self.coco_model = YOLO(coco_weights)
+            self.color_model = YOLO(color_weights)
+            STARTUP.mark("models loaded")
+            # The first call builds the predictor and allocates its buffers; pay for it before the first frame
+            dummy = np.zeros((warmup_size, warmup_size, 3), dtype=np.uint8)
+            with self._coco_lock:
+                self.coco_model(dummy, verbose=False)
+            with self._color_lock:
+                self.color_model(dummy, verbose=False)
+            STARTUP.mark("models warm")
+        except Exception as e:
+            print(f"Failed to load the YOLO models: {e}")
+            self.load_error = e
+        finally:
+            self.ready.set()
+
+    def wait_ready(self, timeout=None):
+        """Blocks until the models are loaded and warm; raises if loading failed."""
+        if not self.ready.wait(timeout):
+            return False
+        if self.load_error is not None:
+            raise RuntimeError(f"YOLO models unavailable: {self.load_error}")
+        return True
+
+    def detect(self, images, **kwargs):
+        self.wait_ready()
+        with self._coco_lock, self.inference_ms["coco"].time():
+            return list(self.coco_model(images, **kwargs))
+
+    def classify_colors(self, crops, **kwargs):
+        self.wait_ready()
+        with self._color_lock, self.inference_ms["color"].time():
+            return self.color_model(crops, **kwargs)
+
+    @staticmethod
+    def _route_color_result(key, crop_img, color_result):
+        pipeline, record = key
+        pipeline.on_color_result(record, crop_img, color_result)
+
+    @staticmethod
+    def _route_color_error(key, crop_img, error):
+        pipeline, record = key
+        pipeline.on_color_error(record, crop_img, error)
+
+    def close(self):
+        self.color_batcher.close()
+
+
+class CameraPipeline:
+    """One camera feed: decode -> detect -> track/rules stages with their own tracker and vehicle state."""
+    def __init__(self, name, source, mask_path, models, security, limit=None, roi_crop=True,
+                 queue_size=4, policy=BLOCK, max_age=20, min_hits=3, iou_threshold=0.3, draw=True, log_rows=True,
+                 max_stride=1, frame_budget_ms=40, flush_tracks=False, tracker='vectorized', gated=True,
+                 solver=None, reid=True, clock=None, clock_origin=None, tripwires=None, zones=None,
+                 zone_flush_s=60.0):
+        self.name = name
+        self.source = source
+        self.models = models
+        self.security = security
+        self.cap = cv2.VideoCapture(source)
+        self.wd = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.ht = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if not self.cap.isOpened() or self.wd <= 0 or self.ht <= 0:
+            self.cap.release()
+            raise IOError(f"[{name}] Cannot read video source {source}")
+        mask = cv2.imread(mask_path)
+        if mask is None:
+            raise FileNotFoundError(f"[{name}] NO mask found at {mask_path}")
+        self.mask = cv2.resize(mask, (self.wd, self.ht))
+        # Frame times come from the video's timestamps for files and from the wall clock for live cameras
+        self.clock = make_clock(source, self.cap, clock, clock_origin)
+
+        # Smart cropping: roi_crop=False runs YOLO on the full masked frame to compare the detect stage time
+        self.roi_crop = roi_crop
+        self.roi_rects = mask_regions(self.mask) or [(0, 0, self.wd, self.ht)]
+        print(f"[{name}] ROI crop {'on' if roi_crop else 'off'}: {len(self.roi_rects)} region(s) {self.roi_rects}")
+
+        # Records live as long as their SORT track; flush_tracks writes each final state to vehicle_tracks
+        self.vehicles = VehicleStore(name, on_evict=self.on_vehicle_evicted if flush_tracks else None)
+        self.recent_alerts = []
+        # 'vectorized' batches the Kalman filters of all tracks, 'sort' is the original per-track filterpy tracker
+        # gated=True only scores overlapping detection/track pairs (sort.associate_gated), for crowded wide shots
+        self.tracker = TRACKERS[tracker](max_age=max_age, min_hits=min_hits, iou_threshold=iou_threshold,
+                                         gated=gated, solver=solver)
+        self.limit = list(limit or DEFAULT_LIMIT)
+        # Tripwires at any angle and polygon zones; without tripwires `limit` is the counting line
+        # log_rows=False (--no-db) keeps the counters in memory only
+        self.zones = ZoneSet.for_camera(name, self.limit, tripwires, zones, flush_s=zone_flush_s,
+                                        sink=security.log_zone_counts if log_rows else None)
+        # Re-ID: a new track crossing the line is merged into a recently lost look-alike instead of logged again
+        self.reid = ReIdGallery(name) if reid else None
+        # On a media clock the stride is fixed: the detect time depends on the hardware, the replay must not
+        self.stride = DetectionStride(max_stride=max_stride, frame_budget_ms=frame_budget_ms,
+                                      fixed=self.clock.kind == 'media')
+
+        # Headless runs that write no video skip all overlay drawing; log_rows=False keeps rows out of the DB
+        self.draw = draw
+        self.log_rows = log_rows
+        self.logged = 0
+
+        self.queue_size = queue_size
+        self.policy = policy
+        self.stages = []
+        self.output = None
+        self.stop_event = threading.Event()
+        self.frames = 0
+        self.started_at = None
+        self.frames_total = REGISTRY.counter('frames_processed_total', 'Frames through the tracking stage',
+                                             {"stream": name})
+        self.behavior_ms = REGISTRY.histogram('behavior_ms', 'Latency of the per-frame behavior analysis',
+                                              {"stream": name})
+        # Sub-steps of the detect and track stages, also read by benchmark.py
+        self.step_ms = {step: REGISTRY.histogram('step_ms', 'Latency of one sub-step of a pipeline stage',
+                                                 {"stream": name, "step": step})
+                        for step in ("mask", "detector", "tracker", "zones", "draw")}
+        self.fps_window = (time.time(), 0)
+        self.hud_fps = 0.0
+
+    def update_security_dashboard(self, v_id, v_type, v_color, ts):
+        timestamp = datetime.fromtimestamp(ts).strftime("%H:%M:%S")
+        entry = f"{timestamp} - ID {v_id}: {v_color} {v_type}"
+        self.recent_alerts.insert(0, entry)  # Add to start of list
+        # Keep only the last 5 events
+        if len(self.recent_alerts) > 5: self.recent_alerts.pop()
+
+    def on_color_result(self, v_data, crop_img, color_result):
+        """
+        Runs on the color batcher thread once the crop of a vehicle has been classified. Works on the
+        record itself, so the result is still logged if the track was retired in the meantime. Times are
+        those of the frame the crop was cut from, not of when the batch finished.
+        """
+        Id = v_data.id
+        ts = v_data.crossed_at if v_data.crossed_at is not None else time.time()
+        if len(color_result.boxes) > 0:
+            detected_color = colorNames[int(color_result.boxes.cls[0])]
+            is_exception = False
+        else:
+            detected_color = "speeding/hidden"
+            is_exception = True
+
+        v_data.logged = True
+        v_data.color = detected_color
+
+        is_suspicious = self.security.check_status(v_data.type, detected_color, is_exception)
+        v_data.is_blacklisted = is_suspicious
+
+        # s3 object name
+        file_timestamp = datetime.fromtimestamp(ts).strftime("%Y%m%d_%H%M%S")
+        s3_filename = f"{detected_color}_{v_data.type}_{Id}_{file_timestamp}.jpg"
+
+        if is_suspicious and not v_data.uploaded:
+            v_data.uploaded = True
+            self.security.upload_evidence_async(crop_img, s3_filename)
+            alert_msg = f"ALERT!! : {detected_color} {v_data.type} (ID:{Id})"
+            if alert_msg not in self.recent_alerts:
+                self.recent_alerts.insert(0, alert_msg)
+        else:
+            self.update_security_dashboard(Id, v_data.type, v_data.color, ts)
+
+        share_result(v_data)
+        self.logged += 1
+        if self.log_rows:
+            self.security.log_vehicle(Id, v_data, s3_filename, ts, self.name)
+
+    def on_color_error(self, v_data, crop_img, error):
+        """
+        Runs on the color batcher thread when the batch holding the crop of a vehicle failed (e.g. the models
+        did not load). The vehicle is logged as unclassified instead of staying queued for ever.
+        """
+        v_data.color_queued = False
+        v_data.logged = True
+        v_data.color = "unclassified"
+        share_result(v_data)
+        self.logged += 1
+        if self.log_rows:
+            self.security.log_vehicle(v_data.id, v_data, None, v_data.crossed_at, self.name)
+
+    def on_vehicle_evicted(self, v_data):
+        if self.log_rows:
+            self.security.log_track(self.name, v_data)
+
+    def masked_regions(self, image):
+        """Mask stage: the image region(s) sent to YOLO and their (x, y) offsets in the frame."""
+        mask = self.mask
+        if self.roi_crop:
+            # Only the mask's bounding rectangles go to YOLO
+            crops = [cv2.bitwise_and(image[y:y + h, x:x + w], mask[y:y + h, x:x + w]) for x, y, w, h in self.roi_rects]
+            return crops, [(x, y) for x, y, _, _ in self.roi_rects]
+        return [cv2.bitwise_and(image, mask)], [(0, 0)]
+
+    def detect_vehicles(self, image):
+        """Detection stage: runs YOLO on the masked region(s) and keeps confident vehicle boxes in frame coordinates."""
+        with self.step_ms["mask"].time():
+            regions, offsets = self.masked_regions(image)
+        with self.step_ms["detector"].time():
+            if self.roi_crop:
+                results = self.models.detect(regions, classes=VEHICLE_CLASS_IDS, verbose=False)
+            else:
+                results = self.models.detect(regions[0], verbose=False)
+            return extract_detections(results, offsets)
+
+    def process_frame(self, image, detections, now=None):
+        """
+        Tracking/rules stage: updates SORT, counts tripwire/zone crossings, logs the vehicles crossing a logging
+        tripwire and draws the per-vehicle overlays. `now` is the frame time from self.clock.
+        """
+        vehicles, ht, wd = self.vehicles, self.ht, self.wd
+        with self.step_ms["tracker"].time():
+            if detections is None:
+                # Detector skipped on this frame: carry the tracks forward with the Kalman prediction
+                tracker_results = self.tracker.extrapolate()
+            else:
+                # Rows come back as [x1, y1, x2, y2, id, score, class], the class voted over the track's life
+                tracker_results = self.tracker.update(detections)
+        retired = self.tracker.pop_retired()
+        vehicles.evict(retired)
+        if self.reid is not None:
+            self.reid.retire(retired)
+        self.stride.observe_tracks(tracker_results, self.zones)
+
+        now = time.time() if now is None else now
+        seen = []  # (record, box) of every track in this frame, for the crossing test, behavior pass and overlays
+        for result in tracker_results:
+            x1, y1, x2, y2, Id = map(int, result[:5])
+            cls_id = int(result[6]) if len(result) > 6 else -1
+            # toggle this on to check if id are stateful or stateless
+            # cv2.putText(image, f'{Id}', (max(0,x1), max(28,y1)), thickness=2, fontScale=1.5, fontFace=cv2.FONT_HERSHEY_SIMPLEX, color=(255,255,255))
+
+            v_type = classNames[cls_id] if cls_id >= 0 else "Vehicle"
+            v_data = vehicles.get(Id)
+            if v_data is None:
+                v_data = vehicles.create(Id, v_type, now)
+            elif cls_id >= 0:
+                v_data.type = v_type  # the vote can correct the type while the track lives
+            v_data.last_seen = now
+            v_data.frames += 1
+            seen.append((v_data, (x1, y1, x2, y2)))
+
+        # tracker points
+        boxes = np.array([box for _, box in seen], dtype=int).reshape(-1, 4)
+        centres = np.stack((boxes[:, 0] + (boxes[:, 2] - boxes[:, 0]) // 2,
+                            boxes[:, 1] + (boxes[:, 3] - boxes[:, 1]) // 2), axis=1)
+        # cv2.circle(image,(cx,cy),5,(0,0,255),-1) # can toggle on for tracker points visibility
+
+        # Crossings: each track's step from its last centre to this one against every tripwire and zone at once,
+        # then all trajectories grow in one ring buffer write
+        trajectories = vehicles.trajectories
+        rows = np.array([v_data.row for v_data, _ in seen], dtype=np.intp)
+        with self.step_ms["zones"].time():
+            crossed = self.zones.update(trajectories.point(rows), centres, trajectories.count[rows] > 0,
+                                        [v_data.type for v_data, _ in seen], now)
+        trajectories.append(rows, centres, now)
+
+        for i in np.flatnonzero(crossed).tolist():
+            v_data, (x1, y1, x2, y2) = seen[i]
+            if v_data.logged or v_data.color_queued:
+                continue
+            crop_img = image[max(0, y1 - 20):min(ht, y2 + 20), max(0, x1 - 20):min(wd, x2 + 20)]
+            if crop_img.size != 0 and not self.reidentify(v_data, crop_img, centres[i].tolist(), now):
+                # Classified asynchronously; the label stays "Scanning..." until on_color_result runs
+                v_data.color_queued = True
+                v_data.crossed_at = now
+                if tracker_results.shape[1] > 5:
+                    v_data.confidence = float(tracker_results[i, 5])
+                self.models.color_batcher.submit((self, v_data), crop_img.copy())
+
+        # Hazard rules (stalls, tailgating, lane drift, ...) for all tracks of the frame in one vectorized pass
+        with self.behavior_ms.time():
+            self.security.analyze_frame([v_data for v_data, _ in seen], now, vehicles, self.name)
+        if self.draw:
+            with self.step_ms["draw"].time():
+                for v_data, (x1, y1, x2, y2) in seen:
+                    self.draw_vehicle(image, v_data.id, x1, y1, x2, y2, v_data)
+
+    def reidentify(self, v_data, crop_img, center, now=None):
+        """Embeds the crop and merges v_data into a recently lost vehicle it matches. True if it was merged."""
+        if self.reid is None:
+            return False
+        with self.reid.query_ms.time():
+            embedding = color_embedding(crop_img)
+            lost = self.reid.match(embedding, center, v_data.first_seen, now)
+            self.reid.add(v_data, embedding)
+        if lost is None:
+            return False
+        merge_into(v_data, lost)
+        return True
+
+    def draw_vehicle(self, image, Id, x1, y1, x2, y2, v_data):
+        """Draw stage: box, label and (for suspicious vehicles) the ghost tail of one track."""
+        display_text = f"ID:{Id} {v_data.type} | {v_data.color}"
+        # State 1: Logged and Blacklisted (Suspicious)
+        if v_data.is_blacklisted:
+            b_color = (0, 0, 255)
+            thickness = 3
+
+        # State 2: Logged but Safe (Normal)
+        elif v_data.logged:
+            b_color = (0, 255, 0)
+            thickness = 2
+
+        # State 3: Unlogged (Scanning/Initial Detection)
+        else:
+            b_color = (255, 0, 255)
+            thickness = 2
+
+        cv2.rectangle(image, (x1, y1), (x2, y2), b_color, thickness)
+        cvzone.putTextRect(image, display_text, (max(0, x1), max(35, y1)),
+                           scale=1, thickness=1, offset=3, colorR=b_color)
+
+        if v_data.is_blacklisted or v_data.hazard_type is not None:
+            color = (0, 0, 255)
+            thickness = 3
+            points = v_data.trajectory
+
+            if v_data.hazard_type is not None:
+                color = (0, 0, 255)
+                thickness = 2
+                cvzone.putTextRect(image, v_data.hazard_type, (x1, y2 + 20), scale=1, colorR=color)
+
+            # Draw the 'Ghost' movement tail straight from the trajectory store, no copy
+            if len(points) > 1:
+                cv2.polylines(image, [points], False, color, thickness)
+
+    def decode(self):
+        """Decode stage (source): reads the next frame, None at the end of the video."""
+        ret, image = self.cap.read()
+        if not ret: return None
+        return {"image": image, "ts": self.clock.frame_time(self.cap)}
+
+    def detect(self, packet):
+        if self.stride.should_detect():
+            start = time.perf_counter()
+            packet["detections"] = self.detect_vehicles(packet["image"])
+            self.stride.observe_detection(1000 * (time.perf_counter() - start))
+        else:
+            packet["detections"] = None
+        return packet
+
+    def track(self, packet):
+        if packet["detections"] is None and self.stride.must_detect():
+            # A vehicle is about to cross a logging tripwire: its crop must come from a detected box
+            packet["detections"] = self.detect_vehicles(packet["image"])
+        self.process_frame(packet["image"], packet["detections"], packet["ts"])
+        self.frames += 1
+        self.frames_total.inc()
+        if self.frames == 1:
+            STARTUP.mark("first frame tracked")
+        return packet
+
+    def start(self):
+        """
+        Starts the decode/detect/track threads; annotated frames come out of self.output. The stages share this
+        stream's stop_event, set by stop() or by a stage that crashed.
+        """
+        stop_event = self.stop_event
+        decoded = FrameQueue("decode", self.queue_size, self.policy)
+        detected = FrameQueue("detect", self.queue_size, self.policy)
+        self.output = FrameQueue("track", self.queue_size, self.policy)
+        labels = {"stream": self.name}
+        self.stages = [
+            Stage(f"{self.name}/{stage}", fn, inbox, outbox, stop_event,
+                  latency=REGISTRY.histogram('stage_latency_ms', 'Service time per frame of a pipeline stage',
+                                             {**labels, "stage": stage}))
+            for stage, fn, inbox, outbox in (("decode", self.decode, None, decoded),
+                                             ("detect", self.detect, decoded, detected),
+                                             ("track", self.track, detected, self.output))
+        ]
+        for stage in self.stages:
+            stage_labels = {**labels, "stage": stage.name.split('/')[-1]}
+            REGISTRY.gauge('queue_depth', 'Packets waiting in the output queue of a stage', stage_labels,
+                           fn=stage.outbox.depth)
+            REGISTRY.gauge('frames_dropped', 'Packets dropped by the backpressure policy', stage_labels,
+                           fn=lambda q=stage.outbox: q.dropped)
+        REGISTRY.gauge('active_tracks', 'Live SORT tracks', labels, fn=lambda: len(self.tracker))
+        REGISTRY.gauge('detect_stride', 'Frames between detector runs', labels, fn=lambda: self.stride.stride)
+        self.started_at = time.time()
+        self.fps_window = (self.started_at, 0)
+        for stage in self.stages:
+            stage.start()
+
+    def throughput(self):
+        """Frames per second fully processed by this stream since it started."""
+        elapsed = time.time() - self.started_at if self.started_at else 0
+        return self.frames / elapsed if elapsed > 0 else 0.0
+
+    def stage_times(self):
+        """(stage, seconds busy, frames) for each stage, without the stream prefix."""
+        return [(stage.name.split('/')[-1], stage.busy_time, stage.processed) for stage in self.stages]
+
+    def status_lines(self):
+        return ([f"{self.name}: {self.throughput():.1f} fps, {len(self.vehicles)} vehicles, "
+                 f"detect stride {self.stride.stride} ({self.stride.extrapolated_frames} frames extrapolated)",
+                 self.zones.status_line()]
+                + status_lines(self.stages))
+
+    def draw_hud(self, image):
+        wd, ht = self.wd, self.ht
+        curr_time = time.time()
+
+        # UI Dashboard
+        cv2.putText(image, "SECURITY LOG (RECENT)", (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+        # FPS over the last second from the frames counter, not the noisy per-frame interval
+        window_start, window_frames = self.fps_window
+        if curr_time - window_start >= 1.0:
+            self.hud_fps = (self.frames_total.value - window_frames) / (curr_time - window_start)
+            self.fps_window = (curr_time, self.frames_total.value)
+
+        sql_status, s3_status = self.security.status_lines()
+        cv2.rectangle(image, (wd - 300, 0), (wd, 100), (0, 0, 0), -1)  # Background
+        cv2.putText(image, f"FPS: {self.hud_fps:.1f}", (wd - 280, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        cv2.putText(image, sql_status, (wd - 280, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        cv2.putText(image, s3_status, (wd - 280, 80), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+        for i, alert in enumerate(self.recent_alerts):
+            cv2.putText(image, alert, (20, 85 + (i * 30)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+
+        # Per-stage queue depth, drops and service time
+        status = self.status_lines()
+        batcher = self.models.color_batcher
+        if batcher is not None:
+            status.append(f"color: backlog {batcher.backlog()} avg batch {batcher.avg_batch_size():.1f}")
+        for i, line in enumerate(status):
+            cv2.putText(image, line, (20, ht - 20 - (i * 22)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
+
+    @property
+    def error(self):
+        """The exception of the first stage that crashed, None while every stage is healthy."""
+        return next((stage.error for stage in self.stages if stage.error is not None), None)
+
+    def stopped(self):
+        """True once the stream was stopped or a stage crashed: no END_OF_STREAM is guaranteed to follow."""
+        return self.stop_event.is_set()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def join(self):
+        # After a stop the caller no longer reads self.output: drain it so no stage waits for room
+        while any(stage.is_alive() for stage in self.stages):
+            self.output.drain()
+            for stage in self.stages:
+                stage.join(timeout=0.1)
+        self.cap.release()
+        self.vehicles.evict_all()
+        self.zones.flush()
+
+    def release(self):
+        """
+        Frees a finished stream for batch runs: drops its metric series, whose gauges would otherwise keep the
+        pipeline reachable from REGISTRY, and its frame-sized buffers. Its counters stay readable for the report.
+        """
+        REGISTRY.remove({"stream": self.name})
+        self.mask = None
+        self.tracker = None
@@ -0,0 +1,67 @@
+"""
+Frame clocks: when a frame was captured, for stall durations, track first/last seen, log rows and evidence names.
+
+Live cameras use WallClock. Recorded video uses MediaClock, which takes the time of each frame from its
+presentation timestamp, so footage replayed at 5x or throttled by a slow machine gives the same hazards and
+timestamps on every run.
+"""
+import os
+import time
+from datetime import datetime
+
+import cv2
+
+CLOCKS = ('wall', 'media')
+
+
+class WallClock:
+    """Frame time = when the frame was read."""
+    kind = 'wall'
+
+    def frame_time(self, cap):
+        return time.time()
+
+
+class MediaClock:
+    """
+    Frame time = `origin` (epoch seconds) + the frame's presentation timestamp. Backends that report no
+    timestamps (CAP_PROP_POS_MSEC stuck at 0) fall back to the frame index at `fps`.
+    """
+    kind = 'media'
+
+    def __init__(self, origin=0.0, fps=None):
+        self.origin = origin
+        self.fps = fps or 30.0
+        self.last = None
+
+    def frame_time(self, cap):
+        """Time of the frame cap.read() just returned."""
+        t = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        if self.last is not None and t <= self.last:
+            t = self.last + 1.0 / self.fps
+        self.last = t
+        return self.origin + t
+
+
+def parse_origin(value):
+    """Epoch seconds from a number or an ISO 8601 string such as '2024-11-02T08:30:00'."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value).timestamp()
+
+
+def make_clock(source, cap, kind=None, origin=None):
+    """
+    The clock for a capture: `kind` 'wall' or 'media', by default media for video files and wall for camera
+    URLs and device indexes. A media clock starts at `origin`, by default the file's modification time, which
+    stays the same from one replay to the next.
+    """
+    is_file = isinstance(source, str) and os.path.isfile(source)
+    kind = kind or ('media' if is_file else 'wall')
+    if kind not in CLOCKS:
+        raise ValueError(f"Unknown clock {kind!r}, expected one of {CLOCKS}")
+    if kind == 'wall':
+        return WallClock()
+    if origin is None:
+        origin = os.path.getmtime(source) if is_file else 0.0
+    return MediaClock(parse_origin(origin), cap.get(cv2.CAP_PROP_FPS))
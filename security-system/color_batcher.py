@@ -0,0 +1,106 @@
+"""
+Micro-batching front end for the color model.
+
+Vehicles that cross the counting line within a few frames of each other are classified in a single
+model call instead of paying the per-call overhead once per vehicle.
+"""
+import threading
+import time
+
+from metrics import REGISTRY
+
+
+class ColorBatcher(threading.Thread):
+    """
+    Queues (key, crop) pairs and runs them through `model` as one batch once `batch_size` crops are waiting
+    or the oldest crop has waited `max_wait_ms`. `on_result(key, crop, result)` is called from this thread
+    for every crop, with the ultralytics Results object of that crop, and `on_error(key, crop, error)` for
+    every crop of a batch that failed.
+    """
+    def __init__(self, model, on_result, batch_size=8, max_wait_ms=50, on_error=None):
+        super().__init__(name="color-batcher", daemon=True)
+        self.model = model
+        self.on_result = on_result
+        self.on_error = on_error
+        self.failures = REGISTRY.counter('color_failures_total', 'Crops whose color batch failed')
+        self.batch_ms = REGISTRY.histogram('color_batch_ms', 'Latency of one batch through the color model')
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.items = 0
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def submit(self, key, crop):
+        with self._cond:
+            self._pending.append((key, crop, time.monotonic()))
+            self._cond.notify()
+
+    def backlog(self):
+        return len(self._pending)
+
+    def run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                with self.batch_ms.time():
+                    results = list(self.model([crop for _, crop, _ in batch], verbose=False))
+            except Exception as e:
+                print(f"Color batch of {len(batch)} failed: {e}")
+                self._fail(batch, e)
+            else:
+                # Each crop reaches exactly one callback: a failing on_result must not send the crops already
+                # handled, or itself, to on_error as well
+                for (key, crop, _), result in zip(batch, results):
+                    try:
+                        self.on_result(key, crop, result)
+                    except Exception as e:
+                        print(f"Color result handler failed: {e}")
+                if len(results) < len(batch):
+                    self._fail(batch[len(results):], RuntimeError(f"color model returned {len(results)} results "
+                                                                  f"for {len(batch)} crops"))
+            self.batches += 1
+            self.items += len(batch)
+
+    def _fail(self, items, error):
+        """Counts the crops that got no result and hands them to on_error."""
+        self.failures.inc(len(items))
+        if self.on_error is None:
+            return
+        for key, crop, _ in items:
+            try:
+                self.on_error(key, crop, error)
+            except Exception as e:
+                print(f"Color failure handler failed: {e}")
+
+    def _next_batch(self):
+        """Blocks until the size or deadline trigger fires. Returns None once closed and drained."""
+        with self._cond:
+            while not self._pending:
+                if self._closed:
+                    return None
+                self._cond.wait()
+
+            deadline = self._pending[0][2] + self.max_wait
+            while len(self._pending) < self.batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            return batch
+
+    def close(self):
+        """Flushes the crops still queued and stops the worker."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self.join()
+
+    def avg_batch_size(self):
+        return self.items / self.batches if self.batches else 0.0
@@ -0,0 +1,159 @@
+"""
+Versioned schema of the detector's SQLite database.
+
+The schema version lives in `PRAGMA user_version`. migrate() runs every migration above the database's version,
+each in its own transaction together with the version bump, so an existing logs_/traffic_security.db is upgraded
+in place the first time a newer detector opens it and a failed migration leaves it at the previous version.
+Add a migration by appending a function to MIGRATIONS; never edit one that has shipped.
+"""
+from metrics import STARTUP
+
+# Bucket sizes of vehicle_rollups in seconds, buckets aligned to the epoch
+ROLLUP_RESOLUTIONS = (5, 60, 3600)
+
+
+def _v1_tables(conn):
+    """The tables as the detector created them before the schema was versioned."""
+    conn.execute('''
+                 CREATE TABLE IF NOT EXISTS vehicle_logs
+                 (
+                     id            INTEGER PRIMARY KEY AUTOINCREMENT,
+                     timestamp     TEXT,
+                     vehicle_id    INTEGER,
+                     type          TEXT,
+                     color         TEXT,
+                     is_suspicious BOOLEAN,
+                     s3_key        TEXT
+                 )
+                 ''')
+    conn.execute('''
+                 CREATE TABLE IF NOT EXISTS vehicle_tracks
+                 (
+                     id            INTEGER PRIMARY KEY AUTOINCREMENT,
+                     stream        TEXT,
+                     vehicle_id    INTEGER,
+                     type          TEXT,
+                     color         TEXT,
+                     first_seen    TEXT,
+                     last_seen     TEXT,
+                     frames        INTEGER,
+                     is_suspicious BOOLEAN,
+                     hazard_type   TEXT
+                 )
+                 ''')
+    conn.execute('''
+                 CREATE TABLE IF NOT EXISTS zone_counts
+                 (
+                     id           INTEGER PRIMARY KEY AUTOINCREMENT,
+                     stream       TEXT,
+                     zone         TEXT,
+                     event        TEXT,
+                     type         TEXT,
+                     count        INTEGER,
+                     period_start TEXT,
+                     period_end   TEXT
+                 )
+                 ''')
+
+
+def _v2_typed_vehicle_logs(conn):
+    """
+    Integer epoch-ms time, camera, detection confidence and hazard type on vehicle_logs, and the indexes behind
+    the dashboards' time-range, alert and type/color queries. The text timestamp stays for display.
+    """
+    for column, sql_type in (("ts_ms", "INTEGER"), ("camera_id", "TEXT"), ("confidence", "REAL"),
+                             ("hazard_type", "TEXT")):
+        conn.execute(f"ALTER TABLE vehicle_logs ADD COLUMN {column} {sql_type}")
+    # Old rows only have the local-time text timestamp; 'utc' converts it from local time like datetime.timestamp()
+    conn.execute('''
+                 UPDATE vehicle_logs
+                 SET ts_ms = CAST(strftime('%s', timestamp, 'utc') AS INTEGER) * 1000
+                 WHERE ts_ms IS NULL AND timestamp IS NOT NULL
+                 ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vehicle_logs_ts ON vehicle_logs (ts_ms)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vehicle_logs_alerts ON vehicle_logs (is_suspicious, ts_ms)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vehicle_logs_type_color ON vehicle_logs (type, color)")
+
+
+def _v3_rollups(conn):
+    """
+    vehicle_rollups: logged vehicles counted per bucket of each ROLLUP_RESOLUTIONS by camera, type, color and
+    suspicious flag, so the dashboards read a few rows per bucket of their window instead of every vehicle.
+    Existing vehicle_logs rows are counted in.
+    """
+    conn.execute('''
+                 CREATE TABLE IF NOT EXISTS vehicle_rollups
+                 (
+                     resolution_s  INTEGER NOT NULL,
+                     bucket_ms     INTEGER NOT NULL,
+                     camera_id     TEXT    NOT NULL DEFAULT '',
+                     type          TEXT    NOT NULL DEFAULT '',
+                     color         TEXT    NOT NULL DEFAULT '',
+                     is_suspicious INTEGER NOT NULL DEFAULT 0,
+                     count         INTEGER NOT NULL,
+                     PRIMARY KEY (resolution_s, bucket_ms, camera_id, type, color, is_suspicious)
+                 ) WITHOUT ROWID
+                 ''')
+    for resolution_s in ROLLUP_RESOLUTIONS:
+        conn.execute('''
+                     INSERT INTO vehicle_rollups (resolution_s, bucket_ms, camera_id, type, color, is_suspicious,
+                                                  count)
+                     SELECT ?, ts_ms - ts_ms % ?, COALESCE(camera_id, ''), COALESCE(type, ''), COALESCE(color, ''),
+                            COALESCE(is_suspicious, 0), COUNT(*)
+                     FROM vehicle_logs
+                     WHERE ts_ms IS NOT NULL
+                     GROUP BY 2, 3, 4, 5, 6
+                     ''', (resolution_s, resolution_s * 1000))
+
+
+def _v4_archive_indexes(conn):
+    """Indexes on the day columns of vehicle_tracks and zone_counts, by which log_archive finds their old rows."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vehicle_tracks_last_seen ON vehicle_tracks (last_seen)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_zone_counts_period_end ON zone_counts (period_end)")
+
+
+# Counts one logged vehicle into its bucket of one resolution
+ROLLUP_UPSERT = '''
+                INSERT INTO vehicle_rollups (resolution_s, bucket_ms, camera_id, type, color, is_suspicious, count)
+                VALUES (?, ?, ?, ?, ?, ?, 1)
+                ON CONFLICT (resolution_s, bucket_ms, camera_id, type, color, is_suspicious)
+                    DO UPDATE SET count = count + 1
+                '''
+
+
+def rollup_rows(ts_ms, camera_id, v_type, color, is_suspicious):
+    """ROLLUP_UPSERT parameters counting one vehicle logged at ts_ms into every resolution."""
+    return [(resolution_s, ts_ms - ts_ms % (resolution_s * 1000), camera_id or '', v_type or '', color or '',
+             is_suspicious) for resolution_s in ROLLUP_RESOLUTIONS]
+
+
+# MIGRATIONS[i] takes the database from version i to i + 1
+MIGRATIONS = [
+    _v1_tables,
+    _v2_typed_vehicle_logs,
+    _v3_rollups,
+    _v4_archive_indexes,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Brings the database on `conn` up to SCHEMA_VERSION. Returns the version it started from."""
+    start = schema_version(conn)
+    if start > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema version {start} is newer than this detector's ({SCHEMA_VERSION})")
+    for version in range(start, SCHEMA_VERSION):
+        conn.execute("BEGIN")
+        try:
+            MIGRATIONS[version](conn)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+        STARTUP.mark(f"db schema v{version + 1}")
+    return start
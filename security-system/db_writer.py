@@ -0,0 +1,187 @@
+"""
+Group-commit writer for the detector's SQLite database.
+
+Rows used to be INSERTed and committed on the thread that produced them, so every logged vehicle stalled a frame
+on an fsync. Producers now only queue their rows; the writer thread commits everything waiting in one
+transaction (one executemany per statement) once `batch_size` rows are queued or the oldest has waited
+`max_delay_ms`. The database runs in WAL mode, so the Streamlit dashboards read while the writer writes, with
+synchronous=NORMAL by default: in WAL mode that only fsyncs at checkpoints and a crash loses at most the last
+commits, never the database.
+"""
+import sqlite3
+import threading
+import time
+
+from metrics import REGISTRY
+
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+SYNCHRONOUS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+class DbWriter(threading.Thread):
+    """
+    Writes (sql, params) rows queued with submit()/submit_many()/submit_group() from any thread. The rows of one
+    call are never split between two commits. `on_connect(conn)` runs on the writer's connection before the
+    first batch, e.g. to create or migrate the schema. If the database cannot be opened or migrated the writer
+    stops: `ok` turns False, `error` holds the cause and new rows are refused.
+    """
+    def __init__(self, db_path, batch_size=64, max_delay_ms=200, synchronous='NORMAL', on_connect=None):
+        super().__init__(name="db-writer", daemon=True)
+        if synchronous.upper() not in SYNCHRONOUS:
+            raise ValueError(f"synchronous must be one of {SYNCHRONOUS}, not {synchronous!r}")
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.max_delay = max_delay_ms / 1000
+        self.synchronous = synchronous.upper()
+        self.on_connect = on_connect
+        self.ok = True
+        self.error = None   # why the database could not be opened, once the writer gave up
+        self.submitted = 0
+        self.written = 0    # rows committed or dropped by a failed batch
+        self._pending = []  # ([(sql, rows), ...], row count, queued at), one entry per submit call
+        self._pending_rows = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.write_ms = REGISTRY.histogram('db_write_ms', 'Latency of one group commit')
+        self.wait_ms = REGISTRY.histogram('db_queue_wait_ms', 'Time a row waited for its group commit')
+        self.batch_rows = REGISTRY.histogram('db_batch_rows', 'Rows per group commit', buckets=BATCH_BUCKETS)
+        self.errors = REGISTRY.counter('db_errors_total', 'Failed group commits')
+        self.rows = REGISTRY.counter('db_rows_written_total', 'Rows committed by the DB writer')
+        self.dropped = REGISTRY.counter('db_rows_dropped_total', 'Rows lost to failed commits or refused by a stopped '
+                                                                 'writer')
+        REGISTRY.gauge('db_write_backlog', 'Rows waiting for the DB writer', fn=self.backlog)
+
+    def submit(self, sql, params):
+        self.submit_many(sql, [params])
+
+    def submit_many(self, sql, rows):
+        self.submit_group([(sql, rows)])
+
+    def submit_group(self, statements):
+        """Queues the rows of several statements, [(sql, rows), ...], to be committed in the same transaction."""
+        now = time.monotonic()
+        statements = [(sql, list(rows)) for sql, rows in statements]
+        n = sum(len(rows) for _, rows in statements)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("DbWriter is closed")
+            if self.error is not None:
+                self.dropped.inc(n)
+                return
+            self._pending.append((statements, n, now))
+            self._pending_rows += n
+            self.submitted += n
+            self._cond.notify_all()
+
+    def backlog(self):
+        return self._pending_rows
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        if self.on_connect is not None:
+            self.on_connect(conn)
+        return conn
+
+    def run(self):
+        try:
+            conn = self._connect()
+        except Exception as e:
+            self._fail(e)
+            return
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                self._write(conn, batch)
+        finally:
+            conn.close()
+
+    def _fail(self, error):
+        """The database cannot be opened: drops the queued rows and refuses new ones."""
+        with self._cond:
+            self.ok = False
+            self.error = error
+            lost = self._pending_rows
+            self._pending.clear()
+            self._pending_rows = 0
+            self.written += lost
+            self._cond.notify_all()
+        self.errors.inc()
+        self.dropped.inc(lost)
+        print(f"Database {self.db_path} unavailable, {lost} rows lost and no more rows written: {error}")
+
+    def _next_batch(self):
+        """Blocks until the size or deadline trigger fires. Returns None once closed and drained."""
+        with self._cond:
+            while not self._pending:
+                if self._closed:
+                    return None
+                self._cond.wait()
+
+            deadline = self._pending[0][2] + self.max_delay
+            while self._pending_rows < self.batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            # Whole submit calls up to batch_size rows; a call larger than that is committed on its own
+            taken, rows = 0, 0
+            while taken < len(self._pending) and (taken == 0 or rows + self._pending[taken][1] <= self.batch_size):
+                rows += self._pending[taken][1]
+                taken += 1
+            batch = self._pending[:taken]
+            del self._pending[:taken]
+            self._pending_rows -= rows
+            return batch
+
+    def _write(self, conn, batch):
+        statements = {}  # sql -> params, in the order the rows were queued
+        for group, _, _ in batch:
+            for sql, rows in group:
+                statements.setdefault(sql, []).extend(rows)
+        n = sum(count for _, count, _ in batch)
+        start = time.perf_counter()
+        try:
+            with conn:  # one transaction, committed once
+                for sql, rows in statements.items():
+                    conn.executemany(sql, rows)
+        except Exception as e:
+            # Not only sqlite3.Error: e.g. a parameter of an unsupported type must not kill the writer thread
+            self.ok = False
+            self.errors.inc()
+            self.dropped.inc(n)
+            print(f"Database error, {n} rows lost: {e}")
+        else:
+            self.ok = True
+            self.rows.inc(n)
+            self.write_ms.observe(1000 * (time.perf_counter() - start))
+            self.batch_rows.observe(n)
+            done = time.monotonic()
+            for _, count, queued in batch:
+                for _ in range(count):
+                    self.wait_ms.observe(1000 * (done - queued))
+        with self._cond:
+            self.written += n
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Waits until every row submitted so far is written. False on timeout or when the writer gave up."""
+        with self._cond:
+            target = self.submitted
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self.written >= target or self.error is not None or not self.is_alive(),
+                                timeout)
+            return self.error is None and self.written >= target
+
+    def close(self):
+        """Writes the rows still queued and stops the writer."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self.is_alive():
+            self.join()
@@ -0,0 +1,290 @@
+"""
+Declarative hazard rules, evaluated for all tracks of a frame at once.
+
+Rules are declared in JSON (HAZARD_RULES, default hazard_rules.json) and compiled once into a RuleEngine.
+Each frame the engine computes the features the active rules need as one array per feature over the
+TrajectoryStore rows of the tracks seen in the frame, then evaluates every rule as a boolean array
+expression, so a new rule costs array operations, not a loop per vehicle. A rule looks like:
+
+    {"name": "TAILGATING",                                # hazard_type it sets
+     "when": {"all": [{"feature": "velocity", "op": ">", "value": 15},
+                      {"feature": "neighbours", "radius": 60, "op": ">=", "value": 1}]},
+     "for_s": 0.0,                                        # optional: must hold this long
+     "sets": "hazard",                                    # or "aggressive" for VehicleRecord.is_aggressive
+     "streams": ["junction-1"],                           # optional: only these cameras
+     "enabled": true}
+
+Conditions combine with "all", "any" and "not"; {"zone": [[x, y], ...]} is true inside a polygon.
+Rules are applied in order, so a later rule overrides the hazard_type set by an earlier one in the same frame.
+"""
+import json
+import os
+
+import numpy as np
+
+from metrics import REGISTRY
+
+# Below this many vehicles the dense distance matrix is cheaper than building a KD-tree. scipy is imported on
+# the first crowded frame, so importing the rules (and camera) stays fast
+KDTREE_MIN_POINTS = 64
+
+# The rules analyze_behavior used to hard-code
+DEFAULT_RULES = [
+    {"name": "STALLED", "description": "Standing still (< 1 px/frame) for more than 3 s",
+     "when": {"feature": "stalled_for", "min_speed": 1.0, "op": ">", "value": 3.0}},
+    {"name": "TAILGATING", "description": "Faster than 15 px/frame with another vehicle closer than 60 px",
+     "when": {"all": [{"feature": "velocity", "op": ">", "value": 15},
+                      {"feature": "neighbours", "radius": 60, "op": ">=", "value": 1}]}},
+    {"name": "AGGRESSIVE", "description": "Drifted more than 100 px sideways over the last 10 points",
+     "sets": "aggressive", "when": {"feature": "drift", "span": 10, "op": ">", "value": 100}},
+]
+
+OPS = {">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal, "==": np.equal,
+       "!=": np.not_equal}
+ACTIONS = ("hazard", "aggressive")
+
+
+def count_within(points, positions, radius):
+    """
+    For each of `points`, how many of `positions` lie strictly closer than `radius`. Uses a KD-tree over the
+    positions when scipy is available and the frame is crowded, a dense distance matrix otherwise.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+    if len(points) == 0 or len(positions) == 0:
+        return np.zeros(len(points), dtype=int)
+    if len(positions) >= KDTREE_MIN_POINTS:
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError:
+            cKDTree = None
+        if cKDTree is not None:
+            # query_ball_point is inclusive, the rule is strict
+            return cKDTree(positions).query_ball_point(points, r=np.nextafter(radius, 0), return_length=True)
+    d = np.hypot(points[:, None, 0] - positions[None, :, 0], points[:, None, 1] - positions[None, :, 1])
+    return (d < radius).sum(axis=1)
+
+
+def points_in_polygon(points, polygon):
+    """Even-odd test of (n, 2) points against an (m, 2) polygon, looping over its edges only."""
+    x, y = points[:, 0].astype(float), points[:, 1].astype(float)
+    inside = np.zeros(len(points), dtype=bool)
+    for (x1, y1), (x2, y2) in zip(polygon, np.roll(polygon, -1, axis=0)):
+        crosses = (y1 > y) != (y2 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= crosses & (x < x_cross)
+    return inside
+
+
+def _steps(store, rows, n):
+    """Length and x component of the last n steps of each row, oldest first."""
+    window = store.window(rows, n + 1).astype(float)
+    step = np.diff(window, axis=1)
+    return np.hypot(step[..., 0], step[..., 1]), step[..., 0]
+
+
+# Feature name -> (default parameters, fn(store, rows, now, **params) -> one value per row). Rows always hold at
+# least 2 points; features needing a longer history return 0 until the track has it.
+def _velocity(store, rows, now):
+    return store.velocity(rows)
+
+
+def _heading(store, rows, now):
+    return store.heading(rows)
+
+
+def _heading_error(store, rows, now, direction):
+    """Angle in degrees (0-180) between the last step and the expected direction of travel."""
+    return np.abs((store.heading(rows) - direction + 180) % 360 - 180)
+
+
+def _drift(store, rows, now, span):
+    return store.drift(rows, span)
+
+
+def _stalled_for(store, rows, now, min_speed):
+    return store.stall_seconds(rows, now, min_speed)
+
+
+def _neighbours(store, rows, now, radius):
+    """Other live vehicles closer than `radius` px."""
+    return count_within(store.point(rows), store.last_points(), radius) - 1
+
+
+def _decel(store, rows, now, span):
+    """How much slower (px/frame) the last step is than the step `span` frames earlier."""
+    speed, _ = _steps(store, rows, span + 1)
+    return np.where(store.count[rows] >= span + 2, speed[:, 0] - speed[:, -1], 0.0)
+
+
+def _weave(store, rows, now, span, min_step):
+    """Reversals of the sideways movement over the last `span` points, ignoring steps under `min_step` px."""
+    _, dx = _steps(store, rows, span - 1)
+    sign = np.where(np.abs(dx) >= min_step, np.sign(dx), 0)
+    # Carry the last sideways direction over the small steps, so a pause between two moves is not a reversal
+    last = np.maximum.accumulate(np.where(sign != 0, np.arange(sign.shape[1]), 0), axis=1)
+    sign = np.take_along_axis(sign, last, axis=1)
+    reversals = (sign[:, 1:] * sign[:, :-1] < 0).sum(axis=1)
+    return np.where(store.count[rows] >= span, reversals, 0)
+
+
+def _x(store, rows, now):
+    return store.point(rows)[:, 0]
+
+
+def _y(store, rows, now):
+    return store.point(rows)[:, 1]
+
+
+FEATURES = {
+    "velocity": ({}, _velocity),
+    "heading": ({}, _heading),
+    "heading_error": ({"direction": 90.0}, _heading_error),
+    "drift": ({"span": 10}, _drift),
+    "stalled_for": ({"min_speed": 1.0}, _stalled_for),
+    "neighbours": ({"radius": 60}, _neighbours),
+    "decel": ({"span": 5}, _decel),
+    "weave": ({"span": 20, "min_step": 2}, _weave),
+    "x": ({}, _x),
+    "y": ({}, _y),
+}
+
+
+def _feature_key(cond):
+    name = cond["feature"]
+    if name not in FEATURES:
+        raise ValueError(f"Unknown hazard rule feature {name!r}, expected one of {sorted(FEATURES)}")
+    defaults, _ = FEATURES[name]
+    params = {k: cond.get(k, v) for k, v in defaults.items()}
+    return name + ''.join(f",{k}={v}" for k, v in sorted(params.items())), name, params
+
+
+def _compile(cond, keys):
+    """
+    Compiles a condition into fn(features, points) -> boolean array, adding the feature keys it reads to
+    `keys` (key -> (name, params)).
+    """
+    if "all" in cond or "any" in cond:
+        parts = [_compile(c, keys) for c in cond.get("all", cond.get("any"))]
+        reduce = np.logical_and if "all" in cond else np.logical_or
+        return lambda features, points: reduce.reduce([p(features, points) for p in parts])
+    if "not" in cond:
+        part = _compile(cond["not"], keys)
+        return lambda features, points: ~part(features, points)
+    if "zone" in cond:
+        polygon = np.asarray(cond["zone"], dtype=float)
+        if polygon.ndim != 2 or polygon.shape[0] < 3 or polygon.shape[1] != 2:
+            raise ValueError(f"Hazard rule zone must be a list of at least 3 [x, y] points: {cond['zone']}")
+        return lambda features, points: points_in_polygon(points, polygon)
+    if "feature" not in cond:
+        raise ValueError(f"Hazard rule condition needs all/any/not/zone/feature: {cond}")
+    if cond.get("op") not in OPS:
+        raise ValueError(f"Unknown hazard rule operator {cond.get('op')!r}, expected one of {sorted(OPS)}")
+    key, name, params = _feature_key(cond)
+    keys[key] = (name, params)
+    op, value = OPS[cond["op"]], cond["value"]
+    return lambda features, points: op(features[key], value)
+
+
+class Rule:
+    def __init__(self, spec):
+        self.name = spec["name"]
+        self.sets = spec.get("sets", "hazard")
+        if self.sets not in ACTIONS:
+            raise ValueError(f"Hazard rule {self.name}: 'sets' must be one of {ACTIONS}")
+        self.for_s = float(spec.get("for_s", 0.0))
+        self.streams = set(spec["streams"]) if spec.get("streams") else None
+        self.features = {}
+        self.condition = _compile(spec["when"], self.features)
+        self.eval_ms = REGISTRY.histogram('hazard_rule_ms', 'Latency of evaluating one hazard rule over a frame',
+                                          {"rule": self.name})
+        self.fired = REGISTRY.counter('hazard_rule_fired_total', 'Tracks a hazard rule fired on',
+                                      {"rule": self.name})
+
+    def applies(self, stream):
+        return self.streams is None or stream in self.streams
+
+
+class RuleEngine:
+    """Compiled hazard rules. evaluate() applies them to the tracks of one frame."""
+    def __init__(self, rules=None):
+        specs = [r for r in (DEFAULT_RULES if rules is None else rules) if r.get("enabled", True)]
+        self.rules = [Rule(spec) for spec in specs]
+        names = [rule.name for rule in self.rules]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate hazard rule names in {names}")
+        self.feature_ms = {}
+        self._active = {}  # stream -> (rules, feature keys)
+
+    def _plan(self, stream):
+        if stream not in self._active:
+            rules = [rule for rule in self.rules if rule.applies(stream)]
+            keys = {}
+            for rule in rules:
+                keys.update(rule.features)
+            self._active[stream] = (rules, keys)
+        return self._active[stream]
+
+    def _feature_timer(self, key):
+        if key not in self.feature_ms:
+            self.feature_ms[key] = REGISTRY.histogram('hazard_feature_ms',
+                                                      'Latency of computing one hazard feature over a frame',
+                                                      {"feature": key})
+        return self.feature_ms[key].time()
+
+    def evaluate(self, records, store, now, stream=None):
+        """
+        Applies the rules to `records`, the VehicleRecords seen in this frame, whose trajectories live in
+        `store` (a TrajectoryStore). Tracks with fewer than 2 points are skipped.
+        """
+        rules, keys = self._plan(stream)
+        if not records or not rules:
+            return
+        rows = np.array([r.row for r in records], dtype=np.intp)
+        ready = store.count[rows] >= 2
+        if not ready.any():
+            return
+        if not ready.all():
+            records = [r for r, ok in zip(records, ready.tolist()) if ok]
+            rows = rows[ready]
+
+        features = {}
+        for key, (name, params) in keys.items():
+            with self._feature_timer(key):
+                features[key] = FEATURES[name][1](store, rows, now, **params)
+        points = store.point(rows)
+
+        for rule in rules:
+            with rule.eval_ms.time():
+                fired = rule.condition(features, points)
+                if rule.for_s > 0:
+                    since = store.column(f"rule:{rule.name}")
+                    start = np.where(fired, np.where(np.isnan(since[rows]), now, since[rows]), np.nan)
+                    since[rows] = start
+                    fired = fired & (now - start >= rule.for_s)
+                hits = np.flatnonzero(fired).tolist()
+            if not hits:
+                continue
+            rule.fired.inc(len(hits))
+            if rule.sets == "aggressive":
+                for i in hits:
+                    records[i].is_aggressive = True
+            else:
+                for i in hits:
+                    records[i].hazard_type = rule.name
+
+    def report(self):
+        """(name, mean ms) of every feature and rule evaluated so far, costliest first."""
+        costs = [(f"feature {key}", h.mean()) for key, h in self.feature_ms.items()]
+        costs += [(f"rule {rule.name}", rule.eval_ms.mean()) for rule in self.rules]
+        return sorted(costs, key=lambda item: -item[1])
+
+
+def load_rules(path):
+    """Rule specs from a JSON file holding a list of rules or {"rules": [...]}; DEFAULT_RULES if it is missing."""
+    if not path or not os.path.exists(path):
+        return DEFAULT_RULES
+    with open(path) as f:
+        config = json.load(f)
+    return config["rules"] if isinstance(config, dict) else config
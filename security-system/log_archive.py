@@ -0,0 +1,318 @@
+"""
+Daily partitions, retention and the Parquet archive of the detector's logs, and one query layer over both.
+
+The SQLite database only keeps the last `hot_days` days. Older rows of vehicle_logs, vehicle_tracks and
+zone_counts are compacted by DuckDB into one Parquet file per table and (local) day:
+
+    logs_/archive/<table>/day=YYYY-MM-DD/<table>-<first id>.parquet
+
+and then deleted from SQLite, whose free pages the new rows reuse, so the database file stays at about
+`hot_days` of traffic. Archived days older than `retention_days` (RETENTION_DAYS by default) are deleted, and
+the fine vehicle_rollups buckets are trimmed (ROLLUP_RETENTION_DAYS), which keeps the edge box's disk bounded.
+Old rows are found through SQLite's indexes (ts_ms, and the day columns of the other tables) and copied with
+sqlite_query(), which runs the day's WHERE inside SQLite: DuckDB's SQLite scanner does not push filters down.
+
+history() opens a DuckDB connection whose vehicle_logs, vehicle_tracks and zone_counts views union the hot
+SQLite tables with their archive, with a `day` column ('YYYY-MM-DD'): a filter on `day` only reads the
+archived days it keeps. Queries run inside DuckDB over the files, so months of history are filtered and
+aggregated without first being loaded into pandas.
+
+query_logs() runs one query through history(), or on SQLite alone (hot days only, with its indexes), and returns
+a pandas DataFrame. newest_logs() pages through vehicle_logs newest first: SQLite answers from its ts_ms index
+and only as many archived days are read as the page needs. Without duckdb both run on SQLite alone.
+
+Needs duckdb 1.1 or later and its sqlite extension. DuckDB installs the extension on first use; offline boxes run
+`python -c "import duckdb; duckdb.sql('INSTALL sqlite')"` once while provisioning.
+"""
+import argparse
+import glob
+import importlib.util
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+
+from db_schema import SCHEMA_VERSION, schema_version
+from metrics import REGISTRY
+
+DB_PATH = '../logs_/traffic_security.db'
+ARCHIVE_DIR = '../logs_/archive'
+# Archived table -> its local-time text column ('YYYY-MM-DD HH:MM:SS') that decides the row's day
+ARCHIVED_TABLES = {"vehicle_logs": "timestamp", "vehicle_tracks": "last_seen", "zone_counts": "period_end"}
+# Tables whose old rows are selected by their indexed epoch-ms column instead of the day column
+EPOCH_MS_COLUMNS = {"vehicle_logs": "ts_ms"}
+# Days an archived day is kept by default
+RETENTION_DAYS = 90
+# vehicle_rollups resolution (s) -> days its buckets are kept, None for ever. Each covers the dashboard
+# windows that read it (see Overview.py)
+ROLLUP_RETENTION_DAYS = {5: 2, 60: 30, 3600: None}
+
+
+def _quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _midnight_ms(day):
+    """Epoch milliseconds of the local midnight starting `day` (YYYY-MM-DD)."""
+    return int(time.mktime(date.fromisoformat(day).timetuple())) * 1000
+
+
+def day_range(table, start=None, end=None):
+    """
+    SQL condition selecting the rows of `table` from day `start` up to, not including, day `end` (either may be
+    None) through an indexed column. Literals only, so it also runs inside sqlite_query().
+    """
+    conditions = []
+    if table in EPOCH_MS_COLUMNS:
+        column = EPOCH_MS_COLUMNS[table]
+        bounds = [(op, str(_midnight_ms(day))) for op, day in ((">=", start), ("<", end)) if day is not None]
+    else:
+        column = ARCHIVED_TABLES[table]
+        bounds = [(op, _quote(day)) for op, day in ((">=", start), ("<", end)) if day is not None]
+    for op, value in bounds:
+        conditions.append(f"{column} {op} {value}")
+    return " AND ".join(conditions) or "TRUE"
+
+
+def duckdb_available():
+    """Whether duckdb is installed, without paying for its import."""
+    return importlib.util.find_spec("duckdb") is not None
+
+
+def connect_duckdb(db_path):
+    """In-memory DuckDB connection with the SQLite database attached read-only as `hot`."""
+    # Imported on first use: it takes a noticeable part of the detector's startup
+    try:
+        import duckdb
+    except ImportError:
+        raise RuntimeError("The log archive needs duckdb (pip install duckdb)") from None
+    con = duckdb.connect()
+    con.execute("LOAD sqlite")
+    con.execute(f"ATTACH {_quote(os.path.abspath(db_path))} AS hot (TYPE sqlite, READ_ONLY)")
+    return con
+
+
+def archive_files(archive_dir, table, day="*"):
+    return os.path.join(archive_dir, table, f"day={day}", "*.parquet")
+
+
+def archived_days(archive_dir, table):
+    """The archived days (YYYY-MM-DD) of `table`, newest first."""
+    return sorted((os.path.basename(directory)[len("day="):]
+                   for directory in glob.glob(os.path.join(archive_dir, table, "day=*"))), reverse=True)
+
+
+def read_archive(files):
+    """DuckDB table expression reading Parquet `files`, with the `day` of each file's directory as a column."""
+    return (f"read_parquet({_quote(os.path.abspath(files))}, union_by_name = true, hive_partitioning = true, "
+            f"hive_types_autocast = false)")
+
+
+def history(db_path=DB_PATH, archive_dir=ARCHIVE_DIR):
+    """
+    DuckDB connection over all of the logs: the views vehicle_logs, vehicle_tracks and zone_counts hold the hot
+    SQLite rows and the archived Parquet days (columns matched by name, so days archived before a migration
+    read NULL for its new columns) plus their `day`, on which filters skip the archived days they exclude;
+    vehicle_rollups is the SQLite table.
+    """
+    con = connect_duckdb(db_path)
+    for table, column in ARCHIVED_TABLES.items():
+        sources = [f"SELECT *, substr({column}, 1, 10) AS day FROM hot.{table}"]
+        files = archive_files(archive_dir, table)
+        if glob.glob(files):
+            sources.append(f"SELECT * FROM {read_archive(files)}")
+        con.execute(f"CREATE VIEW {table} AS " + " UNION ALL BY NAME ".join(sources))
+    con.execute("CREATE VIEW vehicle_rollups AS SELECT * FROM hot.vehicle_rollups")
+    return con
+
+
+def query_logs(db_path, archive_dir, sql, params=(), archived=True):
+    """
+    Runs one query over all of the logs (see history()) and returns its rows as a pandas DataFrame. With
+    archived=False, or without duckdb, the query runs on the SQLite database alone, with its indexes, i.e. over
+    the days not archived yet.
+    """
+    if not archived or not duckdb_available():
+        import pandas as pd
+        conn = sqlite3.connect(db_path)
+        try:
+            return pd.read_sql_query(sql, conn, params=list(params))
+        finally:
+            conn.close()
+    con = history(db_path, archive_dir)
+    try:
+        return con.execute(sql, list(params)).df()
+    finally:
+        con.close()
+
+
+def newest_logs(db_path, archive_dir, columns, where="TRUE", params=(), limit=100, offset=0):
+    """
+    Rows `offset` to `offset + limit` of vehicle_logs matching `where`, newest first, as a pandas DataFrame.
+    SQLite answers first through its ts_ms index; archived days are then read newest first, one day at a time,
+    only until the page is full, so the cost follows the page and not the length of the history.
+    """
+    import pandas as pd
+    select = f"SELECT {columns} FROM {{source}} WHERE {where} ORDER BY ts_ms DESC LIMIT ? OFFSET ?"
+    conn = sqlite3.connect(db_path)
+    try:
+        page = pd.read_sql_query(select.format(source="vehicle_logs"), conn, params=[*params, limit, offset])
+        if len(page) == limit or not duckdb_available():
+            return page
+        # Matches in SQLite that this page skips; the rest of `offset` falls into the archive
+        hot = conn.execute(f"SELECT COUNT(*) FROM vehicle_logs WHERE {where}", list(params)).fetchone()[0]
+    finally:
+        conn.close()
+    skip = max(0, offset - hot)
+    frames = [page]
+    con = connect_duckdb(db_path)
+    try:
+        for day in archived_days(archive_dir, "vehicle_logs"):
+            wanted = limit - sum(len(frame) for frame in frames)
+            if wanted <= 0:
+                break
+            source = read_archive(archive_files(archive_dir, "vehicle_logs", day))
+            if skip:
+                matches = con.execute(f"SELECT COUNT(*) FROM {source} WHERE {where}", list(params)).fetchone()[0]
+                if matches <= skip:
+                    skip -= matches
+                    continue
+            frames.append(con.execute(select.format(source=source), [*params, wanted, skip]).df())
+            skip = 0
+    finally:
+        con.close()
+    return pd.concat(frames, ignore_index=True)
+
+
+def alert_count(db_path, archive_dir):
+    """
+    Suspicious vehicles held in SQLite and the archive, summed from the hourly vehicle_rollups (kept for ever) from
+    the hour holding the oldest archived day on, so it reads a few rows per hour of history and no log row.
+    """
+    days = archived_days(archive_dir, "vehicle_logs")
+    since_ms = _midnight_ms(days[-1]) // 3600000 * 3600000 if days else 0
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COALESCE(SUM(count), 0) FROM vehicle_rollups "
+                            "WHERE resolution_s = 3600 AND is_suspicious = 1 AND bucket_ms >= ?",
+                            (since_ms,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+class LogArchiver(threading.Thread):
+    """
+    Every `interval_s` moves the days older than `hot_days` from SQLite to the Parquet archive, deletes archived
+    days older than `retention_days` (None keeps them) and trims vehicle_rollups. run_once() does one pass.
+    """
+    def __init__(self, db_path=DB_PATH, archive_dir=ARCHIVE_DIR, hot_days=7, retention_days=RETENTION_DAYS,
+                 interval_s=3600):
+        super().__init__(name="log-archiver", daemon=True)
+        if hot_days < 1:
+            raise ValueError(f"hot_days must be at least 1, not {hot_days}")
+        self.db_path = db_path
+        self.archive_dir = archive_dir
+        self.hot_days = hot_days
+        self.retention_days = retention_days
+        self.interval_s = interval_s
+        self._done = threading.Event()
+        self.run_ms = REGISTRY.histogram('archive_run_ms', 'Latency of one log archive pass')
+        self._rows = {table: REGISTRY.counter('archive_rows_total', 'Rows moved from SQLite to Parquet',
+                                              {"table": table}) for table in ARCHIVED_TABLES}
+
+    def run(self):
+        while not self._done.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Log archive pass failed: {e}")
+            self._done.wait(self.interval_s)
+
+    def stop(self):
+        self._done.set()
+        if self.is_alive():
+            self.join()
+
+    def run_once(self, now=None):
+        """One pass. Returns {table: rows archived}."""
+        now = time.time() if now is None else now
+        today = date.fromtimestamp(now)
+        cutoff = (today - timedelta(days=self.hot_days)).isoformat()
+        archived = {}
+        with self.run_ms.time():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            if schema_version(conn) < SCHEMA_VERSION:
+                conn.close()  # the DB writer has not created or migrated the schema yet
+                return archived
+            con = connect_duckdb(self.db_path)
+            try:
+                for table, column in ARCHIVED_TABLES.items():
+                    days = [day for (day,) in conn.execute(f"SELECT DISTINCT substr({column}, 1, 10) FROM {table} "
+                                                           f"WHERE {day_range(table, end=cutoff)}")]
+                    archived[table] = sum(self._archive_day(conn, con, table, day) for day in sorted(days))
+                self._trim_rollups(conn, now)
+            finally:
+                con.close()
+                conn.close()
+            if self.retention_days is not None:
+                self._expire((today - timedelta(days=self.retention_days)).isoformat())
+        return archived
+
+    def _archive_day(self, conn, con, table, day):
+        """Writes the SQLite rows of `day` to Parquet, then deletes them. Returns the number of rows moved."""
+        end = (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+        where = day_range(table, day, end)
+        first, last, n = conn.execute(f"SELECT min(id), max(id), count(*) FROM {table} WHERE {where}").fetchone()
+        if not n:
+            return 0
+        # Rows logged later for the same day (e.g. a replayed recording) have higher IDs and go to another file;
+        # a pass interrupted before the DELETE rewrites the same file
+        where = f"id BETWEEN {int(first)} AND {int(last)} AND {where}"
+        directory = os.path.join(self.archive_dir, table, f"day={day}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{table}-{first}.parquet")
+        # The WHERE runs inside SQLite with its indexes; sqlite_query() returns text, cast back to the table's types
+        columns = ", ".join(f'CAST("{name}" AS {sql_type}) AS "{name}"'
+                            for name, sql_type, *_ in con.execute(f"DESCRIBE hot.{table}").fetchall())
+        query = _quote(f"SELECT * FROM {table} WHERE {where} ORDER BY id")
+        con.execute(f"COPY (SELECT {columns} FROM sqlite_query('hot', {query})) TO {_quote(path + '.tmp')} "
+                    f"(FORMAT parquet, COMPRESSION zstd)")
+        os.replace(path + '.tmp', path)
+        with conn:
+            conn.execute(f"DELETE FROM {table} WHERE {where}")
+        self._rows[table].inc(n)
+        return n
+
+    def _trim_rollups(self, conn, now):
+        with conn:
+            for resolution_s, days in ROLLUP_RETENTION_DAYS.items():
+                if days is not None:
+                    conn.execute("DELETE FROM vehicle_rollups WHERE resolution_s = ? AND bucket_ms < ?",
+                                 (resolution_s, int((now - days * 86400) * 1000)))
+
+    def _expire(self, before):
+        """Deletes the archived days before `before` (YYYY-MM-DD)."""
+        for table in ARCHIVED_TABLES:
+            for directory in glob.glob(os.path.join(self.archive_dir, table, "day=*")):
+                if os.path.basename(directory)[len("day="):] < before:
+                    shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Archive old NetraFlow logs to Parquet or query all of them')
+    parser.add_argument('--db', default=DB_PATH, help='SQLite database of the detector')
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR, help='Root of the Parquet archive')
+    parser.add_argument('--hot-days', type=int, default=7, help='Days kept in SQLite')
+    parser.add_argument('--retention-days', type=int, default=RETENTION_DAYS,
+                        help=f'Days kept in the archive, 0 for ever [{RETENTION_DAYS}]')
+    parser.add_argument('--query', help='Run this DuckDB SQL over the hot and archived logs instead of archiving')
+    args = parser.parse_args()
+
+    if args.query:
+        print(history(args.db, args.archive_dir).sql(args.query))
+    else:
+        archiver = LogArchiver(args.db, args.archive_dir, args.hot_days, args.retention_days or None)
+        for table, n in archiver.run_once().items():
+            print(f"{table}: {n} rows archived")
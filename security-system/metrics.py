@@ -0,0 +1,256 @@
+"""
+In-process metrics for the detector: counters, gauges and latency histograms.
+
+Everything registers in REGISTRY, which the HUD reads directly and serve() exports over HTTP:
+    /metrics       Prometheus text exposition format
+    /metrics.json  JSON snapshot of the same values
+STARTUP records how long the process took to reach each startup milestone (models warm, first frame, ...).
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in milliseconds; the last bucket is +Inf
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in sorted(labels.items())) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """A value that goes up and down; `fn` makes it read its value from elsewhere at export time."""
+    kind = 'gauge'
+
+    def __init__(self, fn=None):
+        self.fn = fn
+        self._value = 0
+        self._lock = threading.Lock()
+
+    @property
+    def value(self):
+        return self.fn() if self.fn else self._value
+
+    def set(self, value):
+        self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.last = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            i = 0
+            while i < len(self.buckets) and value > self.buckets[i]:
+                i += 1
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+            self.last = value
+
+    def time(self):
+        """Context manager observing the elapsed milliseconds of its block."""
+        return _Timer(self)
+
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (bucket resolution only)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float('inf')
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(1000 * (time.perf_counter() - self.start))
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self, prefix='netraflow_'):
+        self.prefix = prefix
+        self._metrics = {}   # name -> (help, kind, {labels tuple: metric})
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            _, kind, series = self._metrics.setdefault(name, (help_text, cls.kind, {}))
+            if kind != cls.kind:
+                raise ValueError(f"Metric {name} already registered as a {kind}")
+            if key not in series:
+                series[key] = cls(**kwargs)
+            elif kwargs.get('fn') is not None:
+                series[key].fn = kwargs['fn']
+            return series[key]
+
+    def counter(self, name, help_text='', labels=None):
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text='', labels=None, fn=None):
+        return self._get(Gauge, name, help_text, labels, fn=fn)
+
+    def histogram(self, name, help_text='', labels=None, buckets=LATENCY_BUCKETS_MS):
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def remove(self, labels):
+        """Drops every series carrying these labels, e.g. when a stream finishes."""
+        items = set(labels.items())
+        with self._lock:
+            for _, _, series in self._metrics.values():
+                for key in [k for k in series if items <= set(k)]:
+                    del series[key]
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            metrics = [(name, help_text, kind, dict(series)) for name, (help_text, kind, series) in self._metrics.items()]
+        for name, help_text, kind, series in metrics:
+            full = self.prefix + name
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            for key, metric in series.items():
+                labels = dict(key)
+                if kind == 'histogram':
+                    cumulative = 0
+                    for bound, n in zip(metric.buckets + ('+Inf',), metric.counts):
+                        cumulative += n
+                        lines.append(f"{full}_bucket{_label_text({**labels, 'le': bound})} {cumulative}")
+                    lines.append(f"{full}_sum{_label_text(labels)} {metric.sum}")
+                    lines.append(f"{full}_count{_label_text(labels)} {metric.count}")
+                else:
+                    lines.append(f"{full}{_label_text(labels)} {metric.value}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        out = {}
+        with self._lock:
+            metrics = [(name, kind, dict(series)) for name, (_, kind, series) in self._metrics.items()]
+        for name, kind, series in metrics:
+            rows = []
+            for key, metric in series.items():
+                row = {"labels": dict(key)}
+                if kind == 'histogram':
+                    row.update(count=metric.count, sum=metric.sum, mean=metric.mean(), last=metric.last,
+                               p50=metric.quantile(0.5), p95=metric.quantile(0.95), p99=metric.quantile(0.99))
+                else:
+                    row["value"] = metric.value
+                rows.append(row)
+            out[name] = {"type": kind, "series": rows}
+        return out
+
+
+REGISTRY = MetricsRegistry()
+
+
+class StartupProfile:
+    """
+    Seconds from process start to each startup milestone, in the order they were reached. Each milestone is
+    recorded once and exported as the startup_seconds gauge.
+    """
+    def __init__(self, t0=None, registry=REGISTRY):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.registry = registry
+        self.marks = {}
+        self.print_phase = None
+        self._lock = threading.Lock()
+
+    def mark(self, phase):
+        with self._lock:
+            if phase in self.marks:
+                return
+            elapsed = time.perf_counter() - self.t0
+            self.marks[phase] = elapsed
+        self.registry.gauge('startup_seconds', 'Seconds from process start to a startup milestone',
+                            {"phase": phase}).set(elapsed)
+        if phase == self.print_phase:
+            print(self.report())
+
+    def report(self):
+        lines = ["Startup profile:"]
+        previous = 0.0
+        for phase, elapsed in sorted(self.marks.items(), key=lambda item: item[1]):
+            lines.append(f"  {phase:<20}{elapsed:8.3f}s  (+{elapsed - previous:.3f}s)")
+            previous = elapsed
+        return '\n'.join(lines)
+
+
+STARTUP = StartupProfile()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.startswith('/metrics.json'):
+            body = json.dumps(self.registry.snapshot(), default=str).encode()
+            content_type = 'application/json'
+        elif self.path.startswith('/metrics'):
+            body = self.registry.render_prometheus().encode()
+            content_type = 'text/plain; version=0.0.4'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port, host='127.0.0.1', registry=REGISTRY):
+    """Starts the metrics HTTP server on a daemon thread and returns it."""
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    print(f"Metrics on http://{host}:{port}/metrics and /metrics.json")
+    return server
@@ -0,0 +1,152 @@
+"""
+Bounded queues and worker stages used to overlap decode, detection, tracking and rendering.
+
+Each stage runs in its own thread and hands packets to the next stage through a FrameQueue.
+When a consumer falls behind, the queue applies a backpressure policy:
+    drop_oldest - discard the stalest queued packet to make room (lowest latency, live cameras)
+    drop_newest - discard the incoming packet and keep what is already queued
+    block       - wait for room (every frame is processed, recorded footage)
+"""
+import queue
+import threading
+import time
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+BLOCK = 'block'
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+# Marks the end of the stream; never dropped by a queue
+END_OF_STREAM = object()
+
+
+class FrameQueue:
+    def __init__(self, name, maxsize=4, policy=BLOCK):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy '{policy}', expected one of {POLICIES}")
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize)
+
+    def put(self, item, stop_event=None):
+        """
+        Queues an item according to the backpressure policy. Returns False if it was dropped. A blocking put
+        gives up once `stop_event` is set, so a stage whose consumer stopped reading can still exit.
+        """
+        if self.policy == BLOCK:
+            while stop_event is None or not stop_event.is_set():
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return True
+            except queue.Full:
+                if self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def close(self, stop_event):
+        """Delivers END_OF_STREAM even when the queue is full, unless the pipeline is shutting down."""
+        while not stop_event.is_set():
+            try:
+                self._queue.put(END_OF_STREAM, timeout=0.1)
+                return
+            except queue.Full:
+                if self.policy == DROP_OLDEST:
+                    try:
+                        self._queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def get(self, timeout=None):
+        return self._queue.get(timeout=timeout)
+
+    def drain(self):
+        """Discards everything queued, e.g. once nobody reads the queue any more."""
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def depth(self):
+        return self._queue.qsize()
+
+
+class Stage(threading.Thread):
+    """
+    Pulls packets from `inbox`, runs `fn` on them and pushes the result to `outbox`.
+    A source stage has no inbox: `fn` is called with no argument and returns None at the end of the stream.
+    `latency`, a metrics.Histogram, receives the service time of every packet in milliseconds.
+    A stage that crashes keeps its exception in `error` and sets `stop_event`, so the stages feeding it stop
+    instead of blocking on its full inbox.
+    """
+    def __init__(self, name, fn, inbox, outbox, stop_event, latency=None):
+        super().__init__(name=name, daemon=True)
+        self.latency = latency
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stop_event = stop_event
+        self.processed = 0
+        self.busy_time = 0.0
+        self.error = None
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                if self.inbox is None:
+                    item = None
+                else:
+                    try:
+                        item = self.inbox.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    if item is END_OF_STREAM:
+                        break
+
+                start = time.perf_counter()
+                result = self.fn() if self.inbox is None else self.fn(item)
+                elapsed = time.perf_counter() - start
+                self.busy_time += elapsed
+                self.processed += 1
+                if self.latency is not None:
+                    self.latency.observe(1000 * elapsed)
+
+                if result is None:
+                    if self.inbox is None:
+                        break
+                    continue
+                self.outbox.put(result, self.stop_event)
+        except Exception as e:
+            print(f"Stage '{self.name}' crashed: {e}")
+            self.error = e
+            self.stop_event.set()
+            raise
+        finally:
+            self.outbox.close(self.stop_event)
+
+    def avg_ms(self):
+        return 1000 * self.busy_time / self.processed if self.processed else 0.0
+
+
+def status_lines(stages):
+    """One line per stage with its output queue depth, drop count and average service time."""
+    lines = []
+    for stage in stages:
+        q = stage.outbox
+        lines.append(f"{stage.name}: q {q.depth()}/{q.maxsize} drop {q.dropped} {stage.avg_ms():.1f}ms")
+    return lines
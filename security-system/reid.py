@@ -0,0 +1,132 @@
+"""
+Short-term appearance re-identification.
+
+When SORT loses a vehicle (occlusion behind a bus, a missed detection burst) it re-creates it with a new ID,
+which used to color-classify, log and upload the same vehicle twice. Each vehicle crossing the line gets a
+cheap appearance embedding from the crop that is already cut for the color model; a new track about to be
+classified is first compared with the tracks lost in the last few seconds, and merged into the best match.
+"""
+import time
+
+import cv2
+import numpy as np
+
+from metrics import REGISTRY
+
+HIST_BINS = (8, 8, 4)  # hue, saturation, value
+
+
+def color_embedding(crop):
+    """
+    Unit-length square root of the HSV color histogram of a BGR crop, so the dot product of two embeddings is
+    their Bhattacharyya coefficient (1.0 for identical histograms).
+    """
+    hsv = cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1, 2], None, HIST_BINS, [0, 180, 0, 256, 0, 256]).ravel()
+    total = hist.sum()
+    if total == 0:
+        return np.zeros(hist.size, dtype=np.float32)
+    return np.sqrt(hist / total).astype(np.float32)
+
+
+class ReIdGallery:
+    """
+    Embeddings of the recently classified vehicles of one stream. match() only considers vehicles whose track
+    SORT has retired (see retire()), that were last seen before the new track appeared, at most `ttl_s` seconds
+    ago and `max_distance_px` away, and look at least `threshold` alike. A track that only missed a detection
+    or two is still alive and never offered, so two vehicles side by side are not merged. A matched entry is
+    consumed, so a vehicle is merged at most once.
+    """
+    def __init__(self, name, ttl_s=5.0, threshold=0.85, max_distance_px=200, max_size=256):
+        self.ttl_s = ttl_s
+        self.threshold = threshold
+        self.max_distance_px = max_distance_px
+        self.max_size = max_size
+        self._records = []
+        self._embeddings = np.zeros((0, int(np.prod(HIST_BINS))), dtype=np.float32)
+        self._retired = np.zeros(0, dtype=bool)
+        labels = {"stream": name}
+        self.query_ms = REGISTRY.histogram('reid_ms', 'Latency of embedding a crop and querying the re-ID gallery',
+                                           labels)
+        self.merges = REGISTRY.counter('reid_merges_total', 'New tracks merged into a recently lost vehicle', labels)
+        REGISTRY.gauge('reid_gallery_size', 'Vehicles in the re-ID gallery', labels, fn=lambda: len(self._records))
+
+    def __len__(self):
+        return len(self._records)
+
+    def add(self, record, embedding):
+        record.embedding = embedding
+        self._records.append(record)
+        self._embeddings = np.vstack((self._embeddings, embedding[None, :]))
+        self._retired = np.append(self._retired, False)
+        if len(self._records) > self.max_size:
+            self._keep(np.arange(len(self._records)) >= len(self._records) - self.max_size)
+
+    def _keep(self, keep):
+        self._records = [r for r, k in zip(self._records, keep) if k]
+        self._embeddings = self._embeddings[keep]
+        self._retired = self._retired[keep]
+
+    def retire(self, ids):
+        """Marks the vehicles whose tracks SORT retired (Sort.pop_retired) as lost, i.e. candidates for a merge."""
+        ids = set(ids)
+        if ids and self._records:
+            self._retired |= np.array([r.id in ids for r in self._records])
+
+    def match(self, embedding, center, first_seen, now=None):
+        """
+        The lost VehicleRecord that the vehicle at `center` with this embedding, tracked since `first_seen`, most
+        likely is, or None.
+        """
+        now = time.time() if now is None else now
+        if not self._records:
+            return None
+        last_seen = np.array([r.last_seen for r in self._records])
+        fresh = now - last_seen <= self.ttl_s
+        if not fresh.all():
+            self._keep(fresh)
+            last_seen = last_seen[fresh]
+            if not self._records:
+                return None
+
+        lost = self._retired & (last_seen < first_seen)
+        last_pos = np.array([r.trajectory[-1] if len(r.trajectory) else (np.inf, np.inf) for r in self._records],
+                            dtype=float)
+        near = np.hypot(last_pos[:, 0] - center[0], last_pos[:, 1] - center[1]) <= self.max_distance_px
+        similarity = np.where(lost & near, self._embeddings @ embedding, -1.0)
+        best = int(np.argmax(similarity))
+        if similarity[best] < self.threshold:
+            return None
+        record = self._records[best]
+        keep = np.ones(len(self._records), dtype=bool)
+        keep[best] = False
+        self._keep(keep)
+        self.merges.inc()
+        return record
+
+
+def merge_into(record, lost):
+    """Carries the logging state of a lost vehicle over to the new track that re-identified it."""
+    record.reid_of = lost.id
+    record.first_seen = lost.first_seen
+    record.crossed_at = lost.crossed_at
+    record.confidence = lost.confidence
+    record.color = lost.color
+    record.logged = lost.logged
+    record.uploaded = lost.uploaded
+    # A pending color result still goes to the lost record, which logs the vehicle once and passes the result
+    # on to this track (share_result)
+    record.color_queued = True
+    record.is_blacklisted = lost.is_blacklisted
+    lost.merged_into = record
+
+
+def share_result(record):
+    """Copies the color result of `record` to the tracks merged into it, which show it for the rest of their life."""
+    follower = record.merged_into
+    while follower is not None:
+        follower.color = record.color
+        follower.logged = record.logged
+        follower.uploaded = record.uploaded
+        follower.is_blacklisted = record.is_blacklisted
+        follower = follower.merged_into
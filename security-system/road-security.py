@@ -1,373 +1,293 @@
-from ultralytics import YOLO
-import cv2
-import numpy as np
-import math
-import cvzone
-from sort import *
-from datetime import datetime
-import sqlite3
-from contextlib import contextmanager
 import time
-import threading
+STARTED = time.perf_counter()  # origin of the --profile-startup timings
+
+import argparse
+import cv2
+import glob
+import json
 import os
-import io
+import queue
 from dotenv import load_dotenv
 load_dotenv()
 
-import boto3
-from botocore.exceptions import NoCredentialsError
-
-cap = cv2.VideoCapture('../assets/vecteezy_traffic-Danil_Rudenko.mp4')
-wd = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-ht = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-mask = cv2.imread('../assets/mask.png')
-if mask is None:
-    print("NO mask found!")
-    exit()
-mask = cv2.resize(mask, (wd,ht))
-
-#models
-coco_model = YOLO('../YOLO-weights/yolov8s.pt')
-color_model = YOLO("../YOLO-weights/predict-color.pt")
-
-#section classes
-classNames = [
-    "person", "bicycle", "car", "motorbike", "airplane", "bus", "train", "truck", "boat",
-    "traffic light", "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat",
-    "dog", "horse", "sheep", "cow", "elephant", "bear", "zebra", "giraffe", "backpack",
-    "umbrella", "handbag", "tie", "suitcase", "frisbee", "skis", "snowboard", "sports ball",
-    "kite", "baseball bat", "baseball glove", "skateboard", "surfboard", "tennis racket",
-    "bottle", "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple",
-    "sandwich", "orange", "broccoli", "carrot", "hot dog", "pizza", "donut", "cake",
-    "chair", "couch", "potted plant", "bed", "dining table", "toilet", "tvmonitor",
-    "laptop", "mouse", "remote", "keyboard", "cell phone", "microwave", "oven",
-    "toaster", "sink", "refrigerator", "book", "clock", "vase", "scissors",
-    "teddy bear", "hair drier", "toothbrush"
-]
-colorNames = ['red', 'black', 'blue', 'car', 'green', 'grey', 'orange', 'silver', 'white', 'yellow']
-#endsection
-
-vehicles = {}
-recent_alerts = []
-
-# Tracker
-tracker = Sort(max_age=20, min_hits=3, iou_threshold=0.3)
-limit = [100,340,1200,340]
-
-class SecuritySystem:
-    def __init__(self, blacklist_path, db_path='../logs_/traffic_security.db'):
-        self.db_path = db_path
-        self.blacklist = self._load_blacklist(blacklist_path)
-        self._initialize_database()
-        # Pre-opening a persistent connection acts like a simple pool for this script
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        self.bucket_name = os.getenv('BUCKET_NAME')
-        self.s3_client = boto3.client(
-            's3',
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_KEY')
-        )
-
-    @contextmanager
-    def get_cursor(self):
-        """A Context Manager for safe database operations. AI assistant mentioned lower frame rates were caused by
-        continuous on-off handshaking."""
-        cursor = self.conn.cursor()
-        try:
-            yield cursor
-            self.conn.commit()
-        except sqlite3.Error as e:
-            self.conn.rollback()
-            print(f"Database error: {e}")
-            raise
-        finally:
-            cursor.close()
-
-    def _initialize_database(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-                       CREATE TABLE IF NOT EXISTS vehicle_logs
-                       (
-                           id
-                           INTEGER
-                           PRIMARY
-                           KEY
-                           AUTOINCREMENT,
-                           timestamp
-                           TEXT,
-                           vehicle_id
-                           INTEGER,
-                           type
-                           TEXT,
-                           color
-                           TEXT,
-                           is_suspicious
-                           BOOLEAN,
-                           s3_key
-                           TEXT
-                       )
-                       ''')
-        conn.commit()
-        conn.close()
-
-    def log_vehicle(self, v_id, v_data,s3_key):
-        """Uses the context manager to log data efficiently."""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        is_suspicious = 1 if (v_data.get("is_blacklisted", False) or v_data.get("hazard_type") is not None) else 0
-
-        # This block replaces opening/closing connections manually
-        with self.get_cursor() as cursor:
-            cursor.execute('''
-                           INSERT INTO vehicle_logs (timestamp, vehicle_id, type, color, is_suspicious, s3_key)
-                           VALUES (?, ?, ?, ?, ?, ?)
-                           ''', (timestamp, v_id, v_data['type'], v_data['color'], is_suspicious, s3_key))
-
-    def _load_blacklist(self, path):
-        """Loads the watch list into a set for O(1) lookup speed."""
-        watchlist = set()
-        try:
-            with open(path, mode='r') as f:
-                import csv
-                reader = csv.DictReader(f)
-                for row in reader:
-                    watchlist.add((row['Type'].strip().lower(), row['Color'].strip().lower()))
-        except FileNotFoundError:
-            print(f"Warning: {path} not found. Blacklist is empty.")
-        return watchlist
-
-    def check_status(self, vehicle_type, color, is_exception):
-        """Business logic to determine if a vehicle is suspicious."""
-        # Suspicious if color is 'speeding/hidden' OR matches the blacklist
-        is_suspicious = is_exception or (vehicle_type.lower(), color.lower()) in self.blacklist
-        return is_suspicious
-
-    def upload_evidence_direct(self, crop_img, file_name):
-        """Uploads image directly from RAM to S3 with descriptive naming."""
-        try:
-
-            # Convert OpenCV image (NumPy array) to JPEG in memory, took AI assistance
-            _, buffer = cv2.imencode('.jpg', crop_img)
-            io_buf = io.BytesIO(buffer)
-            # print(f"DEBUG: Attempting upload for {file_name} to {self.bucket_name}")
-
-            self.s3_client.upload_fileobj(
-                io_buf,
-                self.bucket_name,
-                file_name,
-                ExtraArgs={'ContentType': 'image/jpeg'}
-            )
-            print(f"✅ SUCCESS: {file_name} is now in S3")
-            return True
-        except Exception as e:
-            print(f"❌ S3 UPLOAD CRASHED: {str(e)}")
-            return None
-
-    def analyze_behavior(self, v_id, v_data, current_frame_time, all_vehicles):  # Added self and all_vehicles
-        traj = v_data["trajectory"]
-        if len(traj) < 2: return
-
-        # 1. Limit Trajectory Length (Prevent memory leak)
-        if len(traj) > 20:
-            v_data["trajectory"] = traj[-20:]
-
-        # 2. Velocity Calculation
-        dx = traj[-1][0] - traj[-2][0]
-        dy = traj[-1][1] - traj[-2][1]
-        velocity = math.sqrt(dx ** 2 + dy ** 2)
-
-        # 3. Stalling Logic
-        if velocity < 1.0:
-            if "stall_start" not in v_data:
-                v_data["stall_start"] = current_frame_time
-            elif current_frame_time - v_data["stall_start"] > 3.0:
-                v_data["hazard_type"] = "STALLED"
+from camera import CameraPipeline, SharedModels
+from hazard_rules import load_rules
+from log_archive import LogArchiver, duckdb_available
+from metrics import REGISTRY, STARTUP, serve as serve_metrics
+from pipeline import END_OF_STREAM, BLOCK
+from security import SecuritySystem
+
+STARTUP.t0 = STARTED
+STARTUP.mark("imports")
+
+# Streams served by this node, e.g. [{"name": "junction-1", "source": "rtsp://...", "mask": "...", "limit": [...]}]
+# Optional "clock": "wall" | "media" (default: media for video files, wall otherwise) and "clock_origin", the
+# ISO time of the first frame of a recording (default: the file's modification time), "tripwires" and "zones"
+# (see zones.py; without tripwires "limit" is the counting line)
+CAMERAS_CONFIG = os.getenv('CAMERAS_CONFIG', 'cameras.json')
+DEFAULT_CAMERAS = [{"name": "junction-1", "source": "../assets/vecteezy_traffic-Danil_Rudenko.mp4",
+                    "mask": "../assets/mask.png", "limit": [100, 340, 1200, 340]}]
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v')
+
+# Pipeline: decode -> detect -> track/rules per stream, rendering here (cv2.imshow must stay on the main thread)
+# 'block' processes every frame of recorded footage, 'drop_oldest' keeps live cameras at low latency
+PIPELINE_POLICY = os.getenv('PIPELINE_POLICY', BLOCK)
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 4))
+# Smart cropping: set ROI_CROP=0 to run YOLO on the full masked frame and compare the detect stage time
+ROI_CROP = os.getenv('ROI_CROP', '1') == '1'
+DISPLAY = os.getenv('DISPLAY_STREAMS', '1') == '1'
+# Adaptive detection stride: YOLO runs at most every DETECT_STRIDE_MAX frames, SORT extrapolates in between
+DETECT_STRIDE_MAX = int(os.getenv('DETECT_STRIDE_MAX', 1))
+FRAME_BUDGET_MS = float(os.getenv('FRAME_BUDGET_MS', 40))
+REPORT_EVERY = float(os.getenv('REPORT_EVERY', 10))
+# Prometheus text on /metrics and a JSON snapshot on /metrics.json; 0 disables the endpoint
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+METRICS_SNAPSHOT = os.getenv('METRICS_SNAPSHOT')  # optional file for the final JSON snapshot
+# Write the final state of every track to vehicle_tracks when SORT retires it
+FLUSH_TRACKS = os.getenv('FLUSH_TRACKS', '0') == '1'
+# 'vectorized' (batched Kalman filters) or 'sort' (one filterpy filter per track); both give the same tracks
+TRACKER_BACKEND = os.getenv('TRACKER_BACKEND', 'vectorized')
+# Gated association scores only overlapping pairs; TRACKER_SOLVER=lap|scipy forces the assignment solver
+TRACKER_GATING = os.getenv('TRACKER_GATING', '1') == '1'
+TRACKER_SOLVER = os.getenv('TRACKER_SOLVER') or None
+# Merge a new track into a recently lost look-alike instead of classifying, logging and uploading it again
+REID = os.getenv('REID', '1') == '1'
+# DB rows are group-committed by a writer thread: every DB_BATCH_ROWS rows or DB_BATCH_MS, WAL journal with
+# PRAGMA synchronous=DB_SYNCHRONOUS (NORMAL only fsyncs at checkpoints; FULL fsyncs every commit)
+DB_BATCH_ROWS = int(os.getenv('DB_BATCH_ROWS', 64))
+DB_BATCH_MS = float(os.getenv('DB_BATCH_MS', 200))
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+# Tripwire/zone counters are written to zone_counts once per ZONE_FLUSH_S seconds of video
+ZONE_FLUSH_S = float(os.getenv('ZONE_FLUSH_S', 60))
+# Rows older than LOG_HOT_DAYS days move from SQLite to daily Parquet files under ARCHIVE_DIR every
+# ARCHIVE_INTERVAL_S; archived days older than ARCHIVE_RETENTION_DAYS are deleted (0 keeps them for ever, and the
+# disk fills up). LOG_HOT_DAYS=0 keeps everything in SQLite. Needs duckdb, see log_archive.py
+LOG_HOT_DAYS = int(os.getenv('LOG_HOT_DAYS', 7))
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', '../logs_/archive')
+ARCHIVE_RETENTION_DAYS = int(os.getenv('ARCHIVE_RETENTION_DAYS', 90)) or None
+ARCHIVE_INTERVAL_S = float(os.getenv('ARCHIVE_INTERVAL_S', 3600))
+# Hazard rules (STALLED, TAILGATING, ...) declared in JSON, see hazard_rules.py; the built-in rules if missing
+HAZARD_RULES = os.getenv('HAZARD_RULES', 'hazard_rules.json')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='NetraFlow road security detector')
+    parser.add_argument('--input', nargs='+', metavar='PATH',
+                        help='Offline mode: video files and/or directories of videos, processed headless')
+    parser.add_argument('--mask', default='../assets/mask.png', help='Mask used for every offline input')
+    parser.add_argument('--limit', nargs=4, type=int, default=None, metavar=('X1', 'Y1', 'X2', 'Y2'),
+                        help='Counting line used for every offline input')
+    parser.add_argument('--output-dir', help='Write the annotated video of each input into this directory')
+    parser.add_argument('--no-db', action='store_true', help='Do not write vehicle_logs rows')
+    parser.add_argument('--clock-origin', metavar='ISO_TIME',
+                        help='Recording time of the first frame of every offline input, e.g. 2024-11-02T08:30:00 '
+                             '(default: the file modification time); frame times follow the video timestamps')
+    parser.add_argument('--workers', type=int, default=2, help='Offline inputs processed concurrently')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Print the time taken to reach each startup milestone once the first frame is tracked')
+    return parser.parse_args()
+
+
+def load_cameras(path):
+    if not os.path.exists(path):
+        return DEFAULT_CAMERAS
+    with open(path) as f:
+        return json.load(f)
+
+
+def expand_inputs(paths):
+    """Video files from the given files and directories, in a stable order."""
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            videos += sorted(f for f in glob.glob(os.path.join(path, '*')) if f.lower().endswith(VIDEO_EXTENSIONS))
         else:
-            v_data["stall_start"] = current_frame_time
-
-        # 4. Tailgating Logic
-        if velocity > 15:
-            for other_id, other_data in all_vehicles.items():
-                if other_id != v_id and len(other_data["trajectory"]) > 0:
-                    dist = math.dist(traj[-1], other_data["trajectory"][-1])
-                    if dist < 60:  # Threshold
-                        v_data["hazard_type"] = "TAILGATING"
-
-security = SecuritySystem(blacklist_path='../logs_/blacklist.csv')
-
-def update_security_dashboard(v_id, v_type, v_color):
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    entry = f"{timestamp} - ID {v_id}: {v_color} {v_type}"
-    recent_alerts.insert(0, entry)  # Add to start of list
-    # Keep only the last 5 events
-    if len(recent_alerts) > 5: recent_alerts.pop()
-
-
-def process_frame(image, imgRegion):
-    results = coco_model(imgRegion, stream=True)
-    detections = np.empty((0, 5))
-
-    temp_classes = {}
-
-    for r in results:
-        boxes = r.boxes
-        for box in boxes:
-            # bounding box
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-
-            conf_1 = math.ceil((box.conf[0] * 100)) / 100
-            origin = (max(0, x1), max(28, y1 - 10))  # handle overflow
-
-            # class name
-            cls = int(box.cls[0])
-            current_class = classNames[cls]
-            if current_class in ["car", "truck", "bus", "motorbike"] and conf_1 > 0.6:
-                current_array = np.array([x1, y1, x2, y2, conf_1])
-                detections = np.vstack((detections, current_array))
-                temp_classes[(x1 + (x2 - x1) // 2, y1 + (y2 - y1) // 2)] = current_class
-
-            # else:
-            #     cv2.rectangle(image,(x1,y1),(x2,y2),(0,0,255),1) # toggle on for classifying non-car detections with red color
-
-    tracker_results = tracker.update(detections)
-    # cv2.line(image,(limit[0], limit[1]),(limit[2], limit[3]),(0,255,255),4)
-
-    for result in tracker_results:
-        x1, y1, x2, y2, Id = map(int, result)
-        w, h = x2 - x1, y2 - y1
-        # toggle this on to check if id are stateful or stateless
-        # cv2.putText(image, f'{Id}', (max(0,x1), max(28,y1)), thickness=2, fontScale=1.5, fontFace=cv2.FONT_HERSHEY_SIMPLEX, color=(255,255,255))
-
-        # tracker points
-        cx, cy = x1 + (w // 2), y1 + (h // 2)
-        # cv2.circle(image,(cx,cy),5,(0,0,255),-1) # can toggle on for tracker points visibility
-
-        if Id not in vehicles:
-            v_type = "Vehicle"
-            for pos, name in temp_classes.items():
-                if abs(pos[0] - cx) < 20 and abs(pos[1] - cy) < 20:
-                    v_type = name
-            vehicles[Id] = {
-                            "type": v_type,
-                            "color": "Scanning...",
-                            "logged": False,
-                            "trajectory": [],  # Store the last 10 (x,y) positions
-                            "is_aggressive": False,
-                            "uploaded": False
-                            }
-
-        if limit[0] < cx < limit[2] and limit[1] - 15 < cy < limit[3] + 15:
-            if not vehicles[Id]["logged"]:
-                crop_img = image[max(0, y1 - 20):min(ht, y2 + 20), max(0, x1 - 20):min(wd, x2 + 20)]
-                if crop_img.size != 0:
-                    color_results = color_model(crop_img)
-
-                    if len(color_results[0].boxes) > 0:
-                        detected_color = colorNames[int(color_results[0].boxes.cls[0])]
-                        is_exception = False
-                    else:
-                        detected_color = "speeding/hidden"
-                        is_exception = True
-
-                    vehicles[Id]["logged"] = True
-                    vehicles[Id]["color"] = detected_color
-
-                    is_suspicious = security.check_status(vehicles[Id]["type"], detected_color, is_exception)
-                    vehicles[Id]["is_blacklisted"] = is_suspicious
-
-                    # s3 object name
-                    file_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    s3_filename = f"{detected_color}_{vehicles[Id]['type']}_{Id}_{file_timestamp}.jpg"
-
-                    if is_suspicious and not vehicles[Id]["uploaded"]:
-                        vehicles[Id]["uploaded"] = True
-                        t = (threading.Thread(
-                            target=security.upload_evidence_direct,
-                            args=(crop_img.copy(), s3_filename)
-                        ))
-                        t.daemon = True
-                        t.start()
-                        alert_msg = f"ALERT!! : {detected_color} {vehicles[Id]['type']} (ID:{Id})"
-                        if alert_msg not in recent_alerts:
-                            recent_alerts.insert(0, alert_msg)
-                    else:
-                        update_security_dashboard(Id, vehicles[Id]["type"], vehicles[Id]["color"])
-
-                    security.log_vehicle(Id, vehicles[Id], s3_filename)
-            # cv2.line(image, (limit[0], limit[1]), (limit[2], limit[3]), (0, 255, 0), 4) # can toggle it on for limit setting
-
-        v_data = vehicles[Id]
-        v_data["trajectory"].append((cx,cy))
-        recent_points = v_data["trajectory"][-10:]
-        if len(v_data["trajectory"]) >= 10:
-            total_hori_drift = abs(recent_points[-1][0] - recent_points[0][0])
-
-            if total_hori_drift > 100:
-                v_data["is_aggressive"] = True
-
-        display_text = f"ID:{Id} {v_data['type']} | {v_data['color']}"
-        # State 1: Logged and Blacklisted (Suspicious)
-        if v_data.get("is_blacklisted", False):
-            b_color = (0, 0, 255)
-            thickness = 3
-
-        # State 2: Logged but Safe (Normal)
-        elif v_data.get("logged", False):
-            b_color = (0, 255, 0)
-            thickness = 2
-
-        # State 3: Unlogged (Scanning/Initial Detection)
+            videos.append(path)
+    return videos
+
+
+def unique_name(name, used):
+    """
+    `name`, or `name-2`, `name-3`, ... if already in `used`, to which it is added. Stream names label the metric
+    series and the output files, so two inputs with the same basename must not share one.
+    """
+    candidate, n = name, 1
+    while candidate in used:
+        n += 1
+        candidate = f"{name}-{n}"
+    used.add(candidate)
+    return candidate
+
+
+def run_live(models, security):
+    streams = [
+        CameraPipeline(cam["name"], cam["source"], cam["mask"], models, security, limit=cam.get("limit"),
+                       roi_crop=ROI_CROP, queue_size=PIPELINE_QUEUE_SIZE, policy=PIPELINE_POLICY, draw=DISPLAY,
+                       max_stride=DETECT_STRIDE_MAX, frame_budget_ms=FRAME_BUDGET_MS, flush_tracks=FLUSH_TRACKS,
+                       tracker=TRACKER_BACKEND, gated=TRACKER_GATING, solver=TRACKER_SOLVER, reid=REID,
+                       clock=cam.get("clock"), clock_origin=cam.get("clock_origin"), tripwires=cam.get("tripwires"),
+                       zones=cam.get("zones"), zone_flush_s=ZONE_FLUSH_S)
+        for cam in load_cameras(CAMERAS_CONFIG)
+    ]
+
+    for stream in streams:
+        stream.start()
+
+    running = list(streams)
+    last_report = time.time()
+    while running:
+        for stream in list(running):
+            try:
+                packet = stream.output.get(timeout=0.01)
+            except queue.Empty:
+                if stream.stopped():
+                    # A stage crashed: the stream ends without END_OF_STREAM
+                    running.remove(stream)
+                continue
+            if packet is END_OF_STREAM:
+                running.remove(stream)
+                continue
+            if DISPLAY:
+                image = packet["image"]
+                stream.draw_hud(image)
+                cv2.imshow(f'DCar Security System - {stream.name}', image)
+
+        if DISPLAY and cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+        if time.time() - last_report > REPORT_EVERY:
+            last_report = time.time()
+            for stream in streams:
+                print(stream.status_lines()[0])
+
+    for stream in streams:
+        stream.stop()
+    for stream in streams:
+        stream.join()
+    return streams
+
+
+def run_offline(args, models, security):
+    """Processes recorded videos headless, every frame, as fast as the hardware allows."""
+    pending = expand_inputs(args.input)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    running, finished, failed, writers, names = [], [], [], {}, set()
+    while pending or running:
+        # Keep up to --workers videos in flight
+        while pending and len(running) < args.workers:
+            path = pending.pop(0)
+            name = unique_name(os.path.splitext(os.path.basename(path))[0], names)
+            try:
+                stream = CameraPipeline(name, path, args.mask, models, security, limit=args.limit,
+                                        roi_crop=ROI_CROP, queue_size=PIPELINE_QUEUE_SIZE, policy=BLOCK,
+                                        draw=bool(args.output_dir), log_rows=not args.no_db,
+                                        max_stride=DETECT_STRIDE_MAX, frame_budget_ms=FRAME_BUDGET_MS,
+                                        flush_tracks=FLUSH_TRACKS, tracker=TRACKER_BACKEND, gated=TRACKER_GATING,
+                                        solver=TRACKER_SOLVER, reid=REID, clock='media',
+                                        clock_origin=args.clock_origin, zone_flush_s=ZONE_FLUSH_S)
+            except IOError as e:
+                # One unreadable file must not stop the batch
+                print(f"Skipping {path}: {e}")
+                failed.append(path)
+                continue
+            if args.output_dir:
+                fps = stream.cap.get(cv2.CAP_PROP_FPS) or 30
+                writers[stream] = cv2.VideoWriter(os.path.join(args.output_dir, f"{name}_annotated.mp4"),
+                                                  cv2.VideoWriter_fourcc(*'mp4v'), fps, (stream.wd, stream.ht))
+            stream.start()
+            running.append(stream)
+
+        for stream in list(running):
+            try:
+                packet = stream.output.get(timeout=0.01)
+            except queue.Empty:
+                if not stream.stopped():
+                    continue
+                packet = END_OF_STREAM  # a stage crashed and stopped the stream's other stages
+            if packet is END_OF_STREAM:
+                stream.join()
+                stream.release()
+                running.remove(stream)
+                finished.append(stream)
+                if stream in writers:
+                    writers.pop(stream).release()
+                if stream.error is not None:
+                    print(f"Failed {stream.source} after {stream.frames} frames: {stream.error}")
+                    failed.append(stream.source)
+                else:
+                    print(f"Done {stream.source}: {stream.frames} frames, {stream.throughput():.1f} fps")
+                continue
+            if stream in writers:
+                stream.draw_hud(packet["image"])
+                writers[stream].write(packet["image"])
+    if failed:
+        print(f"{len(failed)} input(s) could not be processed: {', '.join(failed)}")
+    return finished
+
+
+def print_report(streams, elapsed):
+    frames = sum(stream.frames for stream in streams)
+    logged = sum(stream.logged for stream in streams)
+    print(f"\nProcessed {frames} frames from {len(streams)} stream(s) in {elapsed:.1f}s "
+          f"({frames / elapsed if elapsed > 0 else 0:.1f} frames/sec), {logged} vehicles logged")
+
+    totals = {}
+    for stream in streams:
+        for stage, busy, processed in stream.stage_times():
+            t = totals.setdefault(stage, [0.0, 0])
+            t[0] += busy
+            t[1] += processed
+    for stage, (busy, processed) in totals.items():
+        print(f"  {stage:<8} {busy:8.1f}s busy  {1000 * busy / processed if processed else 0:7.1f} ms/frame")
+    for stream in streams:
+        merges = f", {stream.reid.merges.value} re-ID merges" if stream.reid is not None else ""
+        print(f"  {stream.name}: {stream.frames} frames, {stream.logged} logged{merges}")
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.profile_startup:
+        STARTUP.print_phase = "first frame tracked"
+    if METRICS_PORT:
+        try:
+            serve_metrics(METRICS_PORT)
+            STARTUP.mark("metrics server")
+        except OSError as e:
+            # e.g. an offline replay next to the live detector, which already serves this port
+            print(f"Metrics endpoint disabled, port {METRICS_PORT} unavailable ({e}); set METRICS_PORT to another "
+                  f"port or 0")
+
+    # Crops crossing the line are batched: one color_model call per COLOR_BATCH_SIZE crops or COLOR_BATCH_MS.
+    # The models load and warm up in the background while the streams open.
+    models = SharedModels(color_batch_size=int(os.getenv('COLOR_BATCH_SIZE', 8)),
+                          color_batch_ms=float(os.getenv('COLOR_BATCH_MS', 50)))
+    security = SecuritySystem(blacklist_path='../logs_/blacklist.csv', rules=load_rules(HAZARD_RULES),
+                              db_batch_rows=DB_BATCH_ROWS, db_batch_ms=DB_BATCH_MS, db_synchronous=DB_SYNCHRONOUS)
+    STARTUP.mark("services created")
+    archiver = None
+    if LOG_HOT_DAYS and not args.no_db:
+        if not duckdb_available():
+            print("duckdb is not installed: logs stay in SQLite, no archiving")
         else:
-            b_color = (255, 0, 255)
-            thickness = 2
-
-        cv2.rectangle(image, (x1, y1), (x2, y2), b_color, thickness)
-        cvzone.putTextRect(image, display_text, (max(0, x1), max(35, y1)),
-                           scale=1, thickness=1, offset=3, colorR=b_color)
-
-        if v_data.get("is_blacklisted") or "hazard_type" in v_data:
-            color = (0, 0, 255)
-            thickness = 3
-            points = v_data["trajectory"]
-
-            if "hazard_type" in v_data:
-                color = (0, 0, 255)
-                thickness = 2
-                cvzone.putTextRect(image, v_data["hazard_type"], (x1, y2 + 20), scale=1, colorR=color)
-
-            # Draw the 'Ghost' movement tail
-            for inc in range(1, len(points)):
-                cv2.line(image, points[inc - 1], points[inc], color, thickness)
-
-        security.analyze_behavior(Id, vehicles[Id], time.time(), vehicles)
-
-prev_time = 0
-
-while True:
-    ret, image = cap.read()
-    if not ret: break
-    if mask is None:
-        print("Mask exception")
-        exit()
-
-    imgRegion = cv2.bitwise_and(image, mask)
-    process_frame(image, imgRegion)
-    curr_time = time.time()
-
-    # UI Dashboard
-    cv2.putText(image, "SECURITY LOG (RECENT)", (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-    fps = 1 + 1 / (curr_time - prev_time)
-    prev_time = curr_time
-
-    cv2.rectangle(image, (wd - 200, 0), (wd, 100), (0, 0, 0), -1)  # Background
-    cv2.putText(image, f"FPS: {int(fps)}", (wd - 180, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-    cv2.putText(image, f"SQL: Connected", (wd - 180, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-    cv2.putText(image, f"AWS S3: Active", (wd - 180, 80), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-
-    for i, alert in enumerate(recent_alerts):
-        cv2.putText(image, alert, (20, 85 + (i * 30)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
-    cv2.imshow('DCar Security System',image)
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-cap.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+            archiver = LogArchiver(security.db_path, ARCHIVE_DIR, LOG_HOT_DAYS, ARCHIVE_RETENTION_DAYS,
+                                   ARCHIVE_INTERVAL_S)
+            archiver.start()
+
+    started = time.time()
+    if args.input:
+        streams = run_offline(args, models, security)
+    else:
+        streams = run_live(models, security)
+    models.close()
+    security.close()  # after the color batcher, whose last results still log rows
+    if archiver is not None:
+        archiver.stop()
+
+    print_report(streams, time.time() - started)
+    if args.profile_startup:
+        print(STARTUP.report())
+    if METRICS_SNAPSHOT:
+        with open(METRICS_SNAPSHOT, 'w') as f:
+            json.dump(REGISTRY.snapshot(), f, indent=2, default=str)
+    cv2.destroyAllWindows()
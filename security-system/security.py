@@ -0,0 +1,236 @@
+import cv2
+import math
+from datetime import datetime
+import os
+import io
+
+import threading
+import time
+
+from db_schema import ROLLUP_UPSERT, migrate, rollup_rows
+from db_writer import DbWriter
+from hazard_rules import RuleEngine
+from metrics import REGISTRY, STARTUP
+
+VEHICLE_LOG_INSERT = '''
+                     INSERT INTO vehicle_logs (timestamp, vehicle_id, type, color, is_suspicious, s3_key, ts_ms,
+                                               camera_id, confidence, hazard_type)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                     '''
+
+
+class SecuritySystem:
+    def __init__(self, blacklist_path, db_path='../logs_/traffic_security.db', rules=None, db_batch_rows=64,
+                 db_batch_ms=200, db_synchronous='NORMAL'):
+        self.db_path = db_path
+        self.db_options = {"batch_size": db_batch_rows, "max_delay_ms": db_batch_ms, "synchronous": db_synchronous}
+        self.blacklist = self._load_blacklist(blacklist_path)
+        # Hazard rules (hazard_rules.load_rules specs), compiled once; None uses hazard_rules.DEFAULT_RULES
+        self.rules = RuleEngine(rules)
+        self.bucket_name = os.getenv('BUCKET_NAME')
+        # The DB writer and the S3 client are created on first use (see writer / s3_client), so startup does
+        # not wait for boto3 or the database file
+        self._writer = None
+        self._s3_client = None
+        self._db_lock = threading.Lock()
+        self._s3_lock = threading.Lock()
+
+        # Real DB / S3 state for the HUD and the metrics endpoint (the DB series are filled by the DbWriter)
+        self.db_write_ms = REGISTRY.histogram('db_write_ms', 'Latency of one group commit')
+        self.db_errors = REGISTRY.counter('db_errors_total', 'Failed group commits')
+        self.s3_backlog = REGISTRY.gauge('s3_upload_backlog', 'Evidence uploads started but not finished')
+        self.s3_uploads = REGISTRY.counter('s3_uploads_total', 'Evidence uploads', {"result": "ok"})
+        self.s3_failures = REGISTRY.counter('s3_uploads_total', 'Evidence uploads', {"result": "failed"})
+        self.s3_upload_ms = REGISTRY.histogram('s3_upload_ms', 'Latency of evidence uploads')
+        self.s3_enqueue_ms = REGISTRY.histogram('s3_enqueue_ms', 'Time taken to hand an upload to its thread')
+
+    @property
+    def writer(self):
+        """
+        The background DbWriter, started on first use. Rows are only queued on the calling thread, so logging
+        never blocks a frame on the disk.
+        """
+        if self._writer is None:
+            with self._db_lock:
+                if self._writer is None:
+                    self._writer = DbWriter(self.db_path, on_connect=self._initialize_database, **self.db_options)
+                    self._writer.start()
+        return self._writer
+
+    @property
+    def db_ok(self):
+        return self._writer is None or self._writer.ok
+
+    def flush(self, timeout=None):
+        """Waits until the rows logged so far are in the database."""
+        return self._writer is None or self._writer.flush(timeout)
+
+    def close(self):
+        """Writes the rows still queued and stops the DB writer."""
+        if self._writer is not None:
+            self._writer.close()
+
+    @property
+    def s3_client(self):
+        """boto3 is imported and the client created on the first upload."""
+        if self._s3_client is None:
+            with self._s3_lock:
+                if self._s3_client is None:
+                    import boto3
+                    self._s3_client = boto3.client(
+                        's3',
+                        aws_access_key_id=os.getenv('AWS_ACCESS_KEY'),
+                        aws_secret_access_key=os.getenv('AWS_SECRET_KEY')
+                    )
+                    STARTUP.mark("s3 client")
+        return self._s3_client
+
+    def _initialize_database(self, conn):
+        """Creates or upgrades the schema (db_schema.migrate) on the writer's connection before its first batch."""
+        migrate(conn)
+        STARTUP.mark("db connected")
+
+    def log_vehicle(self, v_id, v_data, s3_key, ts=None, stream=None):
+        """
+        Queues the vehicle_logs row for the DB writer. `ts` is the frame time, now by default, and `stream` the
+        camera that saw the vehicle.
+        """
+        ts = time.time() if ts is None else ts
+        timestamp = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+        is_suspicious = 1 if (v_data.is_blacklisted or v_data.hazard_type is not None) else 0
+
+        ts_ms = int(ts * 1000)
+        row = (timestamp, v_id, v_data.type, v_data.color, is_suspicious, s3_key, ts_ms, stream, v_data.confidence,
+               v_data.hazard_type)
+        # The row and the dashboards' counters are one group, always committed in the same transaction
+        rollups = rollup_rows(ts_ms, stream, v_data.type, v_data.color, is_suspicious)
+        self.writer.submit_group([(VEHICLE_LOG_INSERT, [row]), (ROLLUP_UPSERT, rollups)])
+
+    def log_track(self, stream, record):
+        """Queues the final state of a track when its VehicleRecord is evicted."""
+        fmt = "%Y-%m-%d %H:%M:%S"
+        is_suspicious = 1 if (record.is_blacklisted or record.hazard_type is not None) else 0
+        self.writer.submit('''
+                           INSERT INTO vehicle_tracks (stream, vehicle_id, type, color, first_seen, last_seen,
+                                                       frames, is_suspicious, hazard_type)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                           ''', (stream, record.id, record.type, record.color,
+                                 datetime.fromtimestamp(record.first_seen).strftime(fmt),
+                                 datetime.fromtimestamp(record.last_seen).strftime(fmt),
+                                 record.frames, is_suspicious, record.hazard_type))
+
+    def log_zone_counts(self, rows):
+        """
+        Queues the tripwire/zone counters of one period, written in a single executemany. Rows are
+        (stream, zone, event, type, count, period start, period end) with the period in epoch seconds.
+        """
+        fmt = "%Y-%m-%d %H:%M:%S"
+        rows = [(stream, zone, event, v_type, n, datetime.fromtimestamp(start).strftime(fmt),
+                 datetime.fromtimestamp(end).strftime(fmt)) for stream, zone, event, v_type, n, start, end in rows]
+        self.writer.submit_many('''
+                                INSERT INTO zone_counts (stream, zone, event, type, count, period_start,
+                                                         period_end)
+                                VALUES (?, ?, ?, ?, ?, ?, ?)
+                                ''', rows)
+
+    def _load_blacklist(self, path):
+        """Loads the watch list into a set for O(1) lookup speed."""
+        watchlist = set()
+        try:
+            with open(path, mode='r') as f:
+                import csv
+                reader = csv.DictReader(f)
+                for row in reader:
+                    watchlist.add((row['Type'].strip().lower(), row['Color'].strip().lower()))
+        except FileNotFoundError:
+            print(f"Warning: {path} not found. Blacklist is empty.")
+        return watchlist
+
+    def check_status(self, vehicle_type, color, is_exception):
+        """Business logic to determine if a vehicle is suspicious."""
+        # Suspicious if color is 'speeding/hidden' OR matches the blacklist
+        is_suspicious = is_exception or (vehicle_type.lower(), color.lower()) in self.blacklist
+        return is_suspicious
+
+    def upload_evidence_async(self, crop_img, file_name):
+        """Starts upload_evidence_direct on a daemon thread and counts it in the upload backlog."""
+        with self.s3_enqueue_ms.time():
+            self.s3_backlog.inc()
+            t = threading.Thread(target=self.upload_evidence_direct, args=(crop_img, file_name))
+            t.daemon = True
+            t.start()
+
+    def upload_evidence_direct(self, crop_img, file_name):
+        """Uploads image directly from RAM to S3 with descriptive naming."""
+        start = time.perf_counter()
+        try:
+
+            # Convert OpenCV image (NumPy array) to JPEG in memory, took AI assistance
+            _, buffer = cv2.imencode('.jpg', crop_img)
+            io_buf = io.BytesIO(buffer)
+            # print(f"DEBUG: Attempting upload for {file_name} to {self.bucket_name}")
+
+            self.s3_client.upload_fileobj(
+                io_buf,
+                self.bucket_name,
+                file_name,
+                ExtraArgs={'ContentType': 'image/jpeg'}
+            )
+            print(f"✅ SUCCESS: {file_name} is now in S3")
+            self.s3_uploads.inc()
+            self.s3_upload_ms.observe(1000 * (time.perf_counter() - start))
+            return True
+        except Exception as e:
+            print(f"❌ S3 UPLOAD CRASHED: {str(e)}")
+            self.s3_failures.inc()
+            return None
+        finally:
+            self.s3_backlog.dec()
+
+    def status_lines(self):
+        """SQL and S3 lines of the HUD, read from the same counters as the metrics endpoint."""
+        if self.db_ok:
+            backlog = self._writer.backlog() if self._writer is not None else 0
+            sql = f"SQL: OK {self.db_write_ms.mean():.1f}ms, {backlog} queued"
+        else:
+            sql = f"SQL: ERROR ({self.db_errors.value})"
+        if not self.bucket_name:
+            s3 = "AWS S3: not configured"
+        else:
+            s3 = f"AWS S3: {self.s3_backlog.value} queued, {self.s3_failures.value} failed"
+        return [sql, s3]
+
+    def analyze_frame(self, records, current_frame_time, all_vehicles, stream=None):
+        """
+        Hazard analysis for all `records` of one frame at once: the compiled hazard rules are evaluated as
+        array expressions over the rows of the stream's TrajectoryStore (`all_vehicles.trajectories`).
+        With the default rules this flags the same hazards as analyze_behavior() per vehicle.
+        """
+        self.rules.evaluate(records, all_vehicles.trajectories, current_frame_time, stream)
+
+    def analyze_behavior(self, v_id, v_data, current_frame_time, all_vehicles):  # Added self and all_vehicles
+        traj = v_data.trajectory.tolist()  # copied out of the TrajectoryStore, see vehicle_store.TRAJECTORY_LEN
+        if len(traj) < 2: return
+
+        # 1. Velocity Calculation
+        dx = traj[-1][0] - traj[-2][0]
+        dy = traj[-1][1] - traj[-2][1]
+        velocity = math.sqrt(dx ** 2 + dy ** 2)
+
+        # 2. Stalling Logic
+        if velocity < 1.0:
+            if v_data.stall_start is None:
+                v_data.stall_start = current_frame_time
+            elif current_frame_time - v_data.stall_start > 3.0:
+                v_data.hazard_type = "STALLED"
+        else:
+            v_data.stall_start = current_frame_time
+
+        # 3. Tailgating Logic
+        if velocity > 15:
+            for other_id, other_data in all_vehicles.items():
+                other_traj = other_data.trajectory
+                if other_id != v_id and len(other_traj) > 0:
+                    dist = math.dist(traj[-1], other_traj[-1].tolist())
+                    if dist < 60:  # Threshold
+                        v_data.hazard_type = "TAILGATING"
@@ -19,29 +19,38 @@ from __future__ import print_function
 
 import os
 import numpy as np
-import matplotlib
-matplotlib.use('TkAgg')
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from skimage import io
 
 import glob
 import time
 import argparse
-from filterpy.kalman import KalmanFilter
+# matplotlib/skimage (demo display), filterpy (Sort only) and scipy are imported where they are used, so
+# importing the tracker stays fast and works on headless machines without Tk
+try:
+  import lap  # optional, faster than scipy on large cost matrices
+except ImportError:
+  lap = None
 
 np.random.seed(0)
 
 
-def linear_assignment(cost_matrix):
-  try:
-    import lap
-    _, x, y = lap.lapjv(cost_matrix, extend_cost=True)
-    return np.array([[y[i],i] for i in x if i >= 0]) #
-  except ImportError:
-    from scipy.optimize import linear_sum_assignment
-    x, y = linear_sum_assignment(cost_matrix)
-    return np.array(list(zip(x, y)))
+SOLVERS = ('lap', 'scipy')
+
+
+def linear_assignment(cost_matrix, solver=None):
+  """
+  Minimum cost assignment as an (K,2) array of [row, col]. solver is 'lap', 'scipy' or None (lap when installed)
+  """
+  if solver not in (None,) + SOLVERS:
+    raise ValueError("Unknown assignment solver '%s', expected one of %s" % (solver, SOLVERS))
+  if solver != 'scipy':
+    if lap is not None:
+      _, x, y = lap.lapjv(cost_matrix, extend_cost=True)
+      return np.array([[y[i],i] for i in x if i >= 0]).reshape(-1, 2) #
+    if solver == 'lap':
+      raise ImportError("solver='lap' requires the lap package")
+  from scipy.optimize import linear_sum_assignment
+  x, y = linear_sum_assignment(cost_matrix)
+  return np.stack((x, y), axis=1)
 
 
 def iou_batch(bb_test, bb_gt):
@@ -78,6 +87,15 @@ def convert_bbox_to_z(bbox):
   return np.array([x, y, s, r]).reshape((4, 1))
 
 
+def convert_bbox_to_z_batch(bboxes):
+  """
+  Vectorised convert_bbox_to_z: takes boxes of shape (N,4) and returns z of shape (N,4)
+  """
+  w = bboxes[:, 2] - bboxes[:, 0]
+  h = bboxes[:, 3] - bboxes[:, 1]
+  return np.stack((bboxes[:, 0] + w/2., bboxes[:, 1] + h/2., w * h, w / h.astype(float)), axis=1)
+
+
 def convert_x_to_bbox(x,score=None):
   """
   Takes a bounding box in the centre form [x,y,s,r] and returns it in the form
@@ -100,6 +118,7 @@ class KalmanBoxTracker(object):
     """
     Initialises a tracker using initial bounding box.
     """
+    from filterpy.kalman import KalmanFilter
     #define constant velocity model
     self.kf = KalmanFilter(dim_x=7, dim_z=4) 
     self.kf.F = np.array([[1,0,0,0,1,0,0],[0,1,0,0,0,1,0],[0,0,1,0,0,0,1],[0,0,0,1,0,0,0],  [0,0,0,0,1,0,0],[0,0,0,0,0,1,0],[0,0,0,0,0,0,1]])
@@ -119,6 +138,26 @@ class KalmanBoxTracker(object):
     self.hits = 0
     self.hit_streak = 0
     self.age = 0
+    self.score = 0.
+    self.class_votes = {}
+    self.vote(bbox)
+
+  def vote(self, bbox):
+    """
+    Records the confidence of bbox ([x1,y1,x2,y2,score,class]) and adds it to the vote for its class.
+    """
+    if len(bbox) > 5:
+      self.score = bbox[4]
+      cls = int(bbox[5])
+      self.class_votes[cls] = self.class_votes.get(cls, 0.) + bbox[4]
+
+  def get_class(self):
+    """
+    Class with the highest confidence-weighted vote over the track's life (lowest ID on ties), -1 if none.
+    """
+    if not self.class_votes:
+      return -1
+    return min(self.class_votes, key=lambda c: (-self.class_votes[c], c))
 
   def update(self,bbox):
     """
@@ -129,6 +168,7 @@ class KalmanBoxTracker(object):
     self.hits += 1
     self.hit_streak += 1
     self.kf.update(convert_bbox_to_z(bbox))
+    self.vote(bbox)
 
   def predict(self):
     """
@@ -144,6 +184,18 @@ class KalmanBoxTracker(object):
     self.history.append(convert_x_to_bbox(self.kf.x))
     return self.history[-1]
 
+  def coast(self):
+    """
+    Advances the state vector for a frame that was not sent to the detector.
+    Unlike predict(), the frame is not counted as a missed detection.
+    """
+    if((self.kf.x[6]+self.kf.x[2])<=0):
+      self.kf.x[6] *= 0.0
+    self.kf.predict()
+    self.age += 1
+    self.history.append(convert_x_to_bbox(self.kf.x))
+    return self.history[-1]
+
   def get_state(self):
     """
     Returns the current bounding box estimate.
@@ -151,7 +203,73 @@ class KalmanBoxTracker(object):
     return convert_x_to_bbox(self.kf.x)
 
 
-def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3):
+def iou_pairs(bb_test, bb_gt):
+  """
+  IOU of the overlapping pairs only. Sweeps bb_gt sorted by x1, so only boxes that can overlap in x are
+  compared, instead of building the dense len(bb_test) x len(bb_gt) matrix.
+  Returns (test_idx, gt_idx, iou) for every pair with iou > 0
+  """
+  order = np.argsort(bb_gt[:, 0], kind='stable')
+  gt_x1 = bb_gt[order, 0]
+  max_w = np.max(bb_gt[:, 2] - bb_gt[:, 0])
+  # candidates start after test.x1 - widest gt box and before test.x2
+  lo = np.searchsorted(gt_x1, bb_test[:, 0] - max_w, side='left')
+  hi = np.searchsorted(gt_x1, bb_test[:, 2], side='left')
+  counts = np.maximum(hi - lo, 0)
+  test_idx = np.repeat(np.arange(len(bb_test)), counts)
+  offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+  gt_idx = order[np.repeat(lo, counts) + offsets]
+
+  a, b = bb_test[test_idx], bb_gt[gt_idx]
+  w = np.maximum(0., np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]))
+  h = np.maximum(0., np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]))
+  wh = w * h
+  o = wh / ((a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1]) + (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1]) - wh)
+  keep = o > 0
+  return test_idx[keep], gt_idx[keep], o[keep]
+
+
+def associate_gated(detections, trackers, iou_threshold=0.3, solver=None):
+  """
+  Same contract as associate_detections_to_trackers, for scenes with many boxes.
+  Pairs that do not overlap can never match, so only overlapping pairs are scored (iou_pairs). An overlapping
+  pair whose detection and tracker overlap nothing else is matched directly; all remaining contested
+  detections and trackers are solved as one assignment on their reduced cost matrix (not split per connected
+  component), so isolated boxes and boxes that overlap nothing never enter the solver.
+  Unmatched detections are returned in ascending order.
+  """
+  D, T = len(detections), len(trackers)
+  if D == 0 or T == 0:
+    return np.empty((0,2),dtype=int), np.arange(D), np.arange(T)
+  det_idx, trk_idx, iou = iou_pairs(detections[:, :4], trackers[:, :4])
+
+  strong = iou > iou_threshold
+  if np.bincount(det_idx[strong], minlength=1).max() <= 1 and np.bincount(trk_idx[strong], minlength=1).max() <= 1:
+    # same shortcut as the dense path: the confident pairs are already one-to-one
+    matches = np.stack((det_idx[strong], trk_idx[strong]), axis=1)
+  else:
+    isolated = (np.bincount(det_idx, minlength=D)[det_idx] == 1) & (np.bincount(trk_idx, minlength=T)[trk_idx] == 1)
+    matches = [np.stack((det_idx[isolated], trk_idx[isolated]), axis=1)[iou[isolated] >= iou_threshold]]
+    contested = ~isolated
+    if contested.any():
+      dets, d_local = np.unique(det_idx[contested], return_inverse=True)
+      trks, t_local = np.unique(trk_idx[contested], return_inverse=True)
+      iou_matrix = np.zeros((len(dets), len(trks)))
+      iou_matrix[d_local, t_local] = iou[contested]
+      m = linear_assignment(-iou_matrix, solver)
+      m = m[iou_matrix[m[:, 0], m[:, 1]] >= iou_threshold]
+      matches.append(np.stack((dets[m[:, 0]], trks[m[:, 1]]), axis=1))
+    matches = np.concatenate(matches)
+
+  matches = matches.astype(int).reshape(-1, 2)
+  det_free = np.ones(D, dtype=bool)
+  det_free[matches[:, 0]] = False
+  trk_free = np.ones(T, dtype=bool)
+  trk_free[matches[:, 1]] = False
+  return matches, np.flatnonzero(det_free), np.flatnonzero(trk_free)
+
+
+def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3,solver=None):
   """
   Assigns detections to tracked object (both represented as bounding boxes)
 
@@ -167,56 +285,59 @@ def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3):
     if a.sum(1).max() == 1 and a.sum(0).max() == 1:
         matched_indices = np.stack(np.where(a), axis=1)
     else:
-      matched_indices = linear_assignment(-iou_matrix)
+      matched_indices = linear_assignment(-iou_matrix, solver)
   else:
-    matched_indices = np.empty(shape=(0,2))
+    matched_indices = np.empty(shape=(0,2),dtype=int)
 
-  unmatched_detections = []
-  for d, det in enumerate(detections):
-    if(d not in matched_indices[:,0]):
-      unmatched_detections.append(d)
-  unmatched_trackers = []
-  for t, trk in enumerate(trackers):
-    if(t not in matched_indices[:,1]):
-      unmatched_trackers.append(t)
+  assigned_dets = np.zeros(len(detections), dtype=bool)
+  assigned_dets[matched_indices[:,0]] = True
+  assigned_trks = np.zeros(len(trackers), dtype=bool)
+  assigned_trks[matched_indices[:,1]] = True
 
   #filter out matched with low IOU
-  matches = []
-  for m in matched_indices:
-    if(iou_matrix[m[0], m[1]]<iou_threshold):
-      unmatched_detections.append(m[0])
-      unmatched_trackers.append(m[1])
-    else:
-      matches.append(m.reshape(1,2))
-  if(len(matches)==0):
-    matches = np.empty((0,2),dtype=int)
-  else:
-    matches = np.concatenate(matches,axis=0)
+  low = iou_matrix[matched_indices[:,0], matched_indices[:,1]] < iou_threshold
+  matches = matched_indices[~low].reshape(-1,2)
+  unmatched_detections = np.concatenate((np.flatnonzero(~assigned_dets), matched_indices[low,0]))
+  unmatched_trackers = np.concatenate((np.flatnonzero(~assigned_trks), matched_indices[low,1]))
 
-  return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
+  return matches, unmatched_detections, unmatched_trackers
 
 
 class Sort(object):
-  def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3):
+  def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3, gated=False, solver=None):
     """
-    Sets key parameters for SORT
+    Sets key parameters for SORT. gated=True associates with associate_gated, solver picks the
+    linear assignment implementation ('lap', 'scipy' or None for lap when installed)
     """
     self.max_age = max_age
     self.min_hits = min_hits
     self.iou_threshold = iou_threshold
+    self.associate = associate_gated if gated else associate_detections_to_trackers
+    self.solver = solver
     self.trackers = []
     self.frame_count = 0
+    self.retired = []
+    self.with_classes = False
+
+  def _track_row(self, d, trk):
+    if self.with_classes:
+      return np.concatenate((d,[trk.id+1, trk.score, trk.get_class()])).reshape(1,-1)
+    return np.concatenate((d,[trk.id+1])).reshape(1,-1) # +1 as MOT benchmark requires positive
 
   def update(self, dets=np.empty((0, 5))):
     """
     Params:
       dets - a numpy array of detections in the format [[x1,y1,x2,y2,score],[x1,y1,x2,y2,score],...]
+        or [[x1,y1,x2,y2,score,class],...]
     Requires: this method must be called once for each frame even with empty detections (use np.empty((0, 5)) for frames without detections).
     Returns the a similar array, where the last column is the object ID.
+    With a class column the rows are [x1,y1,x2,y2,ID,score,class]: the score of the track's last detection
+    and its class by confidence-weighted vote over the track's life.
 
     NOTE: The number of objects returned may differ from the number of detections provided.
     """
     self.frame_count += 1
+    self.with_classes |= dets.shape[1] > 5
     # get predicted locations from existing trackers.
     trks = np.zeros((len(self.trackers), 5))
     to_del = []
@@ -228,8 +349,8 @@ class Sort(object):
         to_del.append(t)
     trks = np.ma.compress_rows(np.ma.masked_invalid(trks))
     for t in reversed(to_del):
-      self.trackers.pop(t)
-    matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets,trks, self.iou_threshold)
+      self.retired.append(self.trackers.pop(t).id+1)
+    matched, unmatched_dets, unmatched_trks = self.associate(dets, trks, self.iou_threshold, self.solver)
 
     # update matched trackers with assigned detections
     for m in matched:
@@ -243,14 +364,223 @@ class Sort(object):
     for trk in reversed(self.trackers):
         d = trk.get_state()[0]
         if (trk.time_since_update < 1) and (trk.hit_streak >= self.min_hits or self.frame_count <= self.min_hits):
-          ret.append(np.concatenate((d,[trk.id+1])).reshape(1,-1)) # +1 as MOT benchmark requires positive
+          ret.append(self._track_row(d, trk))
         i -= 1
         # remove dead tracklet
         if(trk.time_since_update > self.max_age):
           self.trackers.pop(i)
+          self.retired.append(trk.id+1)
+    if(len(ret)>0):
+      return np.concatenate(ret)
+    return np.empty((0,7 if self.with_classes else 5))
+
+  def pop_retired(self):
+    """
+    Returns the IDs (as reported by update) of the tracks removed since the last call.
+    """
+    retired, self.retired = self.retired, []
+    return retired
+
+  def extrapolate(self):
+    """
+    Carries every track forward one frame with its Kalman prediction only, for frames where the detector
+    was skipped. Returns the same format as update(); no track is aged as missed, created or removed.
+    """
+    self.frame_count += 1
+    ret = []
+    for trk in reversed(self.trackers):
+      d = trk.coast()[0]
+      if np.any(np.isnan(d)):
+        continue
+      if (trk.time_since_update < 1) and (trk.hit_streak >= self.min_hits or self.frame_count <= self.min_hits):
+        ret.append(self._track_row(d, trk))
     if(len(ret)>0):
       return np.concatenate(ret)
-    return np.empty((0,5))
+    return np.empty((0,7 if self.with_classes else 5))
+
+  def __len__(self):
+    return len(self.trackers)
+
+
+def convert_x_to_bbox_batch(x):
+  """
+  Vectorised convert_x_to_bbox: takes states of shape (N,7) and returns boxes of shape (N,4)
+  """
+  with np.errstate(invalid='ignore'):
+    w = np.sqrt(x[:, 2] * x[:, 3])
+    h = x[:, 2] / w
+  return np.stack((x[:, 0]-w/2., x[:, 1]-h/2., x[:, 0]+w/2., x[:, 1]+h/2.), axis=1)
+
+
+class VectorizedSort(object):
+  """
+  Same tracker as Sort, but the constant velocity Kalman filters of all tracks are kept in stacked arrays
+  (state x of shape (N,7), covariance P of shape (N,7,7)) and predicted/updated in one batched call per frame
+  instead of one filterpy KalmanFilter per track. IDs, outputs and track lifetimes match Sort.
+  """
+  F = np.array([[1,0,0,0,1,0,0],[0,1,0,0,0,1,0],[0,0,1,0,0,0,1],[0,0,0,1,0,0,0],  [0,0,0,0,1,0,0],[0,0,0,0,0,1,0],[0,0,0,0,0,0,1]], dtype=float)
+  H = np.array([[1,0,0,0,0,0,0],[0,1,0,0,0,0,0],[0,0,1,0,0,0,0],[0,0,0,1,0,0,0]], dtype=float)
+  # Same noise model as KalmanBoxTracker
+  R = np.diag([1., 1., 10., 10.])
+  P0 = np.diag([10., 10., 10., 10., 1e4, 1e4, 1e4])
+  Q = np.diag([1., 1., 1., 1., 0.01, 0.01, 0.0001])
+
+  def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3, gated=False, solver=None):
+    """
+    Sets key parameters for SORT. gated=True associates with associate_gated, solver picks the
+    linear assignment implementation ('lap', 'scipy' or None for lap when installed)
+    """
+    self.max_age = max_age
+    self.min_hits = min_hits
+    self.iou_threshold = iou_threshold
+    self.associate = associate_gated if gated else associate_detections_to_trackers
+    self.solver = solver
+    self.frame_count = 0
+    self.retired = []
+    self.x = np.zeros((0, 7))
+    self.P = np.zeros((0, 7, 7))
+    self.ids = np.zeros(0, dtype=int)
+    self.time_since_update = np.zeros(0, dtype=int)
+    self.hits = np.zeros(0, dtype=int)
+    self.hit_streak = np.zeros(0, dtype=int)
+    self.age = np.zeros(0, dtype=int)
+    # last detection score and confidence-weighted class votes (N, num_classes), see KalmanBoxTracker.vote
+    self.with_classes = False
+    self.score = np.zeros(0)
+    self.votes = np.zeros((0, 0))
+
+  def __len__(self):
+    return len(self.ids)
+
+  def _predict(self):
+    """
+    Advances every track one step, with KalmanBoxTracker's guard against a negative area.
+    """
+    self.x[self.x[:, 6] + self.x[:, 2] <= 0, 6] = 0.
+    self.x = self.x @ self.F.T
+    self.P = self.F @ self.P @ self.F.T + self.Q
+    self.age += 1
+    return convert_x_to_bbox_batch(self.x)
+
+  def _update(self, idx, z):
+    """
+    Kalman update of tracks `idx` with measurements z of shape (M,4), in the same Joseph form as filterpy.
+    """
+    x, P = self.x[idx], self.P[idx]
+    y = z - x @ self.H.T
+    PHT = P @ self.H.T
+    S = self.H @ PHT + self.R
+    K = PHT @ np.linalg.inv(S)
+    self.x[idx] = x + (K @ y[:, :, None])[:, :, 0]
+    I_KH = np.eye(7) - K @ self.H
+    self.P[idx] = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ self.R @ K.transpose(0, 2, 1)
+
+  def _keep(self, keep):
+    for name in ('x', 'P', 'ids', 'time_since_update', 'hits', 'hit_streak', 'age', 'score', 'votes'):
+      setattr(self, name, getattr(self, name)[keep])
+
+  def _vote(self, idx, dets):
+    """
+    Adds the score of dets ([x1,y1,x2,y2,score,class]) to the class votes of tracks idx.
+    """
+    if not self.with_classes or len(idx) == 0:
+      return
+    cls = dets[:, 5].astype(int)
+    if cls.max() >= self.votes.shape[1]:
+      self.votes = np.pad(self.votes, ((0, 0), (0, cls.max() + 1 - self.votes.shape[1])))
+    self.score[idx] = dets[:, 4]
+    self.votes[idx, cls] += dets[:, 4]
+
+  def _output(self):
+    """
+    Confirmed tracks in the same (reversed creation) order as Sort.
+    """
+    show = (self.time_since_update < 1) & ((self.hit_streak >= self.min_hits) | (self.frame_count <= self.min_hits))
+    columns = [convert_x_to_bbox_batch(self.x), (self.ids + 1)[:, None]]
+    if self.with_classes:
+      cls = np.full(len(self.ids), -1)
+      if self.votes.shape[1]:
+        cls = np.where(self.votes.max(axis=1) > 0, np.argmax(self.votes, axis=1), -1)
+      columns += [self.score[:, None], cls[:, None]]
+    ret = np.concatenate(columns, axis=1)[show][::-1]
+    return ret if len(ret) else np.empty((0,7 if self.with_classes else 5))
+
+  def update(self, dets=np.empty((0, 5))):
+    """
+    Params:
+      dets - a numpy array of detections in the format [[x1,y1,x2,y2,score],[x1,y1,x2,y2,score],...]
+    Requires: this method must be called once for each frame even with empty detections (use np.empty((0, 5)) for frames without detections).
+    Returns the a similar array, where the last column is the object ID; see Sort.update for class columns.
+    """
+    self.frame_count += 1
+    self.with_classes |= dets.shape[1] > 5
+    pos = self._predict()
+    self.hit_streak[self.time_since_update > 0] = 0
+    self.time_since_update += 1
+    valid = ~np.any(np.isnan(pos), axis=1)
+    if not valid.all():
+      self.retired.extend((self.ids[~valid][::-1] + 1).tolist())
+      self._keep(valid)
+      pos = pos[valid]
+    trks = np.concatenate((pos, np.zeros((len(pos), 1))), axis=1)
+    matched, unmatched_dets, _ = self.associate(dets, trks, self.iou_threshold, self.solver)
+
+    # update matched tracks with assigned detections
+    if len(matched):
+      t = matched[:, 1]
+      self._update(t, convert_bbox_to_z_batch(dets[matched[:, 0], :4]))
+      self.time_since_update[t] = 0
+      self.hits[t] += 1
+      self.hit_streak[t] += 1
+      self._vote(t, dets[matched[:, 0]])
+
+    # create and initialise new tracks for unmatched detections
+    n = len(unmatched_dets)
+    if n:
+      unmatched_dets = unmatched_dets.astype(int)
+      x = np.zeros((n, 7))
+      x[:, :4] = convert_bbox_to_z_batch(dets[unmatched_dets, :4])
+      ids = np.arange(KalmanBoxTracker.count, KalmanBoxTracker.count + n)
+      KalmanBoxTracker.count += n
+      zeros = np.zeros(n, dtype=int)
+      self.x = np.concatenate((self.x, x))
+      self.P = np.concatenate((self.P, np.broadcast_to(self.P0, (n, 7, 7))))
+      self.ids = np.concatenate((self.ids, ids))
+      self.time_since_update = np.concatenate((self.time_since_update, zeros))
+      self.hits = np.concatenate((self.hits, zeros))
+      self.hit_streak = np.concatenate((self.hit_streak, zeros))
+      self.age = np.concatenate((self.age, zeros))
+      self.score = np.concatenate((self.score, np.zeros(n)))
+      self.votes = np.concatenate((self.votes, np.zeros((n, self.votes.shape[1]))))
+      self._vote(np.arange(len(self.ids) - n, len(self.ids)), dets[unmatched_dets])
+
+    ret = self._output()
+    # remove dead tracklets
+    dead = self.time_since_update > self.max_age
+    if dead.any():
+      self.retired.extend((self.ids[dead][::-1] + 1).tolist())
+      self._keep(~dead)
+    return ret
+
+  def pop_retired(self):
+    """
+    Returns the IDs (as reported by update) of the tracks removed since the last call.
+    """
+    retired, self.retired = self.retired, []
+    return retired
+
+  def extrapolate(self):
+    """
+    Carries every track forward one frame with its Kalman prediction only, see Sort.extrapolate.
+    """
+    self.frame_count += 1
+    self._predict()
+    ret = self._output()
+    return ret[~np.any(np.isnan(ret), axis=1)]
+
+
+TRACKERS = {'sort': Sort, 'vectorized': VectorizedSort}
+
 
 def parse_args():
     """Parse input arguments."""
@@ -265,6 +595,10 @@ def parse_args():
                         help="Minimum number of associated detections before track is initialised.", 
                         type=int, default=3)
     parser.add_argument("--iou_threshold", help="Minimum IOU for match.", type=float, default=0.3)
+    parser.add_argument("--backend", help="Tracker implementation.", choices=sorted(TRACKERS), default='sort')
+    parser.add_argument("--gated", help="Only score overlapping detection/track pairs.", action='store_true')
+    parser.add_argument("--solver", help="Linear assignment solver [lap if installed].", choices=SOLVERS, default=None)
+    parser.add_argument("--eval_iou", help="IOU for a track to cover a ground truth box.", type=float, default=0.5)
     args = parser.parse_args()
     return args
 
@@ -277,6 +611,11 @@ if __name__ == '__main__':
   total_frames = 0
   colours = np.random.rand(32, 3) #used only for display
   if(display):
+    import matplotlib
+    matplotlib.use('TkAgg')
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as patches
+    from skimage import io
     if not os.path.exists('mot_benchmark'):
       print('\n\tERROR: mot_benchmark link not found!\n\n    Create a symbolic link to the MOT benchmark\n    (https://motchallenge.net/data/2D_MOT_2015/#download). E.g.:\n\n    $ ln -s /path/to/MOT2015_challenge/2DMOT2015 mot_benchmark\n\n')
       exit()
@@ -286,14 +625,20 @@ if __name__ == '__main__':
 
   if not os.path.exists('output'):
     os.makedirs('output')
+  # sequences with gt/gt.txt are scored with MOTA/IDF1; tracking_benchmark.py sweeps backends and parameters
+  from tracking_benchmark import evaluate, load_mot_sequence
+  scores = []
   pattern = os.path.join(args.seq_path, phase, '*', 'det', 'det.txt')
   for seq_dets_fn in glob.glob(pattern):
-    mot_tracker = Sort(max_age=args.max_age, 
-                       min_hits=args.min_hits,
-                       iou_threshold=args.iou_threshold) #create instance of the SORT tracker
+    mot_tracker = TRACKERS[args.backend](max_age=args.max_age, 
+                                         min_hits=args.min_hits,
+                                         iou_threshold=args.iou_threshold,
+                                         gated=args.gated,
+                                         solver=args.solver) #create instance of the SORT tracker
     seq_dets = np.loadtxt(seq_dets_fn, delimiter=',')
     seq = seq_dets_fn[pattern.find('*'):].split(os.path.sep)[0]
     
+    hyp = []
     with open(os.path.join('output', '%s.txt'%(seq)),'w') as out_file:
       print("Processing %s."%(seq))
       for frame in range(int(seq_dets[:,0].max())):
@@ -313,6 +658,7 @@ if __name__ == '__main__':
         cycle_time = time.time() - start_time
         total_time += cycle_time
 
+        hyp.extend([frame, d[4], d[0], d[1], d[2], d[3]] for d in trackers)
         for d in trackers:
           print('%d,%d,%.2f,%.2f,%.2f,%.2f,1,-1,-1,-1'%(frame,d[4],d[0],d[1],d[2]-d[0],d[3]-d[1]),file=out_file)
           if(display):
@@ -324,7 +670,17 @@ if __name__ == '__main__':
           plt.draw()
           ax1.cla()
 
+    _, gt = load_mot_sequence(os.path.dirname(os.path.dirname(seq_dets_fn)))
+    if gt is not None:
+      score = evaluate(gt, np.array(hyp).reshape(-1, 6), args.eval_iou)
+      scores.append((len(gt), score))
+      print("  MOTA %.1f%%  IDF1 %.1f%%  IDSW %d  FP %d  FN %d" % (100*score["mota"], 100*score["idf1"], score["id_switches"], score["fp"], score["fn"]))
+
   print("Total Tracking took: %.3f seconds for %d frames or %.1f FPS" % (total_time, total_frames, total_frames / total_time))
+  if scores:
+    num_gt = sum(n for n, _ in scores)
+    errors = sum(s["fp"] + s["fn"] + s["id_switches"] for _, s in scores)
+    print("Overall MOTA %.1f%% over %d sequences with ground truth, %d ID switches" % (100*(1 - errors/num_gt), len(scores), sum(s["id_switches"] for _, s in scores)))
 
   if(display):
     print("Note: to get real runtime results run without the option: --display")
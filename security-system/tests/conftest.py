@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The detector's modules are siblings in security-system/, imported the way road-security.py imports them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
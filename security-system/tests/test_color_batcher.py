@@ -0,0 +1,41 @@
+import numpy as np
+
+from color_batcher import ColorBatcher
+
+
+def test_failing_result_handler_does_not_send_the_batch_to_on_error():
+    calls = []
+
+    def on_result(key, crop, result):
+        calls.append(("result", key))
+        if key == 1:
+            raise RuntimeError("DB queue closed")
+
+    batcher = ColorBatcher(lambda crops, verbose=False: [f"color-{i}" for i in range(len(crops))], on_result,
+                           batch_size=3, max_wait_ms=1000,
+                           on_error=lambda key, crop, error: calls.append(("error", key)))
+    for key in range(3):
+        batcher.submit(key, np.zeros((8, 8, 3), np.uint8))
+    batcher.start()
+    batcher.close()
+
+    assert sorted(calls) == [("result", 0), ("result", 1), ("result", 2)]
+    assert batcher.batches == 1
+
+
+def test_failed_model_call_sends_every_crop_to_on_error():
+    errors = []
+
+    def model(crops, verbose=False):
+        raise RuntimeError("YOLO models unavailable")
+
+    batcher = ColorBatcher(model, lambda key, crop, result: None, batch_size=2, max_wait_ms=1000,
+                           on_error=lambda key, crop, error: errors.append(key))
+    before = batcher.failures.value
+    for key in range(2):
+        batcher.submit(key, np.zeros((8, 8, 3), np.uint8))
+    batcher.start()
+    batcher.close()
+
+    assert errors == [0, 1]
+    assert batcher.failures.value - before == 2
@@ -0,0 +1,34 @@
+import sqlite3
+
+from db_writer import DbWriter
+
+
+def create_table(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS t (x)")
+
+
+def test_group_is_committed_in_one_transaction(tmp_path):
+    db = str(tmp_path / "w.db")
+    writer = DbWriter(db, batch_size=2, max_delay_ms=1000, on_connect=create_table)
+    commits = []
+    writer.batch_rows.observe = commits.append
+    writer.submit("INSERT INTO t (x) VALUES (?)", (0,))
+    writer.submit_group([("INSERT INTO t (x) VALUES (?)", [(1,)]), ("INSERT INTO t (x) VALUES (?)", [(2,), (3,)])])
+    writer.start()
+    assert writer.flush(timeout=5)
+    writer.close()
+
+    # batch_size=2 cannot split the group of three rows: the single row is committed first, then the group
+    assert commits == [1, 3]
+    assert sqlite3.connect(db).execute("SELECT COUNT(*) FROM t").fetchone()[0] == 4
+
+
+def test_unexpected_error_drops_the_batch_and_keeps_the_writer(tmp_path):
+    writer = DbWriter(str(tmp_path / "w.db"), batch_size=1, max_delay_ms=10, on_connect=create_table)
+    writer.start()
+    writer.submit("INSERT INTO t (x) VALUES (?)", (2 ** 70,))  # OverflowError, not a sqlite3.Error
+    writer.flush(timeout=5)
+    writer.submit("INSERT INTO t (x) VALUES (?)", (1,))
+    assert writer.flush(timeout=5)
+    assert writer.is_alive() and writer.ok
+    writer.close()
@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+from benchmark import StubModels, make_synthetic_mask, make_synthetic_video
+from camera import CameraPipeline, DetectionStride
+from pipeline import BLOCK, FrameQueue, Stage
+from security import SecuritySystem
+
+
+class BrokenDetector(StubModels):
+    def detect(self, images, **kwargs):
+        raise RuntimeError("YOLO models unavailable")
+
+
+# The crashed stage re-raises on its thread after stopping the stream
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_crashed_middle_stage_stops_its_stream(tmp_path):
+    video, mask = str(tmp_path / "v.mp4"), str(tmp_path / "m.png")
+    limit = make_synthetic_video(video, frames=60)
+    make_synthetic_mask(mask)
+    security = SecuritySystem(str(tmp_path / "blacklist.csv"), db_path=str(tmp_path / "t.db"))
+    # Queues of one packet fill up at once, so decode is blocked on its put when detect crashes
+    models = BrokenDetector()
+    stream = CameraPipeline("t", video, mask, models, security, limit=limit, queue_size=1, policy=BLOCK, draw=False)
+    stream.start()
+
+    joined = threading.Thread(target=stream.join, daemon=True)
+    joined.start()
+    joined.join(timeout=10)
+    assert not joined.is_alive()
+    assert stream.stopped()
+    assert isinstance(stream.error, RuntimeError)
+    models.close()
+    security.close()
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_stage_crash_sets_stop_event():
+    stop_event = threading.Event()
+    inbox, outbox = FrameQueue("in", 1, BLOCK), FrameQueue("out", 1, BLOCK)
+    source = Stage("source", lambda: 1, None, inbox, stop_event)
+
+    def crash(item):
+        raise ValueError("bad packet")
+    middle = Stage("middle", crash, inbox, outbox, stop_event)
+    source.start()
+    middle.start()
+    middle.join(timeout=5)
+    source.join(timeout=5)
+    assert not source.is_alive() and not middle.is_alive()
+    assert stop_event.is_set()
+    assert isinstance(middle.error, ValueError)
+
+
+def test_fixed_stride_ignores_detect_time():
+    stride = DetectionStride(max_stride=3, fixed=True)
+    plan = []
+    for detect_ms in (5, 500, 5, 500, 5, 500, 5, 500, 5):
+        detected = stride.should_detect()
+        plan.append(detected)
+        if detected:
+            stride.observe_detection(detect_ms)
+    assert plan == [False, False, True] * 3
+
+
+def test_tracking_stage_detects_skipped_frame_near_line():
+    stride = DetectionStride(max_stride=3, fixed=True)
+    assert not stride.should_detect()
+    assert not stride.must_detect()
+    stride.near_line = True
+    # The detect stage runs ahead and has already skipped the frame; tracking catches it up
+    assert not stride.should_detect()
+    assert stride.must_detect()
+    assert (stride.detected_frames, stride.extrapolated_frames, stride.late_detections) == (1, 1, 1)
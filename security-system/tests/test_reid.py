@@ -0,0 +1,48 @@
+import numpy as np
+
+from reid import ReIdGallery, color_embedding
+from vehicle_store import VehicleStore
+
+
+def red_car_crop():
+    crop = np.full((120, 100, 3), 70, np.uint8)
+    crop[20:100, 20:80] = (0, 0, 220)
+    return crop
+
+
+def seen(store, Id, first_seen, last_seen, point):
+    record = store.create(Id, "car", first_seen)
+    record.last_seen = last_seen
+    store.trajectories.append([record.row], np.array([point]), last_seen)
+    return record
+
+
+def test_simultaneous_look_alikes_are_not_merged():
+    store = VehicleStore("reid-test")
+    gallery = ReIdGallery("reid-test")
+    embedding = color_embedding(red_car_crop())
+    # Two red cars driving side by side, both tracked since t=10; the first one misses a detection at t=12
+    first = seen(store, 1, 10.0, 11.9, (300, 400))
+    second = seen(store, 2, 10.0, 12.0, (380, 400))
+    gallery.add(first, embedding)
+
+    assert gallery.match(embedding, (380, 400), second.first_seen, now=12.0) is None
+    # Even once SORT retires the first track, the second one did not appear after it was lost
+    store.evict([1])
+    gallery.retire([1])
+    assert gallery.match(embedding, (380, 400), second.first_seen, now=12.5) is None
+    assert gallery.merges.value == 0
+
+
+def test_new_track_after_a_retired_look_alike_is_merged():
+    store = VehicleStore("reid-test-merge")
+    gallery = ReIdGallery("reid-test-merge")
+    embedding = color_embedding(red_car_crop())
+    lost = seen(store, 1, 10.0, 11.0, (300, 400))
+    gallery.add(lost, embedding)
+    store.evict([1])
+    gallery.retire([1])
+
+    new = seen(store, 2, 11.5, 12.0, (320, 420))
+    assert gallery.match(embedding, (320, 420), new.first_seen, now=12.0) is lost
+    assert len(gallery) == 0
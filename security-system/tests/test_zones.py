@@ -0,0 +1,12 @@
+from zones import ZoneSet
+
+
+def test_quiet_period_is_not_reported_with_the_next_counts():
+    rows = []
+    zones = ZoneSet("t", tripwires=[{"name": "line", "points": [[0, 50], [100, 50]]}], flush_s=60, sink=rows.extend)
+    # An hour with no traffic flushes nothing
+    for now in range(0, 3600, 30):
+        zones.update([], [], [], [], now)
+    zones.update([[50, 40]], [[50, 60]], [True], ["car"], 3610)
+    # The crossing is reported for the period after the last empty flush at 3540, not since 0
+    assert [row[4:] for row in rows] == [(1, 3540, 3610)]
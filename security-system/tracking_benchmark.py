@@ -0,0 +1,293 @@
+"""
+Tracking accuracy and speed benchmark for the SORT backends.
+
+Runs every tracker configuration of a parameter sweep over MOT sequences (det/det.txt + gt/gt.txt) or over
+synthetic traffic sequences, and reports MOTA, IDF1, ID switches and tracking throughput per configuration.
+
+    python tracking_benchmark.py --synthetic 4
+    python tracking_benchmark.py --seq_path data --phase train --max_age 1,5,20 --min_hits 1,3
+    python tracking_benchmark.py --synthetic 4 --out mot_report.json --history mot_history.jsonl
+
+The JSON report holds every row; --history appends one summary line per run so throughput can be followed
+across commits.
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import platform
+import time
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+import sort
+from sort import TRACKERS, iou_batch
+
+# MOT rows used below: [frame, id, x1, y1, x2, y2] for tracks and ground truth, [frame, x1, y1, x2, y2, score]
+# for detections
+GT_COLUMNS = 6
+
+
+def load_mot_sequence(seq_dir):
+    """Detections and (if present) ground truth of one MOT challenge sequence directory."""
+    raw = np.loadtxt(os.path.join(seq_dir, 'det', 'det.txt'), delimiter=',', ndmin=2)
+    dets = np.column_stack((raw[:, 0], raw[:, 2:4], raw[:, 2:4] + raw[:, 4:6], raw[:, 6]))
+    gt = None
+    gt_path = os.path.join(seq_dir, 'gt', 'gt.txt')
+    if os.path.exists(gt_path):
+        raw = np.loadtxt(gt_path, delimiter=',', ndmin=2)
+        # column 6 is the "consider" flag; MOT16+ put the class in column 7 (1 = pedestrian, MOT15 has -1)
+        keep = raw[:, 6] != 0
+        if raw.shape[1] > 7:
+            keep &= np.isin(raw[:, 7], (-1, 1))
+        raw = raw[keep]
+        gt = np.column_stack((raw[:, 0:2], raw[:, 2:4], raw[:, 2:4] + raw[:, 4:6]))
+    return dets, gt
+
+
+def make_synthetic_sequence(frames=600, vehicles=40, width=1920, height=1080, miss_rate=0.1, occlusion_rate=0.01,
+                            clutter_rate=0.2, noise=3.0, seed=0):
+    """
+    A traffic-like sequence without downloading MOT data: vehicles enter at random times, drive across the
+    frame at a constant velocity with small heading changes and leave it. Detections drop vehicles at random
+    and for short occlusions, jitter the boxes and add clutter boxes.
+    Returns (dets, gt) in the row formats above.
+    """
+    rng = np.random.default_rng(seed)
+    gt_rows, det_rows = [], []
+    start = rng.integers(0, max(1, frames - 60), vehicles)
+    y = rng.uniform(0.15 * height, 0.85 * height, vehicles)
+    direction = rng.choice((-1, 1), vehicles)
+    x = np.where(direction > 0, -50.0, width + 50.0)
+    vx = direction * rng.uniform(4, 18, vehicles)
+    vy = rng.normal(0, 0.6, vehicles)
+    w = rng.uniform(60, 200, vehicles)
+    h = w * rng.uniform(0.45, 0.8, vehicles)
+    occluded = np.zeros(vehicles, dtype=int)
+    for frame in range(1, frames + 1):
+        active = (start < frame) & (x > -120) & (x < width + 120)
+        moving = start < frame
+        x[moving] += vx[moving]
+        y[moving] += vy[moving]
+        vy[moving] += rng.normal(0, 0.05, moving.sum())
+        boxes = np.column_stack((x - w / 2, y - h / 2, x + w / 2, y + h / 2))
+        visible = active & (boxes[:, 2] > 0) & (boxes[:, 0] < width)
+        for i in np.flatnonzero(visible):
+            gt_rows.append((frame, i + 1, *boxes[i]))
+
+        occluded[visible & (occluded == 0) & (rng.random(vehicles) < occlusion_rate)] = rng.integers(3, 15)
+        detected = visible & (occluded == 0) & (rng.random(vehicles) > miss_rate)
+        occluded[occluded > 0] -= 1
+        for i in np.flatnonzero(detected):
+            det_rows.append((frame, *(boxes[i] + rng.normal(0, noise, 4)), rng.uniform(0.4, 1.0)))
+        for _ in range(rng.poisson(clutter_rate)):
+            cx, cy, s = rng.uniform(0, width), rng.uniform(0, height), rng.uniform(30, 120)
+            det_rows.append((frame, cx, cy, cx + s, cy + s * 0.6, rng.uniform(0.3, 0.6)))
+    return np.array(det_rows).reshape(-1, 6), np.array(gt_rows).reshape(-1, GT_COLUMNS)
+
+
+def run_tracker(dets, num_frames, tracker, params):
+    """Runs one tracker configuration over a sequence; returns its track rows and the time spent in update()."""
+    sort.KalmanBoxTracker.count = 0
+    mot_tracker = TRACKERS[tracker](**params)
+    frame_of = dets[:, 0].astype(int)
+    order = np.argsort(frame_of, kind='stable')
+    bounds = np.searchsorted(frame_of[order], np.arange(1, num_frames + 2))
+    rows, elapsed = [], 0.0
+    for frame in range(1, num_frames + 1):
+        frame_dets = dets[order[bounds[frame - 1]:bounds[frame]], 1:6]
+        start = time.perf_counter()
+        tracks = mot_tracker.update(frame_dets)
+        elapsed += time.perf_counter() - start
+        if len(tracks):
+            rows.append(np.column_stack((np.full(len(tracks), frame), tracks[:, 4], tracks[:, :4])))
+    hyp = np.concatenate(rows) if rows else np.empty((0, GT_COLUMNS))
+    return hyp, elapsed
+
+
+def _by_frame(rows):
+    frames = rows[:, 0].astype(int)
+    order = np.argsort(frames, kind='stable')
+    keys, starts = np.unique(frames[order], return_index=True)
+    return {k: rows[idx] for k, idx in zip(keys, np.split(order, starts[1:]))}
+
+
+def evaluate(gt, hyp, iou_threshold=0.5):
+    """
+    CLEAR MOT (MOTA, ID switches) and identity (IDF1) metrics of track rows against ground truth rows.
+    A ground truth box and a track box correspond when their IoU is at least iou_threshold. Per frame,
+    correspondences from the previous frame are kept while still valid and the rest are assigned by maximum IoU.
+    """
+    gt_frames, hyp_frames = _by_frame(gt), _by_frame(hyp)
+    gt_ids, hyp_ids = np.unique(gt[:, 1]), np.unique(hyp[:, 1])
+    id_overlap = np.zeros((len(gt_ids), len(hyp_ids)))
+    previous, last_hyp = {}, {}
+    tp = fp = fn = switches = 0
+    empty = np.empty((0, GT_COLUMNS))
+    for frame in sorted(set(gt_frames) | set(hyp_frames)):
+        g, h = gt_frames.get(frame, empty), hyp_frames.get(frame, empty)
+        matched = 0
+        current = {}
+        if len(g) and len(h):
+            iou = iou_batch(g[:, 2:6], h[:, 2:6])
+            valid = iou >= iou_threshold
+            gi, hi = np.nonzero(valid)
+            np.add.at(id_overlap, (np.searchsorted(gt_ids, g[gi, 1]), np.searchsorted(hyp_ids, h[hi, 1])), 1)
+
+            cost = np.where(valid, 1 - iou, 1e6)
+            keep = np.array([previous.get(gid) for gid in g[:, 1]], dtype=float)
+            cost[(h[None, :, 1] == keep[:, None]) & valid] = -1  # keep still valid correspondences
+            rows, cols = linear_sum_assignment(cost)
+            ok = valid[rows, cols]
+            for gid, hid in zip(g[rows[ok], 1], h[cols[ok], 1]):
+                if gid in last_hyp and last_hyp[gid] != hid:
+                    switches += 1
+                last_hyp[gid] = hid
+                current[gid] = hid
+            matched = int(ok.sum())
+        previous = current
+        tp += matched
+        fn += len(g) - matched
+        fp += len(h) - matched
+
+    num_gt = len(gt)
+    rows, cols = linear_sum_assignment(-id_overlap) if id_overlap.size else (np.array([], int), np.array([], int))
+    idtp = id_overlap[rows, cols].sum()
+    return {
+        "mota": 1 - (fn + fp + switches) / num_gt if num_gt else 0.0,
+        "idf1": 2 * idtp / (num_gt + len(hyp)) if num_gt + len(hyp) else 0.0,
+        "id_switches": switches,
+        "fp": fp,
+        "fn": fn,
+        "precision": tp / (tp + fp) if tp + fp else 0.0,
+        "recall": tp / num_gt if num_gt else 0.0,
+        "gt_tracks": len(gt_ids),
+        "tracks": len(hyp_ids),
+    }
+
+
+def load_sequences(args):
+    """[(name, dets, gt)] from the MOT directory layout or the synthetic generator."""
+    sequences = []
+    if args.synthetic:
+        for i in range(args.synthetic):
+            dets, gt = make_synthetic_sequence(args.frames, args.vehicles, seed=args.seed + i)
+            sequences.append((f"synthetic-{i}", dets, gt))
+    else:
+        pattern = os.path.join(args.seq_path, args.phase, '*', 'det', 'det.txt')
+        for det_path in sorted(glob.glob(pattern)):
+            seq_dir = os.path.dirname(os.path.dirname(det_path))
+            dets, gt = load_mot_sequence(seq_dir)
+            if gt is None:
+                print(f"Skipping {seq_dir}: no gt/gt.txt")
+                continue
+            sequences.append((os.path.basename(seq_dir), dets, gt))
+    return sequences
+
+
+def sweep(sequences, trackers, max_ages, min_hits, iou_thresholds, gated, eval_iou=0.5):
+    """One row per tracker configuration with metrics summed over all sequences."""
+    results = []
+    for tracker, max_age, hits, iou_threshold, gate in itertools.product(trackers, max_ages, min_hits,
+                                                                       iou_thresholds, gated):
+        params = {"max_age": max_age, "min_hits": hits, "iou_threshold": iou_threshold, "gated": gate}
+        totals = {"fp": 0, "fn": 0, "id_switches": 0, "gt": 0, "hyp": 0, "idtp": 0.0, "frames": 0,
+                  "elapsed_s": 0.0}
+        per_sequence = {}
+        for name, dets, gt in sequences:
+            num_frames = int(max(dets[:, 0].max(initial=0), gt[:, 0].max(initial=0)))
+            hyp, elapsed = run_tracker(dets, num_frames, tracker, params)
+            metrics = evaluate(gt, hyp, eval_iou)
+            metrics["fps"] = num_frames / elapsed if elapsed > 0 else 0.0
+            per_sequence[name] = metrics
+            totals["fp"] += metrics["fp"]
+            totals["fn"] += metrics["fn"]
+            totals["id_switches"] += metrics["id_switches"]
+            totals["gt"] += len(gt)
+            totals["hyp"] += len(hyp)
+            totals["idtp"] += metrics["idf1"] * (len(gt) + len(hyp)) / 2
+            totals["frames"] += num_frames
+            totals["elapsed_s"] += elapsed
+        gt_total = totals["gt"]
+        results.append({
+            "tracker": tracker, **params,
+            "mota": 1 - (totals["fp"] + totals["fn"] + totals["id_switches"]) / gt_total if gt_total else 0.0,
+            "idf1": 2 * totals["idtp"] / (gt_total + totals["hyp"]) if gt_total + totals["hyp"] else 0.0,
+            "id_switches": totals["id_switches"], "fp": totals["fp"], "fn": totals["fn"],
+            "fps": totals["frames"] / totals["elapsed_s"] if totals["elapsed_s"] > 0 else 0.0,
+            "ms_per_frame": 1000 * totals["elapsed_s"] / totals["frames"] if totals["frames"] else 0.0,
+            "sequences": per_sequence,
+        })
+    return results
+
+
+def print_table(results):
+    print(f"{'tracker':<11}{'gated':>6}{'age':>5}{'hits':>5}{'iou':>6}{'MOTA':>8}{'IDF1':>8}{'IDSW':>6}"
+          f"{'FP':>7}{'FN':>7}{'ms/fr':>8}{'fps':>9}")
+    for r in sorted(results, key=lambda r: (-r["mota"], -r["idf1"])):
+        print(f"{r['tracker']:<11}{'yes' if r['gated'] else 'no':>6}{r['max_age']:>5}{r['min_hits']:>5}"
+              f"{r['iou_threshold']:>6.2f}{100 * r['mota']:>7.1f}%{100 * r['idf1']:>7.1f}%{r['id_switches']:>6}"
+              f"{r['fp']:>7}{r['fn']:>7}{r['ms_per_frame']:>8.2f}{r['fps']:>9.1f}")
+
+
+def _list(cast):
+    return lambda text: [cast(v) for v in text.split(',')]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='SORT accuracy and speed benchmark')
+    parser.add_argument('--seq_path', default='data', help='MOT data root [data]')
+    parser.add_argument('--phase', default='train', help='Subdirectory in seq_path [train]')
+    parser.add_argument('--synthetic', type=int, default=0, help='Use N synthetic sequences instead of MOT data')
+    parser.add_argument('--frames', type=int, default=600, help='Frames per synthetic sequence [600]')
+    parser.add_argument('--vehicles', type=int, default=40, help='Vehicles per synthetic sequence [40]')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trackers', type=_list(str), default=sorted(TRACKERS),
+                        help=f"Comma separated tracker backends {sorted(TRACKERS)}")
+    parser.add_argument('--max_age', type=_list(int), default=[1, 5, 20])
+    parser.add_argument('--min_hits', type=_list(int), default=[1, 3])
+    parser.add_argument('--iou_threshold', type=_list(float), default=[0.3])
+    parser.add_argument('--gated', type=_list(int), default=[0], help='0, 1 or 0,1 [0]')
+    parser.add_argument('--eval_iou', type=float, default=0.5, help='IoU for a track to cover a ground truth box')
+    parser.add_argument('--out', help='Write the full JSON report here')
+    parser.add_argument('--history', help='Append a one-line summary of this run to this JSONL file')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    unknown = set(args.trackers) - set(TRACKERS)
+    if unknown:
+        raise SystemExit(f"Unknown tracker(s) {sorted(unknown)}, expected {sorted(TRACKERS)}")
+    sequences = load_sequences(args)
+    if not sequences:
+        raise SystemExit(f"No sequences with ground truth under {os.path.join(args.seq_path, args.phase)}; "
+                         f"use --synthetic N to generate some")
+    print(f"{len(sequences)} sequence(s): {', '.join(name for name, _, _ in sequences)}")
+
+    results = sweep(sequences, args.trackers, args.max_age, args.min_hits, args.iou_threshold,
+                    [bool(g) for g in args.gated], args.eval_iou)
+    print_table(results)
+
+    report = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "environment": {"python": platform.python_version(), "machine": platform.machine(),
+                        "numpy": np.__version__, "lap": sort.lap is not None},
+        "sequences": [name for name, _, _ in sequences],
+        "eval_iou": args.eval_iou,
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.history:
+        best = max(results, key=lambda r: (r["mota"], r["idf1"]))
+        summary = {"created": report["created"], "sequences": report["sequences"],
+                   "best": {k: v for k, v in best.items() if k != "sequences"},
+                   "ms_per_frame": {f"{r['tracker']}/age{r['max_age']}/hits{r['min_hits']}/"
+                                    f"iou{r['iou_threshold']}/{'gated' if r['gated'] else 'dense'}": r["ms_per_frame"]
+                                    for r in results}}
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(summary) + '\n')
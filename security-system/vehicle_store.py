@@ -0,0 +1,256 @@
+"""
+Per-stream vehicle state, bounded by the tracker's lifetime.
+
+Records are created when SORT reports a new track ID and evicted when SORT retires the track
+(time_since_update > max_age), so memory stays flat over multi-day runs instead of growing with
+every ID ever seen. The trajectories of all live tracks share one TrajectoryStore, so velocity, heading,
+drift and stall time are computed for the whole frame with array operations.
+"""
+import time
+
+import numpy as np
+
+from metrics import REGISTRY
+
+TRAJECTORY_LEN = 20
+EMPTY_TRAJECTORY = np.zeros((0, 2), dtype=np.int32)
+
+
+class TrajectoryStore:
+    """
+    The last `length` (x, y) centre points and timestamps of every live track of a stream, one ring buffer
+    row per track. Each point is written twice, at slot i and i + length, so the last n points of a row are
+    always one contiguous slice and points() returns a view instead of a copy.
+    """
+    def __init__(self, length=TRAJECTORY_LEN, capacity=64):
+        self.length = length
+        self.xy = np.zeros((capacity, 2 * length, 2), dtype=np.int32)
+        self.t = np.zeros((capacity, 2 * length))
+        self.head = np.zeros(capacity, dtype=np.intp)    # slot of the next point
+        self.count = np.zeros(capacity, dtype=np.intp)   # points held, at most `length`
+        self.stall_start = np.full(capacity, np.nan)     # since when the track stands still, NaN if moving
+        self.live = np.zeros(capacity, dtype=bool)
+        self.columns = {}  # extra per-row state, e.g. since when a hazard rule holds, see column()
+        self._free = list(range(capacity - 1, -1, -1))
+
+    def __len__(self):
+        return int(self.live.sum())
+
+    def _grow(self):
+        old = len(self.live)
+        self.xy = np.concatenate((self.xy, np.zeros_like(self.xy)))
+        self.t = np.concatenate((self.t, np.zeros_like(self.t)))
+        self.head = np.concatenate((self.head, np.zeros_like(self.head)))
+        self.count = np.concatenate((self.count, np.zeros_like(self.count)))
+        self.stall_start = np.concatenate((self.stall_start, np.full(old, np.nan)))
+        self.live = np.concatenate((self.live, np.zeros_like(self.live)))
+        for name, values in self.columns.items():
+            self.columns[name] = np.concatenate((values, np.full(old, np.nan)))
+        self._free.extend(range(2 * old - 1, old - 1, -1))
+
+    def alloc(self):
+        """An empty row for a new track."""
+        if not self._free:
+            self._grow()
+        row = self._free.pop()
+        self.head[row] = self.count[row] = 0
+        self.stall_start[row] = np.nan
+        for values in self.columns.values():
+            values[row] = np.nan
+        self.live[row] = True
+        return row
+
+    def free(self, row):
+        self.live[row] = False
+        self._free.append(row)
+
+    def append(self, rows, points, now):
+        """Appends one (x, y) point per row, all taken at time `now`."""
+        rows = np.asarray(rows, dtype=np.intp)
+        head = self.head[rows]
+        for slot in (head, head + self.length):
+            self.xy[rows, slot] = points
+            self.t[rows, slot] = now
+        self.head[rows] = (head + 1) % self.length
+        self.count[rows] = np.minimum(self.count[rows] + 1, self.length)
+
+    def _end(self, row):
+        return (self.head[row] - 1) % self.length + 1 + self.length
+
+    def points(self, row):
+        """The points of one row, oldest first, as an (n, 2) int32 view."""
+        end = self._end(row)
+        return self.xy[row, end - self.count[row]:end]
+
+    def times(self, row):
+        end = self._end(row)
+        return self.t[row, end - self.count[row]:end]
+
+    def column(self, name):
+        """A float array with one value per row, NaN for new rows, that lives as long as the store."""
+        if name not in self.columns:
+            self.columns[name] = np.full(len(self.live), np.nan)
+        return self.columns[name]
+
+    def window(self, rows, n):
+        """
+        The last n points of each row as a (len(rows), n, 2) array, oldest first. Rows holding fewer than n
+        points start with stale values, check `count`.
+        """
+        if n > self.length:
+            raise ValueError(f"window of {n} points is longer than the trajectories ({self.length})")
+        rows = np.asarray(rows, dtype=np.intp)
+        end = (self.head[rows] - 1) % self.length + 1 + self.length
+        return self.xy[rows[:, None], end[:, None] - n + np.arange(n)]
+
+    def point(self, rows, back=1):
+        """The point `back` steps from the end of each row (1 = latest); rows must hold at least `back` points."""
+        rows = np.asarray(rows, dtype=np.intp)
+        return self.xy[rows, (self.head[rows] - back) % self.length]
+
+    def last_points(self):
+        """Latest point of every live track that has one."""
+        return self.point(np.flatnonzero(self.live & (self.count > 0)))
+
+    def velocity(self, rows):
+        """Length of the last step in px/frame, 0 for rows with fewer than 2 points."""
+        step = (self.point(rows, 1) - self.point(rows, 2)).astype(float)
+        return np.where(self.count[rows] >= 2, np.hypot(step[:, 0], step[:, 1]), 0.0)
+
+    def heading(self, rows):
+        """Direction of the last step in degrees (0 = +x, 90 = +y, i.e. down the image)."""
+        step = (self.point(rows, 1) - self.point(rows, 2)).astype(float)
+        return np.degrees(np.arctan2(step[:, 1], step[:, 0]))
+
+    def drift(self, rows, span=10):
+        """Horizontal distance covered over the last `span` points, 0 for rows with fewer points."""
+        rows = np.asarray(rows, dtype=np.intp)
+        dx = np.abs(self.point(rows, 1)[:, 0] - self.point(rows, span)[:, 0])
+        return np.where(self.count[rows] >= span, dx, 0)
+
+    def stall_seconds(self, rows, now, min_speed):
+        """
+        Updates the stall start of each row with its last step and returns for how long it has been standing
+        still: 0 while it moves at `min_speed` px/frame or more, and on the first still step.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        start = self.stall_start[rows]
+        start = np.where((self.velocity(rows) >= min_speed) | np.isnan(start), now, start)
+        self.stall_start[rows] = start
+        return now - start
+
+
+class VehicleRecord:
+    """
+    State of one tracked vehicle. __slots__ keeps it to a fixed, small footprint. While the track lives its
+    trajectory and stall start are read from its row of the stream's TrajectoryStore; detach() keeps a copy
+    once the row is freed.
+    """
+    __slots__ = ("id", "type", "color", "logged", "uploaded", "color_queued", "is_blacklisted", "is_aggressive",
+                 "hazard_type", "first_seen", "last_seen", "crossed_at", "confidence", "frames", "embedding",
+                 "reid_of", "merged_into", "row", "_trajectories", "_tail", "_stall_start")
+
+    def __init__(self, Id, v_type, now=None, trajectories=None, row=None):
+        now = time.time() if now is None else now
+        self.id = Id
+        self.type = v_type
+        self.color = "Scanning..."
+        self.logged = False
+        self.uploaded = False
+        self.color_queued = False
+        self.is_blacklisted = False
+        self.is_aggressive = False
+        self.hazard_type = None
+        self.first_seen = now
+        self.last_seen = now
+        self.crossed_at = None  # frame time of the crop sent to the color model
+        self.confidence = None  # detection score of the track on that frame
+        self.frames = 0
+        self.embedding = None  # appearance embedding for re-ID, see reid.color_embedding
+        self.reid_of = None    # ID of the lost vehicle this track was merged into
+        self.merged_into = None  # the new track this record was merged into by re-ID, see reid.merge_into
+        self.row = row         # row in the TrajectoryStore, None once evicted
+        self._trajectories = trajectories
+        self._tail = EMPTY_TRAJECTORY
+        self._stall_start = None
+
+    @property
+    def trajectory(self):
+        """Last (x, y) centre points, oldest first, as an (n, 2) int32 array."""
+        if self.row is None:
+            return self._tail
+        return self._trajectories.points(self.row)
+
+    @property
+    def stall_start(self):
+        if self.row is None:
+            return self._stall_start
+        start = self._trajectories.stall_start[self.row]
+        return None if np.isnan(start) else float(start)
+
+    @stall_start.setter
+    def stall_start(self, value):
+        if self.row is None:
+            self._stall_start = value
+        else:
+            self._trajectories.stall_start[self.row] = np.nan if value is None else value
+
+    def detach(self):
+        """Copies the trajectory out of the store before its row is reused (the record may outlive its track)."""
+        if self.row is None:
+            return
+        self._tail = self.trajectory.copy()
+        self._stall_start = self.stall_start
+        self.row = None
+
+
+class VehicleStore:
+    """
+    Live VehicleRecords of one stream keyed by track ID. `on_evict(record)` is called for every record
+    removed with evict(), e.g. to flush its final state to the DB.
+    """
+    def __init__(self, name, on_evict=None):
+        self.on_evict = on_evict
+        self._records = {}
+        self.trajectories = TrajectoryStore()
+        labels = {"stream": name}
+        REGISTRY.gauge('vehicle_records', 'Live vehicle state records', labels, fn=lambda: len(self._records))
+        self.evicted = REGISTRY.counter('vehicle_records_evicted_total', 'Vehicle records evicted with their track',
+                                        labels)
+
+    def __contains__(self, Id):
+        return Id in self._records
+
+    def __getitem__(self, Id):
+        return self._records[Id]
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, Id):
+        return self._records.get(Id)
+
+    def create(self, Id, v_type, now=None):
+        record = self._records[Id] = VehicleRecord(Id, v_type, now, self.trajectories, self.trajectories.alloc())
+        return record
+
+    def items(self):
+        return self._records.items()
+
+    def values(self):
+        return self._records.values()
+
+    def evict(self, ids):
+        for Id in ids:
+            record = self._records.pop(Id, None)
+            if record is None:
+                continue
+            row = record.row
+            record.detach()
+            self.trajectories.free(row)
+            self.evicted.inc()
+            if self.on_evict is not None:
+                self.on_evict(record)
+
+    def evict_all(self):
+        self.evict(list(self._records))
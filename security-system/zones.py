@@ -0,0 +1,168 @@
+"""
+Tripwires and polygon zones of a camera, with per-zone counters.
+
+A tripwire is a segment at any angle. A track crosses it when the step between its previous and current centre
+intersects the segment, so a fast vehicle that jumps over the line between two frames still counts. A zone is
+a polygon; tracks entering and leaving it are counted. Both tests run for all tracks against all tripwires and
+zones as array operations. Counts are kept in memory and handed to `sink` (SecuritySystem.log_zone_counts) in
+one batch every `flush_s` seconds of frame time.
+
+Per camera in cameras.json:
+    "tripwires": [{"name": "stop-line", "points": [[100, 340], [1200, 340]], "log": true}],
+    "zones": [{"name": "bus-bay", "polygon": [[0, 400], [300, 400], [300, 720], [0, 720]]}]
+Without tripwires the camera's counting line (`limit`) becomes the "limit" tripwire. Vehicles crossing a
+tripwire with "log": true are color-classified and logged.
+"""
+import time
+
+import numpy as np
+
+from hazard_rules import points_in_polygon
+from metrics import REGISTRY
+
+FORWARD, BACKWARD = "forward", "backward"  # crossed to the right / left of the tripwire's first -> second point
+ENTER, EXIT = "enter", "exit"
+
+
+def _cross(ax, ay, bx, by):
+    return ax * by - ay * bx
+
+
+def segment_crossings(prev, curr, a, b):
+    """
+    Crossings of n steps prev -> curr over k segments a -> b as an (n, k) array: +1 when the step crosses to
+    the right of a -> b as seen on the image (y down), -1 to the left, 0 when it does not cross. A point on
+    the segment counts as right of it, so a step that ends on the wire and then leaves it crosses once.
+    """
+    px, py = prev[:, None, 0], prev[:, None, 1]
+    qx, qy = curr[:, None, 0], curr[:, None, 1]
+    ax, ay, bx, by = a[None, :, 0], a[None, :, 1], b[None, :, 0], b[None, :, 1]
+    right_p = _cross(bx - ax, by - ay, px - ax, py - ay) >= 0
+    right_q = _cross(bx - ax, by - ay, qx - ax, qy - ay) >= 0
+    # ...and the ends of the segment lie on different sides of the step (or on it)
+    ends = _cross(qx - px, qy - py, ax - px, ay - py) * _cross(qx - px, qy - py, bx - px, by - py)
+    hit = (right_p != right_q) & (ends <= 0)
+    return np.where(hit, np.where(right_q, 1, -1), 0)
+
+
+def point_segment_distance(points, a, b):
+    """(n, k) distance of n points to k segments a -> b."""
+    ab = b - a
+    ap = points[:, None, :] - a[None, :, :]
+    t = np.clip((ap * ab).sum(axis=2) / np.maximum((ab * ab).sum(axis=1), 1e-9), 0, 1)
+    closest = a[None, :, :] + t[..., None] * ab[None, :, :]
+    return np.hypot(*(points[:, None, :] - closest).transpose(2, 0, 1))
+
+
+class ZoneSet:
+    """The tripwires and zones of one stream and the counts of what crossed them since the last flush."""
+    def __init__(self, stream, tripwires=(), zones=(), flush_s=60.0, sink=None, new_track_px=15):
+        self.stream = stream
+        self.tripwire_names = [w["name"] for w in tripwires]
+        segments = np.array([w["points"] for w in tripwires], dtype=float).reshape(-1, 2, 2)
+        self.a, self.b = segments[:, 0], segments[:, 1]
+        self.logging = np.array([bool(w.get("log", False)) for w in tripwires], dtype=bool)
+        self.zone_names = [z["name"] for z in zones]
+        self.polygons = [np.asarray(z["polygon"], dtype=float) for z in zones]
+        names = self.tripwire_names + self.zone_names
+        if len(set(names)) != len(names):
+            raise ValueError(f"[{stream}] tripwire and zone names must be unique: {names}")
+
+        self.flush_s = flush_s
+        self.sink = sink
+        # A track first reported this close to a logging tripwire is logged too: SORT only reports a track after
+        # min_hits frames, which can be after it crossed
+        self.new_track_px = new_track_px
+        self.counts = {}    # (zone, event, vehicle type) -> count since period_start
+        self.totals = {name: 0 for name in names}
+        self.period_start = None
+        self.last_time = None
+        self.occupancy = np.zeros(len(self.polygons), dtype=int)
+        labels = {"stream": stream}
+        self._events = {}
+        for i, name in enumerate(self.zone_names):
+            REGISTRY.gauge('zone_occupancy', 'Tracks inside a polygon zone', {**labels, "zone": name},
+                           fn=lambda i=i: int(self.occupancy[i]))
+        self.flush_ms = REGISTRY.histogram('zone_flush_ms', 'Latency of writing the zone counters', labels)
+
+    @classmethod
+    def for_camera(cls, stream, limit, tripwires=None, zones=None, **kwargs):
+        """The configured tripwires, or the counting line `limit` as the only (logging) tripwire."""
+        if not tripwires:
+            tripwires = [{"name": "limit", "points": [limit[:2], limit[2:]], "log": True}]
+        return cls(stream, tripwires, zones or (), **kwargs)
+
+    def near_logging_wire(self, points, distance):
+        """Whether any of the (n, 2) points lies within `distance` px of a logging tripwire."""
+        if len(points) == 0 or not self.logging.any():
+            return False
+        d = point_segment_distance(np.asarray(points, dtype=float), self.a[self.logging], self.b[self.logging])
+        return bool((d < distance).any())
+
+    def _count(self, zone, event, v_type):
+        key = (zone, event, v_type)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.totals[zone] += 1
+        if (zone, event) not in self._events:
+            self._events[zone, event] = REGISTRY.counter('zone_events_total',
+                                                         'Tripwire crossings and zone entries/exits',
+                                                         {"stream": self.stream, "zone": zone, "event": event})
+        self._events[zone, event].inc()
+
+    def update(self, prev, curr, has_prev, types, now):
+        """
+        Counts the crossings and zone entries/exits of one frame. prev/curr are the (n, 2) previous and current
+        centres of the tracks, has_prev masks tracks without a previous centre and types are their vehicle types.
+        Returns which tracks crossed a logging tripwire.
+        """
+        if self.period_start is None:
+            self.period_start = now
+        self.last_time = now
+        prev = np.asarray(prev, dtype=float).reshape(-1, 2)
+        curr = np.asarray(curr, dtype=float).reshape(-1, 2)
+        has_prev = np.asarray(has_prev, dtype=bool)
+        crossed = np.zeros(len(curr), dtype=bool)
+
+        if len(curr) and len(self.a):
+            side = segment_crossings(prev, curr, self.a, self.b) * has_prev[:, None]
+            crossed = (side[:, self.logging] != 0).any(axis=1)
+            new = ~has_prev
+            if new.any() and self.logging.any():
+                d = point_segment_distance(curr[new], self.a[self.logging], self.b[self.logging])
+                crossed[new] = (d < self.new_track_px).any(axis=1)
+            for i, k in zip(*np.nonzero(side)):
+                self._count(self.tripwire_names[k], FORWARD if side[i, k] > 0 else BACKWARD, types[i])
+
+        if self.polygons:
+            both = np.concatenate((prev, curr))
+            inside = np.stack([points_in_polygon(both, polygon) for polygon in self.polygons], axis=1)
+            before, after = inside[:len(prev)] & has_prev[:, None], inside[len(prev):]
+            self.occupancy = after.sum(axis=0)
+            for event, hits in ((ENTER, after & ~before & has_prev[:, None]), (EXIT, before & ~after)):
+                for i, k in zip(*np.nonzero(hits)):
+                    self._count(self.zone_names[k], event, types[i])
+
+        if now - self.period_start >= self.flush_s:
+            self.flush(now)
+        return crossed
+
+    def flush(self, now=None):
+        """Hands the counts since the last flush to the sink as (stream, zone, event, type, count, start, end)."""
+        now = self.last_time if now is None else now
+        if now is None:
+            return
+        if not self.counts:
+            # An empty period still ends here, so the next rows do not claim the quiet time before them
+            self.period_start = now
+            return
+        rows = [(self.stream, zone, event, v_type, n, self.period_start, now)
+                for (zone, event, v_type), n in sorted(self.counts.items())]
+        self.counts = {}
+        self.period_start = now
+        if self.sink is not None:
+            start = time.perf_counter()
+            self.sink(rows)
+            self.flush_ms.observe(1000 * (time.perf_counter() - start))
+
+    def status_line(self):
+        return "zones: " + ", ".join(f"{name} {n}" for name, n in self.totals.items())